@@ -0,0 +1,204 @@
+""" Logical-memory benchmark harness. Runs memory experiments over grids of (code, distance,
+physical error rate, rounds, shots) and reports logical error rates with confidence intervals
+alongside with wall-time, throughput and peak memory of every simulator and decoder. The memory
+circuit is built from `surface_code_detect` rounds, sampled under circuit-level noise by a simulator
+backend and decoded by a decoder backend, which are timed separately. Results are appended to a
+JSON-lines file so that regressions could be tracked over time.
+
+Usage: python -m qecsurface.bench --distances 3 5 --p 0.01 0.02 --rounds 3 --shots 10000
+"""
+import json
+import time
+import resource
+import argparse
+import numpy as np
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+from .type import *
+from .qeccs import surface_code, surface_code_detect, SurfaceCode
+from .decode import detector_graph, syndrome_array, detection_events, decode_mwpm, decode_uf
+from .noise import uniform_noise
+from .frame import sample_frames
+from .parallel import run_shots
+
+DECODERS = {'mwpm': decode_mwpm, 'uf': decode_uf}
+
+
+def _sample_pennylane(cc:CompiledCircuit, shots:int, seed:int|None) -> dict:
+  if cc.noise is not None:
+    raise ValueError("The pennylane simulator does not support noise, use p=0")
+  from .pennylane import to_pennylane_mcm
+  msms = to_pennylane_mcm(decompile_circuit(cc), shots=shots)()
+  return {l:np.asarray(v).reshape(shots) for l,v in msms.items()}
+
+
+# Simulators sampling a compiled circuit, `(cc, shots, seed) -> msms` with shot arrays as values
+SIMULATORS = {
+  'frame': lambda cc, shots, seed: sample_frames(cc, shots, seed).msms(),
+  'stabilizer': lambda cc, shots, seed: run_shots(cc, shots, 'stabilizer', 1, seed).msms(),
+  'pennylane': _sample_pennylane,
+}
+
+@dataclass
+class BenchResult:
+  """ Outcome of a single memory experiment. `sim_s` and `decode_s` are the times spent by the
+  simulator and by the decoder, `wall_s` is their sum. Building circuits and detector graphs is not
+  timed. """
+  code:str
+  d:int
+  p:float
+  rounds:int
+  shots:int
+  simulator:str
+  decoder:str
+  basis:str
+  failures:int
+  ler:float
+  ci_low:float
+  ci_high:float
+  sim_s:float
+  decode_s:float
+  wall_s:float
+  sim_shots_per_s:float
+  decode_shots_per_s:float
+  shots_per_s:float
+  peak_rss_mb:float
+  seed:int|None
+  timestamp:str
+
+
+def wilson_interval(k:int, n:int, z:float=1.96) -> tuple[float,float]:
+  """ Wilson score confidence interval of a binomial proportion `k/n`. """
+  if n == 0:
+    return (0.0, 1.0)
+  phat = k / n
+  den = 1 + z*z/n
+  mid = (phat + z*z/(2*n)) / den
+  half = z * np.sqrt(phat*(1-phat)/n + z*z/(4*n*n)) / den
+  return (max(0.0, mid - half), min(1.0, mid + half))
+
+
+def _checks(code:SurfaceCode, name:OpName) -> np.ndarray:
+  ops = [op for op in code.stabilizers if op.name == name]
+  h = np.zeros((len(ops), code.ndata), dtype=np.uint8)
+  for i, op in enumerate(ops):
+    h[i, list(op.qubits)] = 1
+  return h
+
+
+def memory_circuit(code:SurfaceCode, rounds:int,
+                   basis:OpName) -> tuple[FTOps[int],list[list[MeasureLabel]],list[MeasureLabel]]:
+  """ Build the `basis`-memory circuit: data qubits `0..ndata-1` are prepared in the `basis`
+  eigenstate, `rounds` hook-safe detection rounds run on separate syndrome qubits and the data
+  qubits are measured in the `basis`. Return the circuit, the labels of every round and the labels
+  of the data measurements. """
+  data, syndromes = code.qubits()
+  flip = [FTPrim(OpName.H, data)] if basis == OpName.X else []
+  ops, mls = list(flip), []
+  for r in range(rounds):
+    c, ml = surface_code_detect(code, data, syndromes, r, hook_safe=True)
+    ops.extend(iter_ops(c))
+    mls.append(ml)
+  final = [(rounds, basis, (q,)) for q in data]
+  ops.extend(flip)
+  ops.extend(FTMeasure(q, l) for q, l in zip(data, final))
+  return FTOps(ops), mls, final
+
+
+def sample_memory(code:SurfaceCode, p:float, rounds:int, shots:int, basis:OpName,
+                  simulator:str='frame', seed:int|None=None) -> tuple[np.ndarray,np.ndarray,float]:
+  """ Sample the `basis`-memory circuit under `uniform_noise(p)` with the `simulator`. Return the
+  `(shots, rounds+1, nstab)` detection events of the `basis`-type stabilizers (the last layer is
+  computed from the data measurements), the final `(shots, ndata)` data outcomes and the simulation
+  time in seconds. """
+  if simulator not in SIMULATORS:
+    raise ValueError(f"Unsupported simulator: {simulator}, expected one of {list(SIMULATORS)}")
+  c, mls, final = memory_circuit(code, rounds, basis)
+  cc = compile_circuit(c)
+  cc = uniform_noise(p).annotate(cc) if p > 0 else cc
+  start = time.perf_counter()
+  msms = SIMULATORS[simulator](cc, shots, seed)
+  elapsed = time.perf_counter() - start
+  # Stabilizers of the `basis` type are deterministic in the prepared state
+  synd = syndrome_array(msms, mls, basis)
+  data = np.stack([np.asarray(msms[l], dtype=np.uint8) for l in final], axis=-1)
+  last = (data.astype(np.int64) @ _checks(code, basis).T.astype(np.int64)) % 2
+  synd = np.concatenate([np.zeros_like(synd[:, :1]), synd, last[:, None].astype(np.uint8)],
+                        axis=1)
+  return detection_events(synd), data, elapsed
+
+
+def memory_experiment(code:SurfaceCode, p:float, rounds:int, shots:int, decoder:str,
+                      simulator:str='frame', basis:OpName=OpName.Z,
+                      seed:int|None=None) -> BenchResult:
+  """ Run a single memory experiment with the `simulator` and `decoder` backends. """
+  if decoder not in DECODERS:
+    raise ValueError(f"Unsupported decoder: {decoder}, expected one of {list(DECODERS)}")
+  graph = detector_graph(list(code.stabilizers), basis, rounds + 1)
+  events, final, sim = sample_memory(code, p, rounds, shots, basis, simulator, seed)
+  start = time.perf_counter()
+  corr = DECODERS[decoder](graph, events)
+  dec = time.perf_counter() - start
+  logical = list(code.logical_z if basis == OpName.Z else code.logical_x)
+  failures = int(((final ^ corr)[:, logical].sum(axis=1) % 2).sum())
+  lo, hi = wilson_interval(failures, shots)
+  def _rate(t):
+    return shots/t if t > 0 else float('inf')
+  return BenchResult(
+    code='rotated' if code.rotated else 'unrotated', d=code.d, p=p, rounds=rounds, shots=shots,
+    simulator=simulator, decoder=decoder, basis=opname2str(basis), failures=failures,
+    ler=failures/shots, ci_low=lo, ci_high=hi, sim_s=sim, decode_s=dec, wall_s=sim + dec,
+    sim_shots_per_s=_rate(sim), decode_shots_per_s=_rate(dec), shots_per_s=_rate(sim + dec),
+    peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, seed=seed,
+    timestamp=datetime.now(timezone.utc).isoformat())
+
+
+def run_grid(codes:list[str], distances:list[int], ps:list[float], rounds:list[int], shots:int,
+             decoders:list[str], simulators:list[str]|None=None, basis:OpName=OpName.Z,
+             seed:int|None=None, output:str|None=None) -> list[BenchResult]:
+  """ Run memory experiments over the grid of parameters and backends (the frame simulator by
+  default). Append results to the JSON-lines file `output` as they become available. Peak RSS is
+  the high-water mark of the process. """
+  simulators = ['frame'] if simulators is None else simulators
+  results = []
+  for code in codes:
+    for d in distances:
+      for p in ps:
+        for r in rounds:
+          for simulator in simulators:
+            for decoder in decoders:
+              res = memory_experiment(surface_code(d, rotated=(code == 'rotated')), p, r, shots,
+                                      decoder, simulator, basis, seed)
+              results.append(res)
+              if output is not None:
+                with open(output, 'a') as f:
+                  f.write(json.dumps(asdict(res)) + '\n')
+  return results
+
+
+def main(argv:list[str]|None=None) -> None:
+  ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  ap.add_argument('--codes', nargs='+', default=['rotated'], choices=['rotated', 'unrotated'])
+  ap.add_argument('--distances', nargs='+', type=int, default=[3, 5])
+  ap.add_argument('--p', nargs='+', type=float, default=[0.01])
+  ap.add_argument('--rounds', nargs='+', type=int, default=[3])
+  ap.add_argument('--shots', type=int, default=10000)
+  ap.add_argument('--decoders', nargs='+', default=['mwpm', 'uf'], choices=list(DECODERS))
+  ap.add_argument('--simulators', nargs='+', default=['frame'], choices=list(SIMULATORS))
+  ap.add_argument('--basis', default='Z', choices=['X', 'Z'])
+  ap.add_argument('--seed', type=int, default=None)
+  ap.add_argument('--output', default='bench.jsonl', help='JSON-lines file to append results to')
+  a = ap.parse_args(argv)
+  results = run_grid(a.codes, a.distances, a.p, a.rounds, a.shots, a.decoders, a.simulators,
+                     OpName.X if a.basis == 'X' else OpName.Z, a.seed, a.output)
+  print(f"{'code':>9} {'d':>3} {'p':>8} {'rounds':>6} {'sim':>10} {'decoder':>7} {'ler':>10} "
+        f"{'95% CI':>21} {'sim,sh/s':>10} {'dec,sh/s':>10} {'rss,MB':>8}")
+  for r in results:
+    print(f"{r.code:>9} {r.d:>3} {r.p:>8.4f} {r.rounds:>6} {r.simulator:>10} {r.decoder:>7} "
+          f"{r.ler:>10.2e} [{r.ci_low:.2e}, {r.ci_high:.2e}] {r.sim_shots_per_s:>10.0f} "
+          f"{r.decode_shots_per_s:>10.0f} {r.peak_rss_mb:>8.1f}")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,149 @@
+""" Fault-injection campaigns. Every spacetime location of a compiled circuit (the qubits touched by
+each row, including syndrome qubits, and the outcomes of measurements) receives every single fault
+type. Faults are propagated as independent Pauli frames along the reference execution of the
+stabilizer simulator, and the residual error on the data qubits is classified against the
+stabilizer group of the code. Chunks of faults are processed by a pool of forked workers and the
+resulting tables are cached per structural circuit key.
+"""
+import os
+import numpy as np
+from enum import IntEnum
+from dataclasses import dataclass
+
+from .type import *
+from .gf2 import GF2, check_matrix, commutation, in_rowspace
+from .verify import Fault, weight1_faults, fault_frames
+from .parallel import fork_map, worker_state
+
+
+class Outcome(IntEnum):
+  """ Effect of a fault at the end of the circuit. """
+  CORRECTED = 0  # The residual error is a stabilizer
+  DETECTED = 1   # The residual error anticommutes with some stabilizer
+  LOGICAL = 2    # The residual error is a non-trivial logical operator
+
+
+@dataclass
+class FaultTable[Q]:
+  """ Columnar table of classified faults. `qubit` holds indices into `qubits`, `kind` is the
+  `OpKind` of the row the fault follows and `flips` is the number of measurement outcomes the fault
+  changes. """
+  qubits:list[Q]
+  row:np.ndarray
+  qubit:np.ndarray
+  pauli:np.ndarray
+  kind:np.ndarray
+  flips:np.ndarray
+  outcome:np.ndarray
+
+  def __len__(self) -> int:
+    return len(self.row)
+
+  def _take(self, mask:np.ndarray) -> "FaultTable[Q]":
+    return FaultTable(self.qubits, self.row[mask], self.qubit[mask], self.pauli[mask],
+                      self.kind[mask], self.flips[mask], self.outcome[mask])
+
+  def select(self, outcome:Outcome|None=None, pauli:str|None=None, kind:OpKind|None=None,
+             qubits:list[Q]|None=None, rows:list[int]|None=None) -> "FaultTable[Q]":
+    """ Return the faults matching all the given criteria. `pauli` could list several types. """
+    mask = np.ones(len(self), dtype=bool)
+    if outcome is not None:
+      mask &= self.outcome == outcome
+    if pauli is not None:
+      mask &= np.isin(self.pauli, list(pauli))
+    if kind is not None:
+      mask &= self.kind == kind
+    if qubits is not None:
+      mask &= np.isin(self.qubit, [self.qubits.index(q) for q in qubits])
+    if rows is not None:
+      mask &= np.isin(self.row, rows)
+    return self._take(mask)
+
+  def counts(self) -> dict[Outcome,int]:
+    return {o:int((self.outcome == o).sum()) for o in Outcome}
+
+  def faults(self) -> list[Fault[Q]]:
+    return [Fault(int(r), self.qubits[q], str(p))
+            for r, q, p in zip(self.row, self.qubit, self.pauli)]
+
+
+def classify(x:np.ndarray, z:np.ndarray, h:GF2) -> np.ndarray:
+  """ Classify the residual errors given by the rows of `x` and `z` against the check matrix `h`.
+  """
+  v = GF2.from_dense(np.concatenate([x, z], axis=1))
+  out = np.full(len(v), Outcome.LOGICAL, dtype=np.uint8)
+  out[in_rowspace(h, v)] = Outcome.CORRECTED
+  out[commutation(v, h).any(axis=1)] = Outcome.DETECTED
+  return out
+
+# Parallel execution {{{
+
+def _run_chunk(k:int) -> tuple[np.ndarray,np.ndarray]:
+  """ Propagate and classify the chunk `k` of faults. """
+  cc, faults, h, cols, chunk = worker_state()
+  flips, x, z = fault_frames(cc, faults[k*chunk:(k+1)*chunk])
+  return flips.sum(axis=1, dtype=np.int64), classify(x[:, cols], z[:, cols], h)
+
+
+def _campaign[Q](cc:CompiledCircuit[Q], stabilizers:list[FTPrim[Q]], data:list[Q], paulis:str,
+                 samples:int|None, seed:int|None, workers:int|None,
+                 chunk:int) -> FaultTable[Q]:
+  faults = weight1_faults(cc, paulis=paulis)
+  if samples is not None and samples < len(faults):
+    pick = np.sort(np.random.default_rng(seed).choice(len(faults), samples, replace=False))
+    faults = [faults[i] for i in pick]
+  h, _ = check_matrix(stabilizers, data)
+  cols = [cc.qubits.index(q) for q in data]
+  workers = os.cpu_count() if workers is None else workers
+  nchunks = (len(faults) + chunk - 1) // chunk
+  results = fork_map(_run_chunk, nchunks, workers, (cc, faults, h, cols, chunk))
+  index = {q:i for i,q in enumerate(cc.qubits)}
+  rows = np.array([f.row for f in faults], dtype=np.int64)
+  return FaultTable(
+    qubits=list(cc.qubits),
+    row=rows,
+    qubit=np.array([index[f.qubit] for f in faults], dtype=np.int64),
+    pauli=np.array([f.pauli for f in faults], dtype='<U1'),
+    kind=cc.kind[rows].astype(np.uint8),
+    flips=np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int64),
+    outcome=np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.uint8),
+  )
+
+# }}}
+
+_CAMPAIGNS = LRUCache(32)
+
+
+def run_campaign[Q](c:FTCircuit[Q]|CompiledCircuit[Q], stabilizers:list[FTPrim[Q]],
+                    data:list[Q], paulis:str='XYZM', samples:int|None=None, seed:int|None=0,
+                    workers:int|None=None, chunk:int=2**12) -> FaultTable[Q]:
+  """ Inject every single fault of the types `paulis` (see `Fault`) at every location of the
+  circuit `c`, or `samples` faults drawn uniformly from them, and classify the residual errors on
+  the `data` qubits against the `stabilizers`. Chunks of `chunk` faults run on `workers` processes
+  (all CPUs by default). Results are cached by the circuit structure and the arguments, except for
+  unseeded samples. The returned table is shared and should not be modified. """
+  ft = decompile_circuit(c) if isinstance(c, CompiledCircuit) else c
+  cc = c if isinstance(c, CompiledCircuit) else compile_circuit(c)
+  def _make():
+    return _campaign(cc, stabilizers, data, paulis, samples, seed, workers, chunk)
+  if samples is not None and seed is None:
+    # Every call draws a new subsample
+    _CAMPAIGNS.misses += 1
+    return _make()
+  try:
+    key = (circuit_key(ft), tuple(op_key(s) for s in stabilizers), tuple(data), paulis, samples,
+           seed, tuple(cc.qubits))
+  except Unhashable:
+    _CAMPAIGNS.misses += 1
+    return _make()
+  return _CAMPAIGNS.get(key, _make)
+
+
+def cache_info() -> CacheInfo:
+  """ Return the statistics of the campaign cache. """
+  return _CAMPAIGNS.info()
+
+
+def cache_clear() -> None:
+  """ Drop the cached tables and reset the statistics. """
+  _CAMPAIGNS.clear()
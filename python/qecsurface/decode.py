@@ -0,0 +1,383 @@
+""" Decoders of CSS stabilizer codes defined by the lists of X and Z stabilizers, such as
+`surface25_stabilizers`. Syndromes are measured in layers as done by `surface25u_detect` and the
+`Surface25u` mapper. Detection events (differences between consecutive layers) are the nodes of a
+space-time detector graph where space edges correspond to data-qubit errors and time edges
+correspond to measurement errors.
+"""
+import numpy as np
+import networkx as nx
+from functools import lru_cache
+from dataclasses import dataclass, field
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+
+from .type import *
+
+# Detector graph {{{
+
+@dataclass
+class DetectorGraph:
+  """ Space-time detector graph of `rounds` rounds of `name`-type stabilizers. The node
+  `t*nstab+s` is the detection event of the stabilizer `s` in the round `t`, the node `nnodes-1` is
+  the boundary. Edge `e` connects nodes `edges[e]` and flips the data qubit `qubit[e]` (or -1 for
+  time edges). `dist` and `pred` hold all-pairs shortest path lengths and predecessors, `incident`
+  lists edges incident to every node and `ends` holds the edges as pairs of Python ints. """
+  name:OpName
+  nstab:int
+  ndata:int
+  rounds:int
+  edges:np.ndarray
+  qubit:np.ndarray
+  dist:np.ndarray
+  pred:np.ndarray
+  eindex:dict[tuple[int,int],int]
+  incident:list[list[int]]
+  ends:list[tuple[int,int]]
+
+  @property
+  def nnodes(self) -> int:
+    return self.rounds * self.nstab + 1
+
+  @property
+  def boundary(self) -> int:
+    return self.nnodes - 1
+
+  def edge_round(self, e:int) -> int:
+    """ Return the round of the edge `e`, time edges belong to the earlier round. """
+    return int(self.edges[e, 0]) // self.nstab
+
+  def edges_qubits(self, edges:list[int]) -> np.ndarray:
+    """ Return the data-qubit mask flipped by the `edges`. """
+    corr = np.zeros(self.ndata, dtype=np.uint8)
+    for e in edges:
+      if self.qubit[e] >= 0:
+        corr[self.qubit[e]] ^= 1
+    return corr
+
+  def path_qubits(self, u:int, v:int) -> list[int]:
+    """ Return data qubits flipped along the shortest path between nodes `u` and `v`. """
+    acc = []
+    while v != u:
+      p = self.pred[u, v]
+      q = self.qubit[self.eindex[(min(p, v), max(p, v))]]
+      if q >= 0:
+        acc.append(q)
+      v = p
+    return acc
+
+
+@lru_cache(maxsize=32)
+def _detector_graph(stabs:tuple[tuple[OpName,tuple[int,...]],...], name:OpName,
+                    rounds:int) -> DetectorGraph:
+  ndata = max(q for _, qubits in stabs for q in qubits) + 1
+  checks = [qubits for n, qubits in stabs if n == name]
+  nstab = len(checks)
+  nnodes = rounds * nstab + 1
+  boundary = nnodes - 1
+  owners = [[] for _ in range(ndata)]
+  for s, qubits in enumerate(checks):
+    for q in qubits:
+      owners[q].append(s)
+  eindex = {}
+  edges, qubit = [], []
+  def _edge(u, v, q):
+    key = (min(u, v), max(u, v))
+    if key not in eindex:
+      eindex[key] = len(edges)
+      edges.append(key)
+      qubit.append(q)
+  for t in range(rounds):
+    for q, ss in enumerate(owners):
+      if len(ss) == 1:
+        _edge(t*nstab + ss[0], boundary, q)
+      elif len(ss) == 2:
+        _edge(t*nstab + ss[0], t*nstab + ss[1], q)
+      elif len(ss) > 2:
+        raise ValueError(f"Data qubit {q} is checked by more than two {name} stabilizers")
+    if t + 1 < rounds:
+      for s in range(nstab):
+        _edge(t*nstab + s, (t+1)*nstab + s, -1)
+  edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+  adj = coo_matrix((np.ones(len(edges)), (edges[:,0], edges[:,1])), shape=(nnodes, nnodes))
+  dist, pred = shortest_path(adj.tocsr(), directed=False, unweighted=True,
+                             return_predecessors=True)
+  incident = [[] for _ in range(nnodes)]
+  ends = [tuple(uv) for uv in edges.tolist()]
+  for e, (u, v) in enumerate(ends):
+    incident[u].append(e)
+    incident[v].append(e)
+  return DetectorGraph(name, nstab, ndata, rounds, edges, np.array(qubit, dtype=np.int32),
+                       dist, pred, eindex, incident, ends)
+
+
+def detector_graph(stabilizers:list[FTPrim[int]], name:OpName, rounds:int=1) -> DetectorGraph:
+  """ Build (or fetch from the cache) the detector graph of `name`-type `stabilizers` measured for
+  `rounds` rounds of detection events. Stabilizer qubit labels are interpreted as data qubit
+  indices. """
+  stabs = tuple((op.name, tuple(op.qubits)) for op in stabilizers)
+  return _detector_graph(stabs, name, rounds)
+
+# }}}
+
+# Syndromes {{{
+
+def syndrome_array(msms:dict[MeasureLabel,int], mls:list[list[MeasureLabel]],
+                   name:OpName) -> np.ndarray:
+  """ Collect `name`-type syndromes of the measurement layers `mls` (as yielded by
+  `map_circuit_iter` or returned by `surface25u_detect`) into an array of shape
+  `(..., len(mls), nstab)`. Values of `msms` could be numbers or NumPy shot arrays. """
+  layers = [np.stack([np.asarray(msms[l], dtype=np.uint8) for l in ls if l[1] == name], axis=-1)
+            for ls in mls]
+  return np.stack(layers, axis=-2)
+
+
+def detection_events(syndromes:np.ndarray) -> np.ndarray:
+  """ Return the differences between consecutive syndrome layers. """
+  return syndromes[..., 1:, :] ^ syndromes[..., :-1, :]
+
+# }}}
+
+# Minimum-weight perfect matching {{{
+
+def _match_small(dist:np.ndarray, bdist:np.ndarray) -> list[tuple[int,int]]:
+  """ Exact minimum-weight matching of a few defects by dynamic programming over subsets. Defects
+  could be matched pairwise (`dist`) or to the boundary (`bdist`). Pairs `(i, -1)` denote boundary
+  matches. """
+  k = len(bdist)
+  best = {0: (0.0, None)}
+  for mask in range(1, 1 << k):
+    i = (mask & -mask).bit_length() - 1
+    rest = mask & ~(1 << i)
+    cand = (best[rest][0] + bdist[i], (i, -1, rest))
+    for j in range(i + 1, k):
+      if rest & (1 << j):
+        r = rest & ~(1 << j)
+        w = best[r][0] + dist[i, j]
+        if w < cand[0]:
+          cand = (w, (i, j, r))
+    best[mask] = cand
+  pairs, mask = [], (1 << k) - 1
+  while mask:
+    i, j, mask = best[mask][1]
+    pairs.append((i, j))
+  return pairs
+
+
+def _match_blossom(dist:np.ndarray, bdist:np.ndarray) -> list[tuple[int,int]]:
+  """ Minimum-weight matching of defects using the blossom algorithm. Every defect gets a private
+  boundary copy, boundary copies are connected with zero-weight edges. """
+  k = len(bdist)
+  g = nx.Graph()
+  for i in range(k):
+    g.add_edge(i, k + i, weight=float(bdist[i]))
+    for j in range(i + 1, k):
+      g.add_edge(i, j, weight=float(dist[i, j]))
+      g.add_edge(k + i, k + j, weight=0.0)
+  pairs = []
+  for a, b in nx.min_weight_matching(g):
+    a, b = min(a, b), max(a, b)
+    if a < k:
+      pairs.append((a, b if b < k else -1))
+  return pairs
+
+
+def mwpm_correction(graph:DetectorGraph, events:np.ndarray, small:int=10) -> np.ndarray:
+  """ Decode a single shot of `(rounds, nstab)` detection events. Return the data-qubit correction
+  mask. Up to `small` defects are matched exactly by dynamic programming, larger sets are matched
+  with the blossom algorithm. """
+  defects = np.flatnonzero(events.reshape(-1))
+  dist = graph.dist[np.ix_(defects, defects)]
+  bdist = graph.dist[defects, graph.boundary]
+  pairs = (_match_small if len(defects) <= small else _match_blossom)(dist, bdist)
+  corr = np.zeros(graph.ndata, dtype=np.uint8)
+  for i, j in pairs:
+    for q in graph.path_qubits(defects[i], graph.boundary if j < 0 else defects[j]):
+      corr[q] ^= 1
+  return corr
+
+
+def _decode_batch(graph:DetectorGraph, events:np.ndarray, decode_one) -> np.ndarray:
+  shots = events.shape[0]
+  assert events.shape[1:] == (graph.rounds, graph.nstab), \
+    f"Expected events of shape (shots, {graph.rounds}, {graph.nstab}), got {events.shape}"
+  flat = np.packbits(events.reshape(shots, -1), axis=1)
+  uniq, inverse = np.unique(flat, axis=0, return_inverse=True)
+  nbits = graph.rounds * graph.nstab
+  corr = np.stack([
+    decode_one(graph, np.unpackbits(u, count=nbits).reshape(graph.rounds, graph.nstab))
+    for u in uniq
+  ]) if len(uniq) > 0 else np.zeros((0, graph.ndata), dtype=np.uint8)
+  return corr[inverse.reshape(-1)]
+
+
+def decode_mwpm(graph:DetectorGraph, events:np.ndarray) -> np.ndarray:
+  """ Decode a batch of `(shots, rounds, nstab)` detection events. Return the `(shots, ndata)`
+  correction masks. Identical syndromes are decoded once. """
+  return _decode_batch(graph, events, mwpm_correction)
+
+# }}}
+
+# Union-find {{{
+
+def uf_edges(graph:DetectorGraph, events:np.ndarray) -> list[int]:
+  """ Decode a single shot of `(rounds, nstab)` detection events with the union-find decoder of
+  Delfosse and Nickerson [1]. Return the list of correction edges. Only the nodes reached by the
+  clusters are visited and every cluster grows from its boundary list of nodes with ungrown edges.
+
+  [1] - https://arxiv.org/abs/1709.06218
+  """
+  b, ends, incident = graph.boundary, graph.ends, graph.incident
+  defect = set(np.flatnonzero(events.reshape(-1)).tolist())
+  # Per-cluster state of the touched nodes, other nodes are implicit singleton clusters
+  parent, size, parity, border, frontier = {}, {}, {}, {}, {}
+  support = {}
+
+  def _find(v):
+    root = v
+    while parent.get(root, root) != root:
+      root = parent[root]
+    while parent.get(v, v) != root:
+      parent[v], v = root, parent[v]
+    return root
+
+  def _cluster(v):
+    if v not in parent:
+      parent[v], size[v], parity[v] = v, 1, int(v in defect)
+      border[v], frontier[v] = v == b, [v]
+
+  def _union(a, c):
+    _cluster(a)
+    _cluster(c)
+    a, c = _find(a), _find(c)
+    if a == c:
+      return
+    if size[a] < size[c]:
+      a, c = c, a
+    parent[c] = a
+    size[a] += size.pop(c)
+    parity[a] ^= parity.pop(c)
+    border[a] |= border.pop(c)
+    frontier[a].extend(frontier.pop(c))
+
+  def _open(v):
+    return any(support.get(e, 0) < 2 for e in incident[v])
+
+  # Grow odd clusters by half-edges until every cluster is even or touches the boundary
+  for v in defect:
+    _cluster(v)
+  active = [v for v in defect if not border[v]]
+  while active:
+    fused = []
+    for r in active:
+      frontier[r] = [v for v in frontier[r] if _open(v)]
+      for v in frontier[r]:
+        for e in incident[v]:
+          s = support.get(e, 0)
+          if s < 2:
+            support[e] = s + 1
+            if s == 1:
+              fused.append(e)
+    if not any(frontier[r] for r in active):
+      raise ValueError(f"Detection events could not be neutralized: {events}")
+    for e in fused:
+      _union(*ends[e])
+    active = list({r for r in map(_find, active) if parity[r] and not border[r]})
+
+  # Peel the spanning forest of grown edges, starting from the boundary
+  adj = {}
+  for e, s in sorted(support.items()):
+    if s == 2:
+      u, v = ends[e]
+      adj.setdefault(u, []).append((e, v))
+      adj.setdefault(v, []).append((e, u))
+  seen = set()
+  order, pedge = [], {}
+  for root in [b, *sorted(adj)]:
+    if root in seen or root not in adj:
+      continue
+    seen.add(root)
+    stack = [root]
+    while stack:
+      v = stack.pop()
+      order.append(v)
+      for e, w in adj[v]:
+        if w not in seen:
+          seen.add(w)
+          pedge[w] = (e, v)
+          stack.append(w)
+  corr = []
+  for v in reversed(order):
+    if v in pedge and v in defect:
+      e, u = pedge[v]
+      corr.append(e)
+      defect.remove(v)
+      defect ^= {u}
+  return corr
+
+
+def uf_correction(graph:DetectorGraph, events:np.ndarray) -> np.ndarray:
+  """ Decode a single shot of `(rounds, nstab)` detection events with the union-find decoder.
+  Return the data-qubit correction mask. """
+  return graph.edges_qubits(uf_edges(graph, events))
+
+
+def decode_uf(graph:DetectorGraph, events:np.ndarray) -> np.ndarray:
+  """ Decode a batch of `(shots, rounds, nstab)` detection events with the union-find decoder.
+  Return the `(shots, ndata)` correction masks. """
+  return _decode_batch(graph, events, uf_correction)
+
+
+@dataclass
+class StreamingDecoder:
+  """ Sliding-window union-find decoder consuming syndrome layers round by round. Each window of
+  `window` rounds of detection events is decoded, corrections of the oldest `commit` rounds are
+  committed and the rest of the window is carried over. Time edges leaving the committed region
+  flip the corresponding detection events of the carried rounds. Memory is bounded by the window
+  size. Layer values could be numbers or NumPy shot arrays. """
+  stabilizers:list[FTPrim[int]]
+  name:OpName
+  window:int = 4
+  commit:int = 1
+  _prev:np.ndarray|None = field(default=None, init=False)
+  _buffer:list[np.ndarray] = field(default_factory=list, init=False)
+  _correction:np.ndarray|None = field(default=None, init=False)
+
+  def push(self, msms:dict[MeasureLabel,int], labels:list[MeasureLabel]) -> None:
+    """ Consume a syndrome layer described by measurement `labels` (as returned by
+    `surface25u_detect` or `surface20u_detect`). The first layer is the reference. """
+    layer = syndrome_array(msms, [labels], self.name)[..., 0, :]
+    layer = layer.reshape(-1, layer.shape[-1])
+    if self._prev is None:
+      self._prev = layer
+      ndata = detector_graph(self.stabilizers, self.name, 1).ndata
+      self._correction = np.zeros((layer.shape[0], ndata), dtype=np.uint8)
+      return
+    self._buffer.append(layer ^ self._prev)
+    self._prev = layer
+    if len(self._buffer) >= self.window:
+      self._decode(self.commit)
+
+  def _decode(self, commit:int) -> None:
+    rounds = len(self._buffer)
+    graph = detector_graph(self.stabilizers, self.name, rounds)
+    events = np.stack(self._buffer, axis=1)
+    for shot in range(events.shape[0]):
+      for e in uf_edges(graph, events[shot]):
+        t = graph.edge_round(e)
+        if t >= commit:
+          continue
+        q = graph.qubit[e]
+        if q >= 0:
+          self._correction[shot, q] ^= 1
+        elif t == commit - 1:
+          s = int(graph.edges[e, 1]) % graph.nstab
+          self._buffer[commit][shot, s] ^= 1
+    del self._buffer[:commit]
+
+  def flush(self) -> np.ndarray:
+    """ Decode the remaining rounds. Return the `(shots, ndata)` accumulated correction masks. """
+    if self._buffer:
+      self._decode(len(self._buffer))
+    return self._correction
+
+# }}}
@@ -0,0 +1,198 @@
+""" Linear algebra over GF(2) with bit-packed storage. Rows of a matrix are packed into `uint64`
+words (little bit order), so row operations cost a few vectorized word operations. Pauli operators
+and stabilizers are represented by the binary symplectic vectors `[x|z]` in the layout of
+`qecsurface.sympy.build_check_matrix`.
+"""
+import numpy as np
+from dataclasses import dataclass
+
+from .type import *
+
+# Bit-packed matrices {{{
+
+@dataclass
+class GF2:
+  """ A bit-packed `(m, ncols)` matrix over GF(2). Bit `j` of the row `i` is the bit `j % 64` of
+  `words[i, j // 64]`. Padding bits are zero. """
+  words:np.ndarray
+  ncols:int
+
+  @staticmethod
+  def zeros(m:int, ncols:int) -> "GF2":
+    return GF2(np.zeros((m, (ncols + 63) // 64), dtype=np.uint64), ncols)
+
+  @staticmethod
+  def from_dense(bits:np.ndarray) -> "GF2":
+    bits = np.atleast_2d(np.asarray(bits, dtype=np.uint8) & 1)
+    m, n = bits.shape
+    packed = np.packbits(bits, axis=1, bitorder='little')
+    out = np.zeros((m, ((n + 63) // 64) * 8), dtype=np.uint8)
+    out[:, :packed.shape[1]] = packed
+    return GF2(out.view(np.uint64).reshape(m, (n + 63) // 64), n)
+
+  def to_dense(self) -> np.ndarray:
+    b = self.words.view(np.uint8).reshape(len(self), 8 * self.words.shape[1])
+    return np.unpackbits(b, axis=1, count=self.ncols, bitorder='little')
+
+  @property
+  def shape(self) -> tuple[int,int]:
+    return (len(self), self.ncols)
+
+  def __len__(self) -> int:
+    return self.words.shape[0]
+
+  def __getitem__(self, rows) -> "GF2":
+    return GF2(np.atleast_2d(self.words[rows]), self.ncols)
+
+  def column(self, j:int) -> np.ndarray:
+    """ Return the column `j` as a `uint8` vector. """
+    return ((self.words[:, j // 64] >> np.uint64(j % 64)) & np.uint64(1)).astype(np.uint8)
+
+  def vstack(self, other:"GF2") -> "GF2":
+    assert self.ncols == other.ncols, f"Column mismatch: {self.ncols} != {other.ncols}"
+    return GF2(np.concatenate([self.words, other.words]), self.ncols)
+
+  def dot(self, other:"GF2") -> np.ndarray:
+    """ Return the `(len(self), len(other))` matrix of GF(2) inner products of the rows. """
+    assert self.ncols == other.ncols, f"Column mismatch: {self.ncols} != {other.ncols}"
+    return _packed_dot(self, other)
+
+  def rref(self) -> tuple["GF2",list[int]]:
+    """ Return the reduced row echelon form (without zero rows) and the pivot columns. """
+    w = self.words.copy()
+    pivots, r = [], 0
+    for j in range(self.ncols):
+      if r == len(w):
+        break
+      word, bit = j // 64, np.uint64(1 << (j % 64))
+      col = (w[:, word] & bit) != 0
+      p = r + int(np.argmax(col[r:]))
+      if not col[p]:
+        continue
+      if p != r:
+        w[[r, p]] = w[[p, r]]
+        col[[r, p]] = col[[p, r]]
+      col[r] = False
+      w[col] ^= w[r]
+      pivots.append(j)
+      r += 1
+    return GF2(w[:r], self.ncols), pivots
+
+  def rank(self) -> int:
+    return len(self.rref()[1])
+
+  def nullspace(self) -> "GF2":
+    """ Return a basis of the vectors `v` such that `self.dot(v) == 0`. """
+    return _nullspace(*self.rref())
+
+
+def _parity(w:np.ndarray) -> np.ndarray:
+  """ Return the parities of the bits of the `uint64` words `w`. """
+  for k in (32, 16, 8, 4, 2, 1):
+    w = w ^ (w >> np.uint64(k))
+  return (w & np.uint64(1)).astype(np.uint8)
+
+
+def _packed_dot(a:GF2, b:GF2, chunk:int=2**22) -> np.ndarray:
+  """ GF(2) inner products of the rows of `a` and `b` computed on the packed words: the parity of
+  `popcount(u & v)` is the parity of the XOR of the words of `u & v`. Rows of `a` are processed in
+  chunks of about `chunk` words. """
+  out = np.zeros((len(a), len(b)), dtype=np.uint8)
+  step = max(1, chunk // max(1, len(b) * a.words.shape[1]))
+  for i in range(0, len(a), step):
+    w = a.words[i:i+step, None, :] & b.words[None, :, :]
+    out[i:i+step] = _parity(np.bitwise_xor.reduce(w, axis=2))
+  return out
+
+
+def _nullspace(r:GF2, pivots:list[int]) -> GF2:
+  pset = set(pivots)
+  free = [j for j in range(r.ncols) if j not in pset]
+  basis = np.zeros((len(free), r.ncols), dtype=np.uint8)
+  basis[np.arange(len(free)), free] = 1
+  basis[:, pivots] = r.to_dense()[:, free].T
+  return GF2.from_dense(basis)
+
+
+def _reduce(r:GF2, pivots:list[int], v:GF2) -> GF2:
+  """ Reduce the rows of `v` modulo the row space of the reduced row echelon form `r`. """
+  w = v.words.copy()
+  for row, j in zip(r.words, pivots):
+    hits = ((w[:, j // 64] >> np.uint64(j % 64)) & np.uint64(1)).astype(bool)
+    w[hits] ^= row
+  return GF2(w, v.ncols)
+
+# }}}
+
+# Paulis and stabilizers {{{
+
+def check_matrix[Q](stabilizers:list[FTPrim[Q]],
+                    qubits:list[Q]|None=None) -> tuple[GF2,list[Q]]:
+  """ Build the bit-packed check matrix of the X- and Z-type `stabilizers`. Columns `[0, n)` hold
+  the X part and columns `[n, 2n)` hold the Z part, `n` being the number of `qubits`, which default
+  to the sorted labels of the stabilizers. """
+  qubits = sorted({q for op in stabilizers for q in op.qubits}) if qubits is None else list(qubits)
+  index = {q:i for i,q in enumerate(qubits)}
+  n = len(qubits)
+  bits = np.zeros((len(stabilizers), 2*n), dtype=np.uint8)
+  for i, op in enumerate(stabilizers):
+    if op.name == OpName.X:
+      off = 0
+    elif op.name == OpName.Z:
+      off = n
+    else:
+      raise ValueError(f"Expected X or Z stabilizer, got {op}")
+    bits[i, [off + index[q] for q in op.qubits]] = 1
+  return GF2.from_dense(bits), qubits
+
+
+def _swap(m:GF2) -> GF2:
+  """ Swap the X and Z halves of symplectic vectors. """
+  n = m.ncols // 2
+  d = m.to_dense()
+  return GF2.from_dense(np.concatenate([d[:, n:], d[:, :n]], axis=1))
+
+
+def commutation(a:GF2, b:GF2) -> np.ndarray:
+  """ Return the matrix of symplectic products of the rows of `a` and `b`: zero entries mark
+  commuting Pauli operators. """
+  return a.dot(_swap(b))
+
+
+def commutes(a:GF2, b:GF2) -> bool:
+  """ Check that every row of `a` commutes with every row of `b`. """
+  return not _packed_dot(a, _swap(b)).any()
+
+
+def in_rowspace(h:GF2, v:GF2) -> np.ndarray:
+  """ Check the membership of every row of `v` in the row space of `h`, e.g. the membership of
+  Pauli operators in the stabilizer group (up to a sign). """
+  r, pivots = h.rref()
+  return ~_reduce(r, pivots, v).words.any(axis=1)
+
+
+def logical_operators(h:GF2) -> tuple[GF2,GF2]:
+  """ Find the logical operators of the stabilizer code with the check matrix `h`. Return the
+  `(k, 2n)` matrices of the logical X and Z operators, paired so that `lx[i]` anticommutes with
+  `lz[j]` iff `i == j`. """
+  r, pivots = h.rref()
+  # Representatives of the centralizer modulo the stabilizer group
+  cands = list(_reduce(r, pivots, _swap(_nullspace(r, pivots))).rref()[0].words)
+  ncols = h.ncols
+  def _symp(u, v):
+    return commutation(GF2(u[None], ncols), GF2(v[None], ncols))[0, 0]
+  lx, lz = [], []
+  while cands:
+    a = cands.pop(0)
+    j = next((j for j, v in enumerate(cands) if _symp(a, v)), None)
+    if j is None:
+      raise ValueError("Logical operators could not be paired")
+    b = cands.pop(j)
+    cands = [c ^ (a if _symp(c, b) else 0) ^ (b if _symp(c, a) else 0) for c in cands]
+    lx.append(a)
+    lz.append(b)
+  def _stack(vs):
+    return GF2(np.array(vs, dtype=np.uint64).reshape(len(vs), h.words.shape[1]), ncols)
+  return _stack(lx), _stack(lz)
+
+# }}}
@@ -0,0 +1,181 @@
+""" Stochastic Pauli noise models. A `NoiseModel` annotates a compiled circuit with probabilities of
+depolarizing, bit-flip, phase-flip and measurement-flip channels which act after the operations.
+Probabilities are stored per target qubit of every row, so no per-error operations are added to the
+circuit. The simulators sample all the noise of a shot batch at once using `sample_noise`.
+"""
+import numpy as np
+from enum import IntEnum
+from dataclasses import dataclass, field, replace
+
+from .type import *
+
+# Noise models {{{
+
+@dataclass(frozen=True)
+class Channel:
+  """ Probabilities of Pauli channels applied after an operation. Depolarizing noise of `FTCtrl` is
+  the two-qubit depolarizing channel acting on the control and the target. Bit- and phase-flips act
+  on every qubit of the operation. The `measure` flip only affects the recorded outcomes of
+  `FTMeasure`, the other channels of `FTMeasure` act on the qubit after the reset. """
+  depolarize:float = 0.0
+  bitflip:float = 0.0
+  phaseflip:float = 0.0
+  measure:float = 0.0
+
+NOISELESS = Channel()
+
+
+@dataclass
+class NoiseTable:
+  """ Channel probabilities of a compiled circuit, aligned with its `targets` column: the entry `s`
+  describes the noise acting after the row `i` with `tptr[i] <= s < tptr[i+1]` on the target
+  `targets[s]`. Noise of conditional operations is applied regardless of the condition. """
+  depolarize:np.ndarray
+  bitflip:np.ndarray
+  phaseflip:np.ndarray
+  measure:np.ndarray
+
+
+@dataclass
+class NoiseModel[Q]:
+  """ Noise model defined per kind of operation, `kinds`, with per-qubit overrides, `qubits`, which
+  are looked up by the operation kind and the target qubit. """
+  kinds:dict[OpKind,Channel] = field(default_factory=dict)
+  qubits:dict[tuple[OpKind,Q],Channel] = field(default_factory=dict)
+
+  def channel(self, kind:OpKind, qubit:Q) -> Channel:
+    """ Return the channel acting after the operation of `kind` on the target `qubit`. """
+    return self.qubits.get((kind, qubit), self.kinds.get(kind, NOISELESS))
+
+  def annotate(self, c:FTCircuit[Q]|CompiledCircuit[Q]) -> CompiledCircuit[Q]:
+    """ Return the compiled circuit `c` with the noise table attached. """
+    cc = c if isinstance(c, CompiledCircuit) else compile_circuit(c)
+    ntargets = len(cc.targets)
+    table = NoiseTable(*[np.zeros(ntargets, dtype=np.float64) for _ in range(4)])
+    for i in range(len(cc)):
+      kind = OpKind(cc.kind[i])
+      for s in range(cc.tptr[i], cc.tptr[i+1]):
+        ch = self.channel(kind, cc.qubits[cc.targets[s]])
+        table.depolarize[s] = ch.depolarize
+        table.bitflip[s] = ch.bitflip
+        table.phaseflip[s] = ch.phaseflip
+        table.measure[s] = ch.measure if kind == OpKind.MEASURE else 0.0
+    return replace(cc, noise=table)
+
+
+def uniform_noise(p:float) -> NoiseModel:
+  """ Standard circuit-level noise of strength `p`: depolarizing noise after single- and two-qubit
+  gates, bit-flips after initializations and resets, and measurement flips. """
+  gate = Channel(depolarize=p)
+  return NoiseModel({
+    OpKind.PRIM: gate,
+    OpKind.CTRL: gate,
+    OpKind.INIT: Channel(bitflip=p),
+    OpKind.MEASURE: Channel(bitflip=p, measure=p),
+  })
+
+# }}}
+
+# Sampling {{{
+
+class Effect(IntEnum):
+  """ Components of the sampled noise. """
+  X = 0
+  Z = 1
+  MEASURE = 2
+
+
+@dataclass
+class NoiseEvents:
+  """ Sampled noise of a shot batch, sorted by row. Events `ptr[i]:ptr[i+1]` act after the row `i`.
+  Event `e` applies the `effect[e]` to the qubit index (or the label index for
+  `Effect.MEASURE`) `index[e]` of the shot `shot[e]`. """
+  ptr:np.ndarray
+  effect:np.ndarray
+  index:np.ndarray
+  shot:np.ndarray
+
+  def row(self, i:int) -> slice:
+    return slice(self.ptr[i], self.ptr[i+1])
+
+
+def _sources[Q](cc:CompiledCircuit[Q]) -> tuple[np.ndarray,...]:
+  """ Expand the noise table of `cc` into independent sources and their effects. A source fires
+  with probability `p` and then picks one of its `npauli` non-trivial outcomes `code` uniformly. The
+  effect `e` of the source `src[e]` happens if the bit `bit[e]` of the code is set. """
+  t = cc.noise
+  p, npauli, erow, esrc, ebit, eeff, eidx = [], [], [], [], [], [], []
+  def _source(prob, n, i, effects):
+    if prob <= 0:
+      return
+    for b, (eff, idx) in enumerate(effects):
+      erow.append(i); esrc.append(len(p)); ebit.append(b); eeff.append(eff); eidx.append(idx)
+    p.append(prob); npauli.append(n)
+  for i in range(len(cc)):
+    kind, ctrl = cc.kind[i], cc.control[i]
+    for s in range(cc.tptr[i], cc.tptr[i+1]):
+      q = cc.targets[s]
+      qs = [ctrl, q] if kind == OpKind.CTRL else [q]
+      if kind == OpKind.CTRL:
+        _source(t.depolarize[s], 15, i, [(Effect.X, ctrl), (Effect.Z, ctrl),
+                                         (Effect.X, q), (Effect.Z, q)])
+      else:
+        _source(t.depolarize[s], 3, i, [(Effect.X, q), (Effect.Z, q)])
+      for a in qs:
+        _source(t.bitflip[s], 1, i, [(Effect.X, a)])
+        _source(t.phaseflip[s], 1, i, [(Effect.Z, a)])
+      _source(t.measure[s], 1, i, [(Effect.MEASURE, cc.label[i])])
+  return (np.array(p, dtype=np.float64), np.array(npauli, dtype=np.int64),
+          np.array(erow, dtype=np.int64), np.array(esrc, dtype=np.int64),
+          np.array(ebit, dtype=np.int64), np.array(eeff, dtype=np.uint8),
+          np.array(eidx, dtype=np.int64))
+
+
+def _bernoulli(n:int, p:float, rng:np.random.Generator) -> np.ndarray:
+  """ Return the sorted positions of successes among `n` Bernoulli trials with probability `p`,
+  using geometric skipping. """
+  if p >= 1:
+    return np.arange(n)
+  out, pos = [], -1
+  while True:
+    mean = (n - pos) * p
+    gaps = rng.geometric(p, size=int(mean + 6*np.sqrt(mean) + 16))
+    hits = pos + np.cumsum(gaps)
+    out.append(hits[hits < n])
+    if hits[-1] >= n:
+      return np.concatenate(out)
+    pos = hits[-1]
+
+
+def sample_noise[Q](cc:CompiledCircuit[Q], shots:int, rng:np.random.Generator) -> NoiseEvents:
+  """ Sample the noise of `shots` executions of the annotated circuit `cc`. Sources of equal
+  probability are sampled together as one Bernoulli process over all sources and shots. """
+  p, npauli, erow, esrc, ebit, eeff, eidx = _sources(cc)
+  srcs, shts = [], []
+  for pu in np.unique(p):
+    group = np.flatnonzero(p == pu)
+    pos = _bernoulli(len(group) * shots, pu, rng)
+    srcs.append(group[pos // shots])
+    shts.append(pos % shots)
+  src = np.concatenate(srcs) if srcs else np.zeros(0, dtype=np.int64)
+  shot = np.concatenate(shts) if shts else np.zeros(0, dtype=np.int64)
+  code = 1 + (rng.random(len(src)) * npauli[src]).astype(np.int64)
+  # Effects of a source are stored contiguously, at most 4 per source
+  eptr = np.searchsorted(esrc, np.arange(len(p) + 1))
+  rows, effs, idxs, hits = [], [], [], []
+  for j in range(4):
+    has = eptr[src] + j < eptr[src + 1]
+    e = eptr[src[has]] + j
+    on = ((code[has] >> ebit[e]) & 1).astype(bool)
+    rows.append(erow[e[on]]); effs.append(eeff[e[on]]); idxs.append(eidx[e[on]])
+    hits.append(shot[has][on])
+  row = np.concatenate(rows)
+  order = np.argsort(row, kind='stable')
+  return NoiseEvents(
+    ptr=np.searchsorted(row[order], np.arange(len(cc) + 1)),
+    effect=np.concatenate(effs)[order],
+    index=np.concatenate(idxs)[order],
+    shot=np.concatenate(hits)[order],
+  )
+
+# }}}
@@ -0,0 +1,297 @@
+""" Optimization passes over FTCircuits. Every pass maps a flat tape of operations to a shorter one
+without changing the action of the circuit:
+
+* `drop_identities` removes identities and operations without qubits,
+* `cancel_pairs` cancels self-inverse gates which meet on all their qubits,
+* `fuse_resets` removes |0> initializations of qubits which are already reset,
+* `pauli_frame` moves Pauli gates and classically conditioned Paulis into a classical Pauli frame.
+
+The Pauli frame is propagated through Clifford gates symbolically, as a parity of `CExpr`
+conditions per qubit. A constant frame hitting a measurement flips its recorded outcome, so
+conditions reading the outcome are rewritten and the flip is reported to the caller. Conditional
+frames are applied right before the measurement instead: recording them would nest the conditions
+of every correction round into the next one. The remaining frame is applied at the end of the
+circuit.
+
+Every pass takes the tape and the dictionary of measurement flips recorded so far, so that passes
+are interchangeable in `PASSES`. Only `pauli_frame` records flips, other passes ignore them.
+"""
+from time import perf_counter
+from dataclasses import dataclass, field
+
+from .type import *
+from .schedule import depth
+from .stabilizer import run_stabilizer
+
+# Passes {{{
+
+def drop_identities[Q](ops:list[FTOp[Q]], flips:dict) -> list[FTOp[Q]]:
+  """ Drop `I` gates and operations acting on no qubits. """
+  def _keep(op):
+    if isinstance(op, FTPrim):
+      return op.name != OpName.I and len(op.qubits) > 0
+    elif isinstance(op, FTCtrl):
+      return _keep(op.op)
+    elif isinstance(op, FTCond):
+      return _keep(op.op)
+    return True
+  return [op for op in ops if _keep(op)]
+
+
+def _qubits[Q](op:FTOp[Q]) -> list[Q]:
+  if isinstance(op, FTPrim):
+    return list(op.qubits)
+  elif isinstance(op, FTCtrl):
+    return [op.control] + _qubits(op.op)
+  elif isinstance(op, FTCond):
+    return _qubits(op.op)
+  else:
+    return [op.qubit]
+
+
+def _self_inverse(op:FTOp) -> bool:
+  if isinstance(op, FTPrim):
+    return op.name in (OpName.X, OpName.Z, OpName.H)
+  elif isinstance(op, FTCtrl):
+    return isinstance(op.op, FTPrim) and op.op.name in (OpName.X, OpName.Z)
+  return False
+
+
+def cancel_pairs[Q](ops:list[FTOp[Q]], flips:dict) -> list[FTOp[Q]]:
+  """ Cancel pairs of equal self-inverse gates with no operations in between on their qubits.
+  Every qubit keeps a stack of the live operations acting on it, so cancellations cascade, e.g.
+  `H X X H` vanishes. """
+  live = list(ops)
+  stacks:dict[Q,list[int]] = {}
+  for j, op in enumerate(ops):
+    qs = _qubits(op)
+    tops = {stacks[q][-1] if stacks.get(q) else None for q in qs}
+    if _self_inverse(op) and len(tops) == 1:
+      i = tops.pop()
+      if i is not None and live[i] == op:
+        live[i] = live[j] = None
+        for q in qs:
+          stacks[q].pop()
+        continue
+    for q in qs:
+      stacks.setdefault(q, []).append(j)
+  return [op for op in live if op is not None]
+
+
+def fuse_resets[Q](ops:list[FTOp[Q]], flips:dict) -> list[FTOp[Q]]:
+  """ Drop |0> initializations of qubits which were not used yet or were just measured, as
+  measurements reset qubits to |0>. """
+  last:dict[Q,FTOp[Q]|None] = {}
+  acc = []
+  for op in ops:
+    if isinstance(op, FTInit) and (op.alpha, op.beta) == (1.0, 0.0):
+      prev = last.get(op.qubit)
+      if prev is None or isinstance(prev, FTMeasure):
+        continue
+    for q in _qubits(op):
+      last[q] = op
+    acc.append(op)
+  return acc
+
+
+@dataclass
+class _Parity:
+  """ Parity of a set of conditions and a constant bit. Equal conditions cancel out. """
+  terms:dict = field(default_factory=dict)
+  const:int = 0
+
+  def toggle(self, e:CExpr) -> None:
+    if isinstance(e, CConst):
+      self.const ^= int(e.value) & 1
+    elif e in self.terms:
+      del self.terms[e]
+    else:
+      self.terms[e] = None
+
+  def merge(self, other:"_Parity") -> None:
+    self.const ^= other.const
+    for e in other.terms:
+      self.toggle(e)
+
+  def empty(self) -> bool:
+    return self.const == 0 and not self.terms
+
+  def expr(self) -> CExpr:
+    ts = tuple(self.terms)
+    if not ts:
+      return CConst(self.const)
+    e = ts[0] if len(ts) == 1 else CXor(ts)
+    return CNot(e) if self.const else e
+
+
+def _subst[Q](e:CExpr[Q], flips:dict[MeasureLabel[Q],CExpr[Q]], memo:dict) -> CExpr[Q]:
+  """ Replace the outcomes of flipped measurements in `e` with the corrected ones. """
+  r = memo.get(e)
+  if r is not None:
+    return r
+  if isinstance(e, CBit):
+    f = flips.get(e.label)
+    r = e if f is None else CXor((e, f))
+  elif isinstance(e, CConst):
+    r = e
+  elif isinstance(e, CNot):
+    r = CNot(_subst(e.a, flips, memo))
+  elif isinstance(e, (CAnd, COr, CXor)):
+    r = type(e)(tuple(_subst(a, flips, memo) for a in e.args))
+  elif isinstance(e, CEq):
+    r = CEq(_subst(e.a, flips, memo), _subst(e.b, flips, memo))
+  else:
+    raise ValueError(f"Unrecognized CExpr: {e}")
+  memo[e] = r
+  return r
+
+
+def pauli_frame[Q](ops:list[FTOp[Q]], flips:dict) -> list[FTOp[Q]]:
+  """ Track Pauli gates and Pauli corrections in a classical frame instead of applying them. The
+  frame is propagated through Clifford gates. A constant X frame reaching a measurement is recorded
+  in `flips` (the recorded outcome is the true one XOR the flip) and conditions are rewritten in
+  terms of the recorded outcomes. Operations the frame could not pass through, including the
+  measurements of qubits with a conditional frame, receive the frame of their qubits first.
+  Circuits with callable conditions are returned unchanged. """
+  if any(isinstance(op, FTCond) and not isinstance(op.cond, CExpr) for op in ops):
+    return list(ops)
+  fx:dict[Q,_Parity] = {}
+  fz:dict[Q,_Parity] = {}
+  memo = {}
+  acc = []
+
+  def _get(f, q) -> _Parity:
+    return f.setdefault(q, _Parity())
+
+  def _flush(q) -> None:
+    for f, name in ((fx, OpName.X), (fz, OpName.Z)):
+      p = f.pop(q, None)
+      if p is not None and not p.empty():
+        e = p.expr()
+        acc.append(FTPrim(name, [q]) if isinstance(e, CConst) else FTCond(e, FTPrim(name, [q])))
+
+  def _toggle(name:OpName, qubits:list[Q], e:CExpr) -> None:
+    for q in qubits:
+      _get(fx if name == OpName.X else fz, q).toggle(e)
+
+  for op in ops:
+    if isinstance(op, FTPrim) and op.name in (OpName.X, OpName.Z):
+      _toggle(op.name, op.qubits, CConst(1))
+    elif isinstance(op, FTPrim) and op.name == OpName.I:
+      acc.append(op)
+    elif isinstance(op, FTPrim) and op.name == OpName.H:
+      for q in op.qubits:
+        fx[q], fz[q] = _get(fz, q), _get(fx, q)
+      acc.append(op)
+    elif isinstance(op, FTCond) and isinstance(op.op, FTPrim) and \
+         op.op.name in (OpName.X, OpName.Z):
+      _toggle(op.op.name, op.op.qubits, _subst(op.cond, flips, memo))
+    elif isinstance(op, FTCtrl) and isinstance(op.op, FTPrim) and \
+         op.op.name in (OpName.X, OpName.Z):
+      c = op.control
+      for t in op.op.qubits:
+        if op.op.name == OpName.X:
+          _get(fx, t).merge(_get(fx, c))
+          _get(fz, c).merge(_get(fz, t))
+        else:
+          _get(fz, t).merge(_get(fx, c))
+          _get(fz, c).merge(_get(fx, t))
+      acc.append(op)
+    elif isinstance(op, FTMeasure):
+      fz.pop(op.qubit, None)
+      p = fx.get(op.qubit)
+      if p is not None and not p.terms:
+        if p.const:
+          flips[op.label] = CConst(1)
+        fx.pop(op.qubit)
+      _flush(op.qubit)
+      acc.append(op)
+    elif isinstance(op, FTInit):
+      fx.pop(op.qubit, None)
+      fz.pop(op.qubit, None)
+      acc.append(op)
+    else:
+      for q in _qubits(op):
+        _flush(q)
+      acc.append(FTCond(_subst(op.cond, flips, memo), op.op) if isinstance(op, FTCond) else op)
+  for q in list(dict.fromkeys([*fx, *fz])):
+    _flush(q)
+  return acc
+
+
+PASSES = {
+  'drop_identities': drop_identities,
+  'cancel_pairs': cancel_pairs,
+  'fuse_resets': fuse_resets,
+  'pauli_frame': pauli_frame,
+}
+
+# }}}
+
+# Pipeline {{{
+
+def count_nodes[Q](c:FTCircuit[Q]) -> int:
+  """ Count the operations and the `FTOps`/`FTComp` nodes of the circuit tree. """
+  n, stack = 0, [c]
+  while stack:
+    c = stack.pop()
+    n += 1
+    if isinstance(c, FTOps):
+      n += len(c.ops)
+    elif isinstance(c, FTComp):
+      stack.extend([c.a, c.b])
+    else:
+      raise ValueError(f"Unrecognized FTCircuit: {c}")
+  return n
+
+
+@dataclass
+class PassStats:
+  """ Effect of a pass, as `(before, after)` pairs: the number of operations, the number of tree
+  nodes, the depth of the scheduled circuit and the time of a stabilizer simulation in seconds (NaN
+  if not measured). """
+  name:str
+  ops:tuple[int,int]
+  nodes:tuple[int,int]
+  depth:tuple[int,int]
+  seconds:tuple[float,float]
+
+
+@dataclass
+class Optimized[Q]:
+  """ Result of `optimize`. Recorded outcomes of the optimized circuit are the outcomes of the
+  original circuit XOR `flips`, given as expressions over the recorded outcomes. """
+  circuit:FTOps[Q]
+  stats:list[PassStats]
+  flips:dict[MeasureLabel[Q],CExpr[Q]]
+
+  def correct(self, msms:dict[MeasureLabel[Q],Any]) -> dict[MeasureLabel[Q],Any]:
+    """ Turn the outcomes recorded by the optimized circuit into the outcomes of the original. """
+    return {l:(v != self.flips[l](msms)) if l in self.flips else v for l,v in msms.items()}
+
+
+def optimize[Q](c:FTCircuit[Q], passes:list[str]|None=None, timing:bool=False,
+                seed:int|None=0) -> Optimized[Q]:
+  """ Run the `passes` (all of `PASSES` by default) over the circuit `c`. The statistics of every
+  pass include the simulation time of `run_stabilizer` if `timing` is set. """
+  passes = list(PASSES) if passes is None else passes
+  def _seconds(c):
+    if not timing:
+      return float('nan')
+    t = perf_counter()
+    run_stabilizer(c, seed=seed)
+    return perf_counter() - t
+  ops = list(iter_ops(c))
+  before = (len(ops), count_nodes(c), depth(c), _seconds(c))
+  flips, stats = {}, []
+  for name in passes:
+    if name not in PASSES:
+      raise ValueError(f"Unknown pass: {name}, expected one of {list(PASSES)}")
+    ops = PASSES[name](ops, flips)
+    out = FTOps(ops)
+    after = (len(ops), count_nodes(out), depth(out), _seconds(out))
+    stats.append(PassStats(name, *zip(before, after)))
+    before = after
+  return Optimized(FTOps(ops), stats, flips)
+
+# }}}
@@ -0,0 +1,89 @@
+""" Parallel shot execution. Shots are split into fixed-size batches which are simulated by a pool
+of worker processes. Every batch draws its randomness from its own `SeedSequence.spawn` stream, so
+the samples do not depend on the number of workers. The workers are forked after the circuit is
+compiled, so the compiled circuit (including its callable conditions) reaches them once, without
+pickling. Workers write packed outcomes directly into a shared anonymous memory map, which backs
+the returned samples.
+"""
+import os
+import mmap
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+from .type import *
+from .frame import FrameSamples, sample_frames
+from .stabilizer import StabilizerSim
+
+BACKENDS = ['frame', 'stabilizer']
+
+# Fork pool {{{
+
+# Task and state of `fork_map`, inherited by the forked workers
+_STATE = None
+
+
+def _call(i:int):
+  fn, _ = _STATE
+  return fn(i)
+
+
+def worker_state():
+  """ Return the `state` of the running `fork_map`. """
+  return _STATE[1]
+
+
+def fork_map[T](fn:Callable[[int],T], n:int, workers:int, state) -> list[T]:
+  """ Compute `[fn(i) for i in range(n)]` on up to `workers` forked processes, in the current
+  process if a single worker is enough. `fn` reads the `state` through `worker_state`, the state
+  reaches the workers by forking rather than by pickling. """
+  global _STATE
+  _STATE = (fn, state)
+  try:
+    if workers <= 1 or n <= 1:
+      return [fn(i) for i in range(n)]
+    with ProcessPoolExecutor(min(workers, n), mp_context=mp.get_context('fork')) as pool:
+      return list(pool.map(_call, range(n)))
+  finally:
+    _STATE = None
+
+# }}}
+
+
+def _run_batch(b:int) -> int:
+  """ Simulate the batch `b` and store its packed outcomes into the shared buffer. """
+  cc, backend, buf, shots, batch, seeds = worker_state()
+  nbytes = (len(cc.labels) + 7) // 8
+  out = np.frombuffer(buf, dtype=np.uint8, count=shots*nbytes).reshape(shots, nbytes)
+  start = b * batch
+  n = min(batch, shots - start)
+  if backend == 'frame':
+    out[start:start+n] = sample_frames(cc, n, seed=seeds[b], batch=n).packed
+  elif backend == 'stabilizer':
+    rng = np.random.default_rng(seeds[b])
+    bits = np.zeros((n, len(cc.labels)), dtype=np.uint8)
+    for s in range(n):
+      msms = StabilizerSim(cc.qubits, rng).run(cc)
+      bits[s] = [msms[l] for l in cc.labels]
+    out[start:start+n] = np.packbits(bits, axis=1, bitorder='little')
+  else:
+    raise ValueError(f"Unsupported backend: {backend}, expected one of {BACKENDS}")
+  return n
+
+
+def run_shots[Q](c:FTCircuit[Q]|CompiledCircuit[Q], shots:int, backend:str='frame',
+                 workers:int|None=None, seed:int|None=None, batch:int=2**14) -> FrameSamples[Q]:
+  """ Sample mid-circuit measurements of `shots` executions of the circuit `c` with the `backend`
+  simulator, using `workers` processes (all CPUs by default). Shots are simulated in batches of
+  `batch` shots. The result is determined by the `seed` regardless of the number of workers. """
+  if backend not in BACKENDS:
+    raise ValueError(f"Unsupported backend: {backend}, expected one of {BACKENDS}")
+  cc = c if isinstance(c, CompiledCircuit) else compile_circuit(c)
+  workers = os.cpu_count() if workers is None else workers
+  nbatches = (shots + batch - 1) // batch
+  seeds = np.random.SeedSequence(seed).spawn(nbatches)
+  nbytes = (len(cc.labels) + 7) // 8
+  buf = mmap.mmap(-1, max(1, shots * nbytes))
+  fork_map(_run_batch, nbatches, workers, (cc, backend, buf, shots, batch, seeds))
+  packed = np.frombuffer(buf, dtype=np.uint8, count=shots*nbytes).reshape(shots, nbytes)
+  return FrameSamples(shots, list(cc.labels), packed)
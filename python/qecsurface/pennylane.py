@@ -1,12 +1,32 @@
+import heapq
 import pennylane as qml
 from pennylane.tape import QuantumTape
+from pennylane.measurements import MeasurementValue
 from typing import Generic
 from functools import partial
+from dataclasses import dataclass
 
 from .type import *
 from .qeccs import *
 
 
+def cexpr_to_pennylane[Q](e:CExpr[Q], msms:dict) -> MeasurementValue|bool:
+  """ Lower the classical expression `e` into a single PennyLane measurement value. The whole
+  expression is computed by one processing function rather than by a tree of binary operations on
+  measurement values, which PennyLane would merge and re-evaluate node by node. """
+  ls = list(cexpr_labels(e))
+  if len(ls) == 0:
+    return bool(cexpr_eval(e, {}))
+  mvs = [msms[l] for l in ls]
+  mps = list(dict.fromkeys(mp for mv in mvs for mp in mv.measurements))
+  index = {mp:i for i,mp in enumerate(mps)}
+  args = [[index[mp] for mp in mv.measurements] for mv in mvs]
+  def _fn(*bits):
+    return cexpr_eval(e, {l:mv.processing_fn(*[bits[i] for i in a])
+                          for l,mv,a in zip(ls, mvs, args)})
+  return MeasurementValue(mps, _fn)
+
+
 def traverse_ftcircuit[Q](circuit: FTCircuit[Q], msms:dict) -> None:
   """ Translate FTCircuit into PennyLane operations. """
 
@@ -40,11 +60,12 @@ def traverse_ftcircuit[Q](circuit: FTCircuit[Q], msms:dict) -> None:
     elif isinstance(op, FTCond):
       if not isinstance(op.op, FTPrim):
         raise ValueError(f"Unsupported nested op: {op.op}")
+      cond = cexpr_to_pennylane(op.cond, msms) if isinstance(op.cond, CExpr) else op.cond(msms)
       for q in op.op.qubits:
         if op.op.name == OpName.X:
-          qml.cond(op.cond(msms),qml.PauliX)(wires=q)
+          qml.cond(cond,qml.PauliX)(wires=q)
         elif op.op.name == OpName.Z:
-          qml.cond(op.cond(msms),qml.PauliZ)(wires=q)
+          qml.cond(cond,qml.PauliZ)(wires=q)
         else:
           raise ValueError(f"Unsupported nested op: {op.op}")
     elif isinstance(op, FTErr):
@@ -56,29 +77,158 @@ def traverse_ftcircuit[Q](circuit: FTCircuit[Q], msms:dict) -> None:
   traverse_circuit(circuit, _traverse_op, msms)
 
 
-def to_pennylane_mcm(c: FTCircuit[int]):
-  """ Lower the FTCircuit to PennyLane. Return the PennyLane circuit returning mid-circuit
-  measurement samples as a dictionary. """
-  nqubits = len(labels(c))
-  dev = qml.device("lightning.qubit", wires=nqubits, shots=1)
-  @qml.qnode(dev, mcm_method="one-shot")
-  def _circuit():
-    msms = {}
+# Wire allocation {{{
+
+def _relabel[Q](op:FTOp[Q], w:dict[Q,int]) -> FTOp[int]:
+  if isinstance(op, FTPrim):
+    return FTPrim(op.name, [w[q] for q in op.qubits])
+  elif isinstance(op, FTCtrl):
+    return FTCtrl(w[op.control], _relabel(op.op, w))
+  elif isinstance(op, FTCond):
+    return FTCond(op.cond, _relabel(op.op, w))
+  elif isinstance(op, FTMeasure):
+    return FTMeasure(w[op.qubit], op.label)
+  elif isinstance(op, FTInit):
+    return FTInit(w[op.qubit], op.alpha, op.beta)
+  elif isinstance(op, FTErr):
+    return FTErr(w[op.qubit], op.phys, op.name)
+  else:
+    raise ValueError(f"Unrecognized FTOp: {op}")
+
+
+@dataclass
+class WireMap[Q]:
+  """ Result of `allocate_wires`: the operations acting on dense wire indices, the peak number of
+  live wires (the number of device wires needed) and the wires holding the labels at the end. """
+  ops:list[FTOp[int]]
+  peak:int
+  wires:dict[Q,int]
+
+
+def allocate_wires[Q](c:FTCircuit[Q], keep:list[Q]|None=None) -> WireMap[Q]:
+  """ Assign dense wire indices to the qubit labels of the circuit `c`. A label is live from its
+  first use until it is measured: measurements reset the wire to |0>, so the wire returns to the
+  pool and is handed to the next label which needs a fresh qubit. Wires of the `keep` labels are
+  never recycled. Wires are taken lowest first, which keeps the number of device wires at the peak
+  number of simultaneously live labels. """
+  keep = set() if keep is None else set(keep)
+  live:dict[Q,int] = {}
+  final:dict[Q,int] = {}
+  free:list[int] = []
+  peak = 0
+  acc = []
+  for op in iter_ops(c):
+    for q in labels(FTOps([op])):
+      if q not in live:
+        if free:
+          live[q] = heapq.heappop(free)
+        else:
+          live[q] = peak
+          peak += 1
+        final[q] = live[q]
+    acc.append(_relabel(op, live))
+    if isinstance(op, FTMeasure) and op.qubit not in keep:
+      heapq.heappush(free, live.pop(op.qubit))
+  for q in keep:
+    if q not in final:
+      final[q] = peak
+      peak += 1
+  return WireMap(acc, peak, final)
+
+# }}}
+
+
+# Device and circuit caches {{{
+
+_DEVICES = LRUCache(maxsize=16)
+_CIRCUITS = LRUCache(maxsize=128)
+
+
+def _device(name:str, nwires:int|None, shots:int|None=None):
+  """ Return a cached PennyLane device. """
+  return _DEVICES.get((name, nwires, shots),
+                      lambda: qml.device(name, wires=nwires, shots=shots))
+
+
+def _cached(key:tuple, c:FTCircuit[int], make):
+  """ Return the QNode built by `make` for the circuit `c`, reusing the QNodes of structurally
+  identical circuits. Circuits without a structural key are not cached. """
+  try:
+    key = key + (circuit_key(c),)
+  except Unhashable:
+    _CIRCUITS.misses += 1
+    return make()
+  return _CIRCUITS.get(key, make)
+
+
+def _trace(c:FTCircuit[int]) -> tuple[list, dict]:
+  """ Translate the circuit into PennyLane operations once, without executing them. The recorded
+  operations are replayed by the cached QNodes. """
+  msms = {}
+  with qml.queuing.AnnotatedQueue() as q:
     traverse_ftcircuit(c, msms)
+  return list(q.queue), msms
+
+
+def cache_info() -> dict[str,CacheInfo]:
+  """ Return hit/miss statistics of the device and circuit caches. """
+  return {'devices': _DEVICES.info(), 'circuits': _CIRCUITS.info()}
+
+
+def cache_clear() -> None:
+  """ Drop the cached devices and circuits and reset the statistics. """
+  _DEVICES.clear()
+  _CIRCUITS.clear()
+
+# }}}
+
+
+# PennyLane devices used by the mid-circuit measurement methods. The deferred method allocates an
+# extra wire per measurement, so its device does not have a fixed number of wires.
+MCM_DEVICES = {
+  'one-shot': 'lightning.qubit',
+  'tree-traversal': 'default.qubit',
+  'deferred': 'default.qubit',
+}
+
+
+def to_pennylane_mcm[Q](c:FTCircuit[Q], shots:int=1, mcm_method:str="one-shot"):
+  """ Lower the FTCircuit to PennyLane. Return the PennyLane circuit returning mid-circuit
+  measurement samples as a dictionary. All `shots` are executed by the device in a single call, the
+  samples of every measurement are returned as an array of `shots` elements (a 0-d array for a
+  single shot). Qubits are placed on the wires given by `allocate_wires`, so measured syndrome
+  qubits share wires. QNodes of structurally identical circuits are cached. """
+  if mcm_method not in MCM_DEVICES:
+    raise ValueError(f"Unsupported mcm_method: {mcm_method}, expected one of {list(MCM_DEVICES)}")
+  def _make():
+    wm = allocate_wires(c)
+    ops, msms = _trace(FTOps(wm.ops))
     assert len(msms)>0, f"Expected a circuit with mid-circuit measurements"
-    return {l:qml.sample(m) for l,m in msms.items()}
-  return _circuit
+    nwires = None if mcm_method == 'deferred' else wm.peak
+    @qml.qnode(_device(MCM_DEVICES[mcm_method], nwires, shots), mcm_method=mcm_method)
+    def _circuit():
+      for op in ops:
+        qml.apply(op)
+      return {l:qml.sample(m) for l,m in msms.items()}
+    return _circuit
+  return _cached(('mcm', shots, mcm_method), c, _make)
 
 
-def to_pennylane_probs(c: FTCircuit[int], data_qubits=None):
+def to_pennylane_probs[Q](c:FTCircuit[Q], data_qubits=None):
   """ Lower the FTCircuit to PennyLane. Return the PennyLane circuit returning probabilities of data
-  basis vectors. """
-  nqubits = len(labels(c))
-  dev = qml.device("default.qubit", wires=nqubits)
-  @qml.qnode(dev)
-  def _circuit():
-    msms = {}
-    traverse_ftcircuit(c, msms)
-    return qml.probs(list(range(nqubits)) if data_qubits is None else data_qubits)
-  return _circuit
-
+  basis vectors (of all qubits in the sorted order by default). Wires of other qubits are recycled
+  after measurements, see `allocate_wires`. QNodes of structurally identical circuits are cached.
+  """
+  def _make():
+    data = sorted(labels(c)) if data_qubits is None else list(data_qubits)
+    wm = allocate_wires(c, keep=data)
+    ops, _ = _trace(FTOps(wm.ops))
+    wires = [wm.wires[q] for q in data]
+    @qml.qnode(_device("default.qubit", wm.peak))
+    def _circuit():
+      for op in ops:
+        qml.apply(op)
+      return qml.probs(wires)
+    return _circuit
+  key = ('probs', None if data_qubits is None else tuple(data_qubits))
+  return _cached(key, c, _make)
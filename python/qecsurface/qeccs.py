@@ -1,7 +1,8 @@
 """ The module defines QECC circuit parts. """
-from functools import reduce
+import numpy as np
+from functools import reduce, lru_cache
 from textwrap import dedent
-from dataclasses import field
+from dataclasses import field, replace
 from collections import defaultdict
 from .type import *
 
@@ -29,6 +30,197 @@ def stabilizer_test_Z[Q](tile:FTPrim[Q], syndrome:Q, ml:MeasureLabel[Q]) -> FTCi
   ])
 #}}}
 
+# Parametric surface codes {{{
+
+@dataclass(frozen=True)
+class SurfaceCode:
+  """ Layout of the distance-`d` surface code. Stabilizers and logical operator supports refer to
+  data qubit indices. Data qubits and stabilizers are enumerated row by row, `data_coords` and
+  `stabilizer_coords` hold their (row, column) positions on a common grid. Layouts are shared by
+  `surface_code`, so all fields are immutable, including the qubit tuples of the stabilizers. """
+  d:int
+  rotated:bool
+  ndata:int
+  stabilizers:tuple[FTPrim[int],...]
+  logical_x:tuple[int,...]
+  logical_z:tuple[int,...]
+  data_coords:tuple[tuple[int,int],...]
+  stabilizer_coords:tuple[tuple[int,int],...]
+
+  def __post_init__(self):
+    def _set(name, v):
+      object.__setattr__(self, name, v)
+    _set('stabilizers', tuple(FTPrim(s.name, tuple(s.qubits)) for s in self.stabilizers))
+    for name in ['logical_x', 'logical_z', 'data_coords', 'stabilizer_coords']:
+      _set(name, tuple(getattr(self, name)))
+
+  def qubits(self) -> tuple[list[int],list[int]]:
+    """ Return the default physical qubits: data qubits `0..ndata-1` followed by one syndrome qubit
+    per stabilizer. """
+    n = self.ndata
+    return list(range(n)), list(range(n, n + len(self.stabilizers)))
+
+
+def _surface_code_unrotated(d:int) -> SurfaceCode:
+  """ The unrotated code on a (2d-1)x(2d-1) grid: data qubits sit on the sites with even
+  coordinate sums, X (Z) stabilizers on the odd sites of even (odd) rows. """
+  n = 2*d - 1
+  data_coords = [(r, c) for r in range(n) for c in range(n) if (r + c) % 2 == 0]
+  index = {rc:i for i,rc in enumerate(data_coords)}
+  stabilizers, stabilizer_coords = [], []
+  for r in range(n):
+    for c in range(n):
+      if (r + c) % 2 == 1:
+        qubits = [index[rc] for rc in [(r-1, c), (r, c-1), (r, c+1), (r+1, c)] if rc in index]
+        stabilizers.append(FTPrim(OpName.X if r % 2 == 0 else OpName.Z, qubits))
+        stabilizer_coords.append((r, c))
+  m = 2*(d // 2)
+  return SurfaceCode(
+    d=d, rotated=False, ndata=len(data_coords), stabilizers=stabilizers,
+    logical_x=[index[(r, m)] for r in range(0, n, 2)],
+    logical_z=[index[(m, c)] for c in range(0, n, 2)],
+    data_coords=data_coords, stabilizer_coords=stabilizer_coords)
+
+
+def _surface_code_rotated(d:int) -> SurfaceCode:
+  """ The rotated code on a dxd grid of data qubits. Plaquettes between data qubits carry X
+  stabilizers on the checkerboard sites with even coordinate sums and Z stabilizers elsewhere.
+  Weight-2 plaquettes are kept on the top and bottom boundaries for X and on the left and right
+  boundaries for Z. """
+  if d % 2 == 0:
+    raise ValueError(f"Rotated surface code requires an odd distance, got {d}")
+  data_coords = [(2*i+1, 2*j+1) for i in range(d) for j in range(d)]
+  stabilizers, stabilizer_coords = [], []
+  for pr in range(-1, d):
+    for pc in range(-1, d):
+      name = OpName.X if (pr + pc) % 2 == 0 else OpName.Z
+      row_boundary = pr in (-1, d-1)
+      col_boundary = pc in (-1, d-1)
+      if row_boundary and col_boundary:
+        continue
+      if (row_boundary and name != OpName.X) or (col_boundary and name != OpName.Z):
+        continue
+      qubits = [i*d + j for i, j in [(pr, pc), (pr, pc+1), (pr+1, pc), (pr+1, pc+1)]
+                if 0 <= i < d and 0 <= j < d]
+      stabilizers.append(FTPrim(name, qubits))
+      stabilizer_coords.append((2*pr + 2, 2*pc + 2))
+  m = d // 2
+  return SurfaceCode(
+    d=d, rotated=True, ndata=d*d, stabilizers=stabilizers,
+    logical_x=[i*d + m for i in range(d)],
+    logical_z=[m*d + j for j in range(d)],
+    data_coords=data_coords, stabilizer_coords=stabilizer_coords)
+
+
+@lru_cache(maxsize=64)
+def surface_code(d:int, rotated:bool=True) -> SurfaceCode:
+  """ Generate (or fetch from the cache) the layout of the distance-`d` surface code. The rotated
+  variant uses d^2 data qubits, the unrotated one uses d^2+(d-1)^2. The returned object is shared
+  and should not be modified. """
+  if d < 2:
+    raise ValueError(f"Surface code distance should be at least 2, got {d}")
+  return _surface_code_rotated(d) if rotated else _surface_code_unrotated(d)
+
+
+def hook_order(code:SurfaceCode, i:int) -> list[int]:
+  """ Order the data qubits of the `i`-th stabilizer of the `code` for the syndrome extraction. A
+  fault on the syndrome qubit before the last two CNOTs propagates into a weight-2 "hook" error on
+  the last two data qubits, so these are chosen to lie on a line perpendicular to the logical
+  operator of the same type. Such hooks can not shorten the logical operator. """
+  op = code.stabilizers[i]
+  logical = code.logical_x if op.name == OpName.X else code.logical_z
+  # Logical operators are straight lines, the hook should be perpendicular to them
+  axis = 0 if len({code.data_coords[q][1] for q in logical}) == 1 else 1
+  qs = sorted(op.qubits, key=lambda q: code.data_coords[q])
+  pairs = [(a, b) for a in qs for b in qs
+           if a < b and code.data_coords[a][axis] == code.data_coords[b][axis]]
+  if len(qs) < 3 or not pairs:
+    return list(op.qubits)
+  last = max(pairs, key=lambda p: sorted(code.data_coords[q] for q in p))
+  return [q for q in qs if q not in last] + list(last)
+
+
+def surface_code_detect[Q](
+  code:SurfaceCode, data:list[Q], syndromes:list[Q], layer:int=0, hook_safe:bool=False
+) -> tuple[FTCircuit[Q],list[MeasureLabel]]:
+  """ Build the error detection circuit of the surface `code`. A single syndrome qubit is re-used
+  for all stabilizer tests, otherwise every stabilizer gets its own syndrome qubit. CNOTs follow the
+  `hook_order` if `hook_safe` is set. Return the circuit alongside with a list of mid-circuit
+  measurement labels. The round is instantiated from the cached `detect_template`. """
+  return detect_template(code, data, syndromes, hook_safe).instantiate(layer)
+
+
+@dataclass
+class DetectTemplate[Q]:
+  """ Error detection round of a surface code on fixed qubits, parametrised by the layer. `ops` hold
+  the round with layer-0 measurements at the positions `measures`, `labels` are the measurement
+  labels without the layer. Instances share all operations except the measurements. """
+  ops:list[FTOp[Q]]
+  measures:list[int]
+  labels:list[tuple]
+  compiled:CompiledCircuit[Q]
+
+  def instantiate(self, layer:int) -> tuple[FTOps[Q],list[MeasureLabel]]:
+    """ Return the round measuring into the `layer` alongside with its measurement labels. """
+    ls = [(layer, *l) for l in self.labels]
+    ops = list(self.ops)
+    for j, l in zip(self.measures, ls):
+      ops[j] = FTMeasure(ops[j].qubit, l)
+    return FTOps(ops), ls
+
+  def compile(self, layer:int) -> CompiledCircuit[Q]:
+    """ Return the compiled round measuring into the `layer`. Only the label table is allocated, the
+    columns are shared by all instances and should not be modified. """
+    return replace(self.compiled, labels=[(layer, *l) for l in self.labels])
+
+
+def _detect_template[Q](code:SurfaceCode, data:list[Q], syndromes:list[Q],
+                        hook_safe:bool) -> DetectTemplate[Q]:
+  assert len(data) == code.ndata, f"Expected {code.ndata} data qubit labels, got {data}"
+  assert len(syndromes) in (1, len(code.stabilizers)), \
+    f"Expected 1 or {len(code.stabilizers)} syndrome qubit labels, got {syndromes}"
+  labels = []
+
+  def _to_hadamard_test(i, op):
+    qubits = [data[q] for q in op.qubits]
+    ordered = [data[q] for q in hook_order(code, i)] if hook_safe else qubits
+    syndrome = syndromes[i % len(syndromes)]
+    labels.append((0, op.name, tuple(qubits)))
+    if op.name == OpName.X:
+      return stabilizer_test_X(FTPrim(OpName.X, ordered), syndrome, labels[-1])
+    elif op.name == OpName.Z:
+      return stabilizer_test_Z(FTPrim(OpName.Z, ordered), syndrome, labels[-1])
+    else:
+      raise ValueError(f"Unrecognized op {op}")
+
+  c = flatten(reduce(FTComp, [_to_hadamard_test(i, op) for i, op in enumerate(code.stabilizers)]))
+  measures = [j for j, op in enumerate(c.ops) if isinstance(op, FTMeasure)]
+  return DetectTemplate(c.ops, measures, [l[1:] for l in labels], compile_circuit(c))
+
+
+_TEMPLATES = LRUCache(64)
+
+
+def detect_template[Q](code:SurfaceCode, data:list[Q], syndromes:list[Q],
+                       hook_safe:bool=False) -> DetectTemplate[Q]:
+  """ Return the template of the detection round of the surface `code` on the `data` and
+  `syndromes` qubits (see `surface_code_detect`). Templates are cached per code and qubit map. """
+  key = (code.d, code.rotated, tuple(op_key(s) for s in code.stabilizers), tuple(code.logical_x),
+         tuple(code.logical_z), tuple(data), tuple(syndromes), hook_safe)
+  return _TEMPLATES.get(key, lambda: _detect_template(code, data, syndromes, hook_safe))
+
+
+def template_cache_info() -> CacheInfo:
+  """ Return the statistics of the detection round template cache. """
+  return _TEMPLATES.info()
+
+
+def template_cache_clear() -> None:
+  """ Drop the cached templates and reset the statistics. """
+  _TEMPLATES.clear()
+
+# }}}
+
 def surface9[Q](data:list[Q], syndrome:list[Q], layer:int=0) -> FTCircuit[Q]:
   """ Top-left corner of surface25 code, not really supposed to work. """
   assert len(data)==5
@@ -53,37 +245,17 @@ def surface9[Q](data:list[Q], syndrome:list[Q], layer:int=0) -> FTCircuit[Q]:
 def surface25[Q](data: list[Q], syndrome: list[Q]) -> FTCircuit[Q]:
   assert len(data) == 13
   assert len(syndrome) == 12
-  d0, d1, d2, d3, d4, d5, d6, d7, d8, d9, d10, d11, d12 = [*data]
-  s13, s14, s15, s16, s17, s18, s19, s20, s21, s22, s23, s24 = [*syndrome]
-
-  def SX(data, syndrome):
-    return stabilizer_test_X(FTPrim(OpName.X, data), syndrome, str(syndrome))
-  def SZ(data, syndrome):
-    return stabilizer_test_Z(FTPrim(OpName.Z, data), syndrome, str(syndrome))
-
   tiles = [
-              SX([d0,d1,d3],s13), SX([d1,d2,d4],s14),
-    SZ([d0,d3,d5],s15), SZ([d1,d3,d4,d6],s16), SZ([d2,d4,d7],s17),
-           SX([d3,d5,d6,d8],s18), SX([d4,d6,d7,d9],s19),
-    SZ([d5,d8,d10],s20), SZ([d6,d8,d9,d11],s21), SZ([d7,d9,d12],s22),
-              SX([d8,d10,d11],s23), SX([d9,d11,d12],s24),
+    (stabilizer_test_X if op.name == OpName.X else stabilizer_test_Z)(
+      FTPrim(op.name, [data[q] for q in op.qubits]), s, str(s))
+    for op, s in zip(surface_code(3, rotated=False).stabilizers, syndrome)
   ]
   return reduce(FTComp, tiles)
 
 
 def surface25_stabilizers() -> list[FTPrim[int]]:# {{{
   """ Surface25 stabilizers. Qubit labels may be interpreted as indices. """
-  def X(data):
-    return FTPrim(OpName.X, data)
-  def Z(data):
-    return FTPrim(OpName.Z, data)
-  return [
-            X([0,1,3]), X([1,2,4]),
-    Z([0,3,5]), Z([1,3,4,6]), Z([2,4,7]),
-           X([3,5,6,8]), X([4,6,7,9]),
-    Z([5,8,10]), Z([6,8,9,11]), Z([7,9,12]),
-           X([8,10,11]), X([9,11,12]),
-  ]
+  return [FTPrim(s.name, list(s.qubits)) for s in surface_code(3, rotated=False).stabilizers]
 # }}}
 
 def surface25u_detect[Q](# {{{
@@ -92,21 +264,8 @@ def surface25u_detect[Q](# {{{
   """ Build the surface25u error detection circuit. Return the circuit alongside with a list of
   mid-circuit measurement labels. """
   assert len(data) == 13, f"Expected 13 data qubit labels, got {data}"
-  assert len(syndromes) == 1, f"Expected 1 syndrome qubit label, got {syndrome}"
-  syndrome = syndromes[0]
-  labels = []
-
-  def _to_hadamard_test(op):
-    qubits = [data[q] for q in op.qubits]
-    labels.append((layer,op.name,tuple(qubits)))
-    if op.name == OpName.X:
-      return stabilizer_test_X(FTPrim(OpName.X, qubits), syndrome, labels[-1])
-    elif op.name == OpName.Z:
-      return stabilizer_test_Z(FTPrim(OpName.Z, qubits), syndrome, labels[-1])
-    else:
-      raise ValueError(f"Unrecognized op {op}")
-
-  return reduce(FTComp, map(_to_hadamard_test, surface25_stabilizers())), labels
+  assert len(syndromes) == 1, f"Expected 1 syndrome qubit label, got {syndromes}"
+  return surface_code_detect(surface_code(3, rotated=False), data, syndromes, layer)
 # }}}
 
 
@@ -135,60 +294,82 @@ def surface25u_print2(msms:dict[MeasureLabel,int], flt:list[MeasureLabel], ref_l
   )
 # }}}
 
-def surface25u_correct[Q](data:list[Q], layer0:int, layer:int) -> FTCircuit[Q]:# {{{
+@lru_cache
+def surface25_lut(name:OpName) -> np.ndarray:
+  """ Build the lookup table of the surface25 decoder for `name`-type stabilizers. The row `k` of
+  the `(2**6, 13)` table is the minimum-weight data-qubit correction mask explaining the syndrome
+  difference `k`, where the bit `i` of `k` refers to the `i`-th `name`-stabilizer of
+  `surface25_stabilizers`. """
+  stabs = [op.qubits for op in surface25_stabilizers() if op.name == name]
+  check = np.zeros((len(stabs), 13), dtype=np.uint8)
+  for i, qubits in enumerate(stabs):
+    check[i, qubits] = 1
+  masks = ((np.arange(2**13)[:, None] >> np.arange(13)) & 1).astype(np.uint8)
+  keys = ((masks @ check.T) % 2) @ (1 << np.arange(len(stabs)))
+  lut = np.zeros((2**len(stabs), 13), dtype=np.uint8)
+  found = np.zeros(2**len(stabs), dtype=bool)
+  for m in np.argsort(masks.sum(axis=1), kind='stable'):
+    if not found[keys[m]]:
+      found[keys[m]] = True
+      lut[keys[m]] = masks[m]
+  assert found.all()
+  lut.setflags(write=False)
+  return lut
+
+
+def surface25u_syndrome_key[Q](msms:dict[MeasureLabel,int], data:list[Q], name:OpName,
+                               layer0:int, layer:int):
+  """ Pack the difference between `layer0` and `layer` syndromes of `name`-type stabilizers into
+  the `surface25_lut` key. Measurement values could be numbers, NumPy shot arrays or PennyLane
+  measurement values. """
+  def _diff(i, op):
+    l = (name, tuple(data[q] for q in op.qubits))
+    return (msms[(layer0, *l)] != msms[(layer, *l)]) * (1 << i)
+  stabs = [op for op in surface25_stabilizers() if op.name == name]
+  return reduce(lambda a, b: a + b, [_diff(i, op) for i, op in enumerate(stabs)])
+
+
+def surface25u_lut_correct[Q](msms:dict[MeasureLabel,int], data:list[Q], layer0:int,
+                              layer:int) -> tuple[np.ndarray,np.ndarray]:
+  """ Decode a batch of shots with the lookup tables. Return the `(..., 13)` masks of X and Z
+  corrections to be applied to the `data` qubits. """
+  xkey = np.asarray(surface25u_syndrome_key(msms, data, OpName.Z, layer0, layer), dtype=np.int64)
+  zkey = np.asarray(surface25u_syndrome_key(msms, data, OpName.X, layer0, layer), dtype=np.int64)
+  return surface25_lut(OpName.Z)[xkey], surface25_lut(OpName.X)[zkey]
+
+
+def surface25u_correct[Q](data:list[Q], layer0:int, layer:int,
+                          refs:dict[MeasureLabel,frozenset[MeasureLabel]]|None=None
+                          ) -> FTCircuit[Q]:# {{{
   """ Build the surface25u error correction circuit assuming `layer` measurememnts are available.
-  Use `layer0` measurements as a reference. """
-  def _corrector(op, opc, d):
-    def _cond(msms):
-      neigb = [l[2] for l in list(msms.keys()) if l[0]==layer and l[1]==op and (d in l[2])]
-      others = [l[2] for l in list(msms.keys()) if l[0]==layer and l[1]==op and (d not in l[2])]
-      return reduce(
-        lambda a,b: a & b, [
-          *[(msms[(layer0,op,n)] != msms[(layer,op,n)]) for n in neigb],
-          *[(msms[(layer0,op,n)] == msms[(layer,op,n)]) for n in others],
-        ]
-      )
-    return FTCond(_cond, FTPrim(opc,[d]))
+  Use `layer0` measurements as a reference, `refs` could replace some of the reference outcomes with
+  the parity of a set of outcomes. Corrections are taken from `surface25_lut`. """
+  refs = {} if refs is None else refs
+  def _ref(l):
+    ls = refs.get(l, frozenset([l]))
+    if len(ls) == 1:
+      return CBit(next(iter(ls)))
+    return CXor(tuple(CBit(x) for x in sorted(ls, key=repr)))
+  def _corrector(op, opc, j):
+    stabs = [tuple(data[q] for q in s.qubits) for s in surface25_stabilizers() if s.name == op]
+    diffs = [_ref((layer0, op, qs)) ^ CBit((layer, op, qs)) for qs in stabs]
+    def _match(key):
+      return CAnd(tuple(d if (key >> i) & 1 else ~d for i, d in enumerate(diffs)))
+    keys = [int(k) for k in np.flatnonzero(surface25_lut(op)[:, j])]
+    return FTCond(COr(tuple(_match(k) for k in keys)), FTPrim(opc,[data[j]]))
   return FTComp(
-    FTOps([_corrector(OpName.X, OpName.Z, d) for d in data]),
-    FTOps([_corrector(OpName.Z, OpName.X, d) for d in data])
+    FTOps([_corrector(OpName.X, OpName.Z, j) for j in range(len(data))]),
+    FTOps([_corrector(OpName.Z, OpName.X, j) for j in range(len(data))])
   )
 # }}}
 
 def surface17u_detect[Q](
   data: list[Q], syndrome: list[Q], layer:int=0
 ) -> tuple[FTCircuit[Q], list[MeasureLabel]]:
+  """ Build the error detection circuit of the rotated distance-3 surface code. """
   assert len(data) == 9
   assert len(syndrome) == 1
-  d0, d1, d2, d3, d4, d5, d6, d7, d8  = [*data]
-  s, = [*syndrome]
-  labels = []
-
-  def SX(data, syndrome):
-    label = (layer,OpName.X,tuple(data))
-    labels.append(label)
-    return stabilizer_test_X(FTPrim(OpName.X, data), syndrome, label)
-  def SZ(data, syndrome):
-    label = (layer,OpName.Z,tuple(data))
-    labels.append(label)
-    return stabilizer_test_Z(FTPrim(OpName.Z, data), syndrome, label)
-
-  tiles = [
-    #SX([d0,d8],s),
-    #SZ([d0,d1],s),
-    SX([d1,d2],s),
-    #SZ([d2,d6],s),
-
-    SZ([d0,d3],s),
-    SX([d0,d1,d3,d4],s), SZ([d1,d2,d4,d5],s),
-    #SX([d2,d5],s),
-    #SX([d3,d6],s),
-    SZ([d3,d4,d6,d7],s), SX([d4,d5,d8,d7],s),
-    SZ([d5,d8],s),
-    SX([d6,d7],s),
-    #SZ([d7,d8],s),
-  ]
-  return reduce(FTComp, tiles), labels
+  return surface_code_detect(surface_code(3, rotated=True), data, syndrome, layer)
 
 
 def surface17u_print(msms:dict[MeasureLabel,int], flt:list[MeasureLabel]):
@@ -248,7 +429,7 @@ def surface20u_detect[Q](
     else:
       raise ValueError(f"Unrecognized op {op}")
 
-  return reduce(FTComp, map(_to_hadamard_test, surface20u_stabilizers())), labels
+  return reduce(FTComp, map(_to_hadamard_test, surface20_stabilizers())), labels
 
 
 def surface20u_print(msms:dict[MeasureLabel,int], flt:list[MeasureLabel]):
@@ -284,10 +465,10 @@ def bitflip_detect[Q](data:list[Q], syndrome:list[Q], layer:int=0) -> FTCircuit[
 
 def bitflip_correct[Q](data:list[Q], layer:int=0) -> FTCircuit[Q]:
   d0, d1, d2 = [*data]
-  ee = lambda msms, d: msms[(layer, OpName.Z, d)]
-  e0 = lambda msms:    ee(msms,(d0,d1))  & (~ee(msms,(d1,d2)))
-  e1 = lambda msms:    ee(msms,(d0,d1))  &   ee(msms,(d1,d2))
-  e2 = lambda msms:  (~ee(msms,(d0,d1))) &   ee(msms,(d1,d2))
+  s01, s12 = CBit((layer, OpName.Z, (d0,d1))), CBit((layer, OpName.Z, (d1,d2)))
+  e0 =  s01 & ~s12
+  e1 =  s01 &  s12
+  e2 = ~s01 &  s12
   return FTOps([FTCond(e0, FTPrim(OpName.X, [d0])),
                 FTCond(e1, FTPrim(OpName.X, [d1])),
                 FTCond(e2, FTPrim(OpName.X, [d2]))])
@@ -304,12 +485,12 @@ class Bitflip[Q1,Q2](Map[Q1,Q2]):
     self.layer = self.layer + 1
     return l
 
-  def _error_correction_cycle(self, q:Q1) -> FTCircuit[Q2]:
-    qubits, syndromes = self.qmap[q]
+  def _error_correction_cycle(self, qs:list[Q1]) -> FTCircuit[Q2]:
+    """ Run one error correction cycle of all the logical qubits `qs` in the same layer. """
     layer = self._next_layer()
-    det = bitflip_detect(qubits, syndromes, layer)
-    corr = bitflip_correct(qubits, layer)
-    return FTComp(det,corr)
+    dets = [bitflip_detect(*self.qmap[q], layer) for q in qs]
+    corrs = [bitflip_correct(self.qmap[q][0], layer) for q in qs]
+    return reduce(FTComp, dets + corrs)
 
   def map_op(self, op:FTOp[Q1]) -> FTCircuit[Q2]:
     qmap = self.qmap
@@ -323,7 +504,7 @@ class Bitflip[Q1,Q2](Map[Q1,Q2]):
       qubits = qmap[q][0]
       equbit = qubits[op.phys % len(qubits)]
       acc.append(FTOps([FTPrim(op.name, [equbit])]))
-      acc.append(self._error_correction_cycle(q))
+      acc.append(self._error_correction_cycle([q]))
     elif isinstance(op, FTPrim):
       for q in op.qubits:
         qubits = qmap[q][0]
@@ -335,7 +516,16 @@ class Bitflip[Q1,Q2](Map[Q1,Q2]):
           acc.append(FTOps([FTPrim(OpName.Z, qubits)]))
         else:
           raise ValueError(f"Bitflip qecc: Unsupported primitive operation: {op}")
-        acc.append(self._error_correction_cycle(q))
+      acc.append(self._error_correction_cycle(list(op.qubits)))
+    elif isinstance(op, FTCtrl):
+      if not (isinstance(op.op, FTPrim) and op.op.name == OpName.X):
+        raise ValueError(f"Bitflip qecc: Unsupported controlled operation: {op}")
+      for t in op.op.qubits:
+        if t == op.control:
+          raise ValueError(f"Bitflip qecc: Control qubit {t} is also a target")
+        acc.append(FTOps([FTCtrl(c, FTPrim(OpName.X, [d]))
+                          for c, d in zip(qmap[op.control][0], qmap[t][0])]))
+      acc.append(self._error_correction_cycle([op.control, *op.op.qubits]))
     else:
       raise ValueError(f"Bitflip qecc: Unsupported operation: {op}")
     return reduce(FTComp, acc)
@@ -344,23 +534,49 @@ class Bitflip[Q1,Q2](Map[Q1,Q2]):
 # Surface25u {{{
 @dataclass
 class Surface25u[Q1, Q2](Map[Q1, Q2]):
+  """ Maps quantum circuit into a quantum circuit with Surface25u quantum error correction. The
+  mapper keeps the state of the current layer and the reference syndromes of every logical qubit
+  only, the measurement labels of the rounds are reported by `map_circuit_iter`. """
   qmap: dict[Q1, tuple[list[Q2], Q2]]
   _layer: int = 0
   _layers0: dict[Q1, int] = field(default_factory=dict)
-  _mls: dict[Q1, list[MeasureLabel]] = field(default_factory=lambda: defaultdict(list))
+  _refs: dict[Q1, dict[MeasureLabel, frozenset[MeasureLabel]]] = field(
+    default_factory=lambda: defaultdict(dict))
 
   def _next_layer(self) -> int:
     l = self._layer
     self._layer += 1
     return l
 
-  def _error_correction_cycle(self, q:Q1, layer0:int) -> FTCircuit[Q2]:
-    qubits, syndrome = self.qmap[q]
+  def _error_correction_cycle(self, qs:list[Q1]) -> FTCircuit[Q2]:
+    """ Run one error correction cycle of all the logical qubits `qs`: the syndromes of all patches
+    are extracted in the same layer before any correction is applied. """
     layer = self._next_layer()
-    det, ml = surface25u_detect(qubits, [syndrome], layer)
-    corr = surface25u_correct(qubits, layer0, layer)
-    self._mls[q].append(ml)
-    return FTComp(det,corr)
+    dets, corrs = [], []
+    for q in qs:
+      qubits, syndrome = self.qmap[q]
+      det, _ = surface25u_detect(qubits, [syndrome], layer)
+      dets.append(det)
+      corrs.append(surface25u_correct(qubits, self._layers0[q], layer, self._refs[q]))
+    return reduce(FTComp, dets + corrs)
+
+  def _ref_labels(self, q:Q1, name:OpName) -> list[MeasureLabel]:
+    qubits,_ = self.qmap[q]
+    return [(self._layers0[q], name, tuple(qubits[i] for i in s.qubits))
+            for s in surface25_stabilizers() if s.name == name]
+
+  def _cnot_refs(self, c:Q1, t:Q1) -> None:
+    """ Update the reference syndromes after the transversal CNOT: X stabilizers of the control
+    pick up the X stabilizers of the target and Z stabilizers of the target pick up the Z
+    stabilizers of the control. References are kept as parity sets, so repeated labels cancel. """
+    for name, a, b in ((OpName.X, c, t), (OpName.Z, t, c)):
+      ra, rb = self._refs[a], self._refs[b]
+      for la, lb in zip(self._ref_labels(a, name), self._ref_labels(b, name)):
+        ra[la] = ra.get(la, frozenset([la])) ^ rb.get(lb, frozenset([lb]))
+
+  def _check_init(self, q:Q1) -> None:
+    if self._layers0.get(q) is None:
+      raise ValueError(f"Surface25u: qubit {q} was not initialized")
 
   def map_op(self, op: FTOp[Q1]) -> FTCircuit[Q2]:
     qmap = self.qmap
@@ -372,21 +588,18 @@ class Surface25u[Q1, Q2](Map[Q1, Q2]):
       q = op.qubit
       qubits, syndrome = qmap[q]
       layers0[q] = self._next_layer()
-      c, ml = surface25u_detect(qubits, [syndrome], layers0[q])
-      self._mls[q].append(ml)
+      c, _ = surface25u_detect(qubits, [syndrome], layers0[q])
       acc.append(c)
     elif isinstance(op, FTErr):
       q = op.qubit
-      if layers0.get(q) is None:
-        raise ValueError(f"Surface25u: qubit {q} was not initialized")
+      self._check_init(q)
       qubits,_ = qmap[q]
       equbit = qubits[op.phys % len(qubits)]
       acc.append(FTOps([FTPrim(op.name, [equbit])]))
-      acc.append(self._error_correction_cycle(q, layers0[q]))
+      acc.append(self._error_correction_cycle([q]))
     elif isinstance(op, FTPrim):
       for q in op.qubits:
-        if layers0.get(q) is None:
-          raise ValueError(f"Surface25u: qubit {q} was not initialized")
+        self._check_init(q)
         qubits,_ = qmap[q]
         if op.name == OpName.I:
           pass
@@ -396,7 +609,20 @@ class Surface25u[Q1, Q2](Map[Q1, Q2]):
           acc.append(FTOps([FTPrim(op.name, [qubits[5], qubits[6], qubits[7]])]))
         else:
           raise ValueError(f"Surface25u: Unsupported logical operation: {op}")
-        acc.append(self._error_correction_cycle(q, layers0[q]))
+      acc.append(self._error_correction_cycle(list(op.qubits)))
+    elif isinstance(op, FTCtrl):
+      if not (isinstance(op.op, FTPrim) and op.op.name == OpName.X):
+        raise ValueError(f"Surface25u: Unsupported controlled operation: {op}")
+      c = op.control
+      self._check_init(c)
+      for t in op.op.qubits:
+        self._check_init(t)
+        if t == c:
+          raise ValueError(f"Surface25u: Control qubit {t} is also a target")
+        acc.append(FTOps([FTCtrl(a, FTPrim(OpName.X, [b]))
+                          for a, b in zip(qmap[c][0], qmap[t][0])]))
+        self._cnot_refs(c, t)
+      acc.append(self._error_correction_cycle([c, *op.op.qubits]))
     else:
       raise ValueError(f"Surface25u: Unsupported operation: {op}")
 
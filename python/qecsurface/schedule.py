@@ -0,0 +1,169 @@
+""" Scheduling of FTCircuits. The tape of operations is turned into a dependency DAG, where an
+operation depends on the earlier operations it does not commute with. Two operations commute on a
+shared qubit if both act on it diagonally in the same basis: X gates and CNOT targets act in the X
+basis, Z gates, CNOT controls and CZs act in the Z basis. Classically conditioned operations also
+depend on the measurements they read. The DAG gives ASAP/ALAP moments, the depth and the critical
+path. Operations are then packed into moments acting on disjoint qubits, which backends could
+execute layer by layer.
+"""
+import numpy as np
+from dataclasses import dataclass
+from functools import reduce
+
+from .type import *
+
+# Dependency DAG {{{
+
+def _roles[Q](op:FTOp[Q]) -> dict[Q,str]:
+  """ Return the action of the operation on every its qubit: 'x' or 'z' for operations diagonal in
+  the X or Z basis and '*' otherwise. """
+  if isinstance(op, FTPrim):
+    role = {OpName.X:'x', OpName.Z:'z'}.get(op.name, '*')
+    return {q:role for q in op.qubits}
+  elif isinstance(op, FTCtrl):
+    if not isinstance(op.op, FTPrim):
+      raise ValueError(f"Unsupported nested op: {op.op}")
+    role = {OpName.X:'x', OpName.Z:'z'}.get(op.op.name, '*')
+    return {**{q:role for q in op.op.qubits}, op.control:'z' if role != '*' else '*'}
+  elif isinstance(op, FTCond):
+    return _roles(op.op)
+  elif isinstance(op, (FTMeasure, FTInit, FTErr)):
+    return {op.qubit:'*'}
+  else:
+    raise ValueError(f"Unrecognized FTOp: {op}")
+
+
+def _preds[Q](ops:list[FTOp[Q]]) -> list[list[int]]:
+  """ Build the predecessor lists of the dependency DAG. Every qubit keeps the latest block of
+  mutually commuting operations and the operations preceding that block. """
+  blocks:dict[Q,tuple[str,list[int],list[int]]] = {}
+  writers:dict[MeasureLabel[Q],int] = {}
+  preds = []
+  for j, op in enumerate(ops):
+    ps = set()
+    for q, role in _roles(op).items():
+      brole, members, before = blocks.get(q, ('*', [], []))
+      if role != '*' and role == brole:
+        ps.update(before)
+        members.append(j)
+      else:
+        ps.update(members)
+        blocks[q] = (role, [j], members)
+    if isinstance(op, FTCond):
+      if isinstance(op.cond, CExpr):
+        ps.update(writers[l] for l in cexpr_labels(op.cond) if l in writers)
+      else:
+        ps.update(writers.values())
+    if isinstance(op, FTMeasure):
+      writers[op.label] = j
+    preds.append(sorted(ps))
+  return preds
+
+
+@dataclass
+class Schedule[Q]:
+  """ Schedule of the flattened operations `ops`. `preds` are the dependencies of every operation,
+  `asap` and `alap` are the earliest and the latest moments allowed by the dependencies alone, and
+  `moment` is the moment assigned to every operation so that operations of a moment act on
+  disjoint qubits. """
+  ops:list[FTOp[Q]]
+  preds:list[list[int]]
+  asap:np.ndarray
+  alap:np.ndarray
+  moment:np.ndarray
+
+  @property
+  def depth(self) -> int:
+    """ Number of moments of the packed schedule. """
+    return int(self.moment.max()) + 1 if len(self.ops) > 0 else 0
+
+  def slack(self) -> np.ndarray:
+    return self.alap - self.asap
+
+  def critical_path(self) -> list[int]:
+    """ Return the indices of operations forming a longest dependency chain. """
+    if len(self.ops) == 0:
+      return []
+    path = [int(np.argmax(self.asap))]
+    while self.preds[path[-1]]:
+      path.append(max(self.preds[path[-1]], key=lambda p: self.asap[p]))
+    return path[::-1]
+
+  def layers(self) -> list[FTOps[Q]]:
+    """ Return the moments as lists of operations acting on disjoint qubits. """
+    acc = [[] for _ in range(self.depth)]
+    for op, m in zip(self.ops, self.moment):
+      acc[m].append(op)
+    return [FTOps(l) for l in acc]
+
+  def to_circuit(self) -> FTCircuit[Q]:
+    """ Return the moment-structured circuit, a composition of the `layers`. """
+    ls = self.layers()
+    return reduce(FTComp, ls) if ls else FTOps([])
+
+
+def schedule[Q](c:FTCircuit[Q]) -> Schedule[Q]:
+  """ Build the dependency DAG of the circuit `c` and schedule its operations. """
+  ops = list(iter_ops(c))
+  preds = _preds(ops)
+  n = len(ops)
+  asap = np.zeros(n, dtype=np.int64)
+  for j in range(n):
+    asap[j] = max((asap[p] + 1 for p in preds[j]), default=0)
+  last = int(asap.max()) if n > 0 else 0
+  alap = np.full(n, last, dtype=np.int64)
+  for j in reversed(range(n)):
+    for p in preds[j]:
+      alap[p] = min(alap[p], alap[j] - 1)
+  moment = np.zeros(n, dtype=np.int64)
+  busy:dict[int,set[Q]] = {}
+  for j, op in enumerate(ops):
+    qs = set(_roles(op))
+    m = max((moment[p] + 1 for p in preds[j]), default=0)
+    while busy.get(m, set()) & qs:
+      m += 1
+    busy.setdefault(m, set()).update(qs)
+    moment[j] = m
+  return Schedule(ops, preds, asap, alap, moment)
+
+
+def depth[Q](c:FTCircuit[Q]) -> int:
+  """ Return the number of moments of the scheduled circuit `c`. """
+  return schedule(c).depth
+
+# }}}
+
+# Ancilla remapping {{{
+
+def _rename[Q](op:FTOp[Q], old:Q, new:Q) -> FTOp[Q]:
+  def _q(q):
+    return new if q == old else q
+  if isinstance(op, FTPrim):
+    return FTPrim(op.name, [_q(q) for q in op.qubits])
+  elif isinstance(op, FTCtrl):
+    return FTCtrl(_q(op.control), _rename(op.op, old, new))
+  elif isinstance(op, FTCond):
+    return FTCond(op.cond, _rename(op.op, old, new))
+  elif isinstance(op, FTMeasure):
+    return FTMeasure(_q(op.qubit), op.label)
+  elif isinstance(op, FTInit):
+    return FTInit(_q(op.qubit), op.alpha, op.beta)
+  elif isinstance(op, FTErr):
+    return FTErr(_q(op.qubit), op.phys, op.name)
+  else:
+    raise ValueError(f"Unrecognized FTOp: {op}")
+
+
+def split_ancilla[Q](c:FTCircuit[Q], qubit:Q, ancillas:list[Q]) -> FTOps[Q]:
+  """ Remap the re-used syndrome `qubit` onto the `ancillas`. Measurements reset the qubit to |0>,
+  so every segment of operations ending with a measurement of `qubit` could run on a fresh ancilla.
+  Segments are assigned to the `ancillas` round-robin, which removes the false dependencies between
+  the stabilizer tests sharing the syndrome qubit. """
+  acc, k = [], 0
+  for op in iter_ops(c):
+    acc.append(_rename(op, qubit, ancillas[k % len(ancillas)]))
+    if isinstance(op, FTMeasure) and op.qubit == qubit:
+      k += 1
+  return FTOps(acc)
+
+# }}}
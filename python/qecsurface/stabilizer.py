@@ -0,0 +1,329 @@
+""" Stabilizer (CHP) simulation backend for FTCircuits. The circuits of `qecsurface.qeccs` only use
+Clifford operations, mid-circuit measurements with reset and classically conditioned Paulis, so they
+could be simulated with the Aaronson-Gottesman tableau [1] in polynomial time instead of the dense
+statevector used by `qecsurface.pennylane`.
+
+[1] - https://arxiv.org/abs/quant-ph/0406196
+"""
+import numpy as np
+from dataclasses import dataclass, field
+
+from .type import *
+from .noise import Effect, NoiseEvents, sample_noise
+
+# Tableau {{{
+
+def _g(x1, z1, x2, z2):
+  """ The phase exponent (of `i`) collected while multiplying Pauli matrices (x1,z1) and (x2,z2),
+  computed element-wise. """
+  x1, z1, x2, z2 = [a.astype(np.int8) for a in (x1, z1, x2, z2)]
+  return (
+    (x1 & z1) * (z2 - x2) +
+    (x1 & (1 - z1)) * (z2 * (2 * x2 - 1)) +
+    ((1 - x1) & z1) * (x2 * (1 - 2 * z2))
+  )
+
+
+@dataclass
+class Tableau:
+  """ Aaronson-Gottesman tableau of `n` qubits. Rows `0..n-1` are destabilizers, rows `n..2n-1`
+  are stabilizers and the row `2n` is a scratch space. The initial state is |0...0>. """
+  n:int
+  x:np.ndarray = field(init=False)
+  z:np.ndarray = field(init=False)
+  r:np.ndarray = field(init=False)
+
+  def __post_init__(self):
+    n = self.n
+    self.x = np.zeros((2*n+1, n), dtype=np.uint8)
+    self.z = np.zeros((2*n+1, n), dtype=np.uint8)
+    self.r = np.zeros(2*n+1, dtype=np.uint8)
+    self.x[np.arange(n), np.arange(n)] = 1
+    self.z[np.arange(n, 2*n), np.arange(n)] = 1
+
+  def h(self, a:int) -> None:
+    x, z = self.x, self.z
+    self.r ^= x[:,a] & z[:,a]
+    x[:,a], z[:,a] = z[:,a].copy(), x[:,a].copy()
+
+  def s(self, a:int) -> None:
+    x, z = self.x, self.z
+    self.r ^= x[:,a] & z[:,a]
+    z[:,a] ^= x[:,a]
+
+  def px(self, a:int) -> None:
+    self.r ^= self.z[:,a]
+
+  def pz(self, a:int) -> None:
+    self.r ^= self.x[:,a]
+
+  def cnot(self, a:int, b:int) -> None:
+    x, z = self.x, self.z
+    self.r ^= x[:,a] & z[:,b] & (x[:,b] ^ z[:,a] ^ 1)
+    x[:,b] ^= x[:,a]
+    z[:,a] ^= z[:,b]
+
+  def cz(self, a:int, b:int) -> None:
+    self.h(b)
+    self.cnot(a, b)
+    self.h(b)
+
+  def _rowsum(self, h, i:int) -> None:
+    """ Left-multiply rows `h` (an index or an index array) by the row `i`. """
+    x, z, r = self.x, self.z, self.r
+    ph = 2*r[h].astype(np.int16) + 2*int(r[i]) + _g(x[i], z[i], x[h], z[h]).sum(axis=-1)
+    r[h] = (ph % 4 != 0)
+    x[h] ^= x[i]
+    z[h] ^= z[i]
+
+  def measure(self, a:int, rng:np.random.Generator) -> int:
+    """ Measure qubit `a` in the computational basis, return the outcome. """
+    n, x = self.n, self.x
+    ps = np.flatnonzero(x[n:2*n, a])
+    if len(ps) > 0:
+      p = n + ps[0]
+      rows = np.flatnonzero(x[:2*n, a])
+      rows = rows[rows != p]
+      if len(rows) > 0:
+        self._rowsum(rows, p)
+      self.x[p-n], self.z[p-n], self.r[p-n] = self.x[p], self.z[p], self.r[p]
+      self.x[p] = 0
+      self.z[p] = 0
+      self.z[p, a] = 1
+      self.r[p] = rng.integers(2)
+      return int(self.r[p])
+    else:
+      s = 2*n
+      self.x[s] = 0
+      self.z[s] = 0
+      self.r[s] = 0
+      for i in np.flatnonzero(x[:n, a]):
+        self._rowsum(s, i + n)
+      return int(self.r[s])
+
+  def reset(self, a:int, rng:np.random.Generator) -> None:
+    """ Reset qubit `a` to |0>. """
+    if self.measure(a, rng) == 1:
+      self.px(a)
+
+  def expectation(self, px:np.ndarray, pz:np.ndarray) -> int:
+    """ Return the expectation value (+1, -1, or 0 if random) of a Hermitian Pauli operator given by
+    its X and Z bit vectors. """
+    n = self.n
+    px = np.asarray(px, dtype=np.uint8)
+    pz = np.asarray(pz, dtype=np.uint8)
+    anti = ((self.x[n:2*n] & pz) ^ (self.z[n:2*n] & px)).sum(axis=1) % 2
+    if anti.any():
+      return 0
+    # The operator is in the stabilizer group: find its decomposition through the destabilizers.
+    s = 2*n
+    self.x[s] = 0
+    self.z[s] = 0
+    self.r[s] = 0
+    coef = ((self.x[:n] & pz) ^ (self.z[:n] & px)).sum(axis=1) % 2
+    for i in np.flatnonzero(coef):
+      self._rowsum(s, i + n)
+    # The product of generators is Hermitian, compare it with the requested operator up to sign.
+    assert (self.x[s] == px).all() and (self.z[s] == pz).all()
+    return -1 if self.r[s] else 1
+
+# }}}
+
+# Simulator {{{
+
+def prep_gates(op:FTInit) -> list[str]:
+  """ Return the sequence of gates ('x', 'h' or 's') preparing the single-qubit stabilizer state of
+  `op` from |0>. """
+  v = np.array([op.alpha, op.beta], dtype=complex)
+  v = v / np.linalg.norm(v)
+  v = v * (np.conj(v[0]) / abs(v[0]) if abs(v[0]) > 1e-9 else np.conj(v[1]) / abs(v[1]))
+  h = 1 / np.sqrt(2)
+  states = [
+    ([1, 0], []), ([0, 1], ['x']),
+    ([h, h], ['h']), ([h, -h], ['x','h']),
+    ([h, 1j*h], ['h','s']), ([h, -1j*h], ['x','h','s']),
+  ]
+  for s, gates in states:
+    if np.allclose(v, s, atol=1e-9):
+      return gates
+  raise ValueError(f"FTInit ({op}) does not prepare a stabilizer state")
+
+@dataclass
+class StabilizerSim[Q]:
+  """ Stateful stabilizer simulator of FTCircuits acting on `qubits`. Measurement outcomes are
+  collected into `msms`. """
+  qubits:list[Q]
+  seed:int|None = None
+  msms:dict[MeasureLabel[Q],int] = field(default_factory=dict)
+  tableau:Tableau = field(init=False)
+  rng:np.random.Generator = field(init=False)
+  index:dict[Q,int] = field(init=False)
+
+  def __post_init__(self):
+    self.index = {q:i for i,q in enumerate(self.qubits)}
+    self.tableau = Tableau(len(self.qubits))
+    self.rng = np.random.default_rng(self.seed)
+
+  def _init(self, op:FTInit[Q]) -> None:
+    t, a = self.tableau, self.index[op.qubit]
+    t.reset(a, self.rng)
+    for g in prep_gates(op):
+      {'x':t.px, 'h':t.h, 's':t.s}[g](a)
+
+  def _prim(self, op:FTPrim[Q]) -> None:
+    t = self.tableau
+    for q in op.qubits:
+      a = self.index[q]
+      if op.name == OpName.X:
+        t.px(a)
+      elif op.name == OpName.Z:
+        t.pz(a)
+      elif op.name == OpName.H:
+        t.h(a)
+      elif op.name == OpName.I:
+        pass
+      else:
+        raise ValueError(f"Unsupported primary operation: {op.name}")
+
+  def _ctrl(self, op:FTCtrl[Q]) -> None:
+    if not isinstance(op.op, FTPrim):
+      raise ValueError(f"Unsupported nested op: {op.op}")
+    t, c = self.tableau, self.index[op.control]
+    for q in op.op.qubits:
+      if op.op.name == OpName.X:
+        t.cnot(c, self.index[q])
+      elif op.op.name == OpName.Z:
+        t.cz(c, self.index[q])
+      else:
+        raise ValueError(f"Unsupported nested op: {op.op}")
+
+  def apply(self, op:FTOp[Q]) -> None:
+    """ Apply a single operation to the simulator state. """
+    if isinstance(op, FTPrim):
+      self._prim(op)
+    elif isinstance(op, FTInit):
+      self._init(op)
+    elif isinstance(op, FTMeasure):
+      a = self.index[op.qubit]
+      m = self.tableau.measure(a, self.rng)
+      if m == 1:
+        self.tableau.px(a)
+      self.msms[op.label] = m
+    elif isinstance(op, FTCtrl):
+      self._ctrl(op)
+    elif isinstance(op, FTCond):
+      if op.cond(self.msms):
+        self.apply(op.op)
+    elif isinstance(op, FTErr):
+      raise ValueError(f"FTErr ({op}) does not have an explicit representation in the stabilizer "
+                       f"simulator")
+    else:
+      raise ValueError(f"Unrecognized FTOp: {op}")
+
+  def apply_row(self, cc:CompiledCircuit[Q], i:int, force:bool=False) -> bool:
+    """ Apply the `i`-th operation of the compiled circuit `cc`. Conditions are ignored if `force`
+    is set. Return the value of the operation's condition. """
+    c = cc.cond[i]
+    if c != -1 and not force:
+      if not cc.conds[c](self.msms):
+        return False
+    t, k = self.tableau, cc.kind[i]
+    tgts = [self.index[cc.qubits[q]] for q in cc.row_targets(i)]
+    if k == OpKind.PRIM:
+      name = cc.name[i]
+      for a in tgts:
+        if name == OpName.X.value:
+          t.px(a)
+        elif name == OpName.Z.value:
+          t.pz(a)
+        elif name == OpName.H.value:
+          t.h(a)
+        elif name != OpName.I.value:
+          raise ValueError(f"Unsupported primary operation: {OpName(name)}")
+    elif k == OpKind.CTRL:
+      ctrl, name = self.index[cc.qubits[cc.control[i]]], cc.name[i]
+      for a in tgts:
+        if name == OpName.X.value:
+          t.cnot(ctrl, a)
+        elif name == OpName.Z.value:
+          t.cz(ctrl, a)
+        else:
+          raise ValueError(f"Unsupported nested op: {OpName(name)}")
+    elif k == OpKind.MEASURE:
+      m = t.measure(tgts[0], self.rng)
+      if m == 1:
+        t.px(tgts[0])
+      self.msms[cc.labels[cc.label[i]]] = m
+    elif k == OpKind.INIT:
+      alpha, beta = cc.amps[cc.param[i]]
+      self._init(FTInit(cc.qubits[cc.row_targets(i)[0]], alpha, beta))
+    elif k == OpKind.ERR:
+      raise ValueError(f"FTErr does not have an explicit representation in the stabilizer "
+                       f"simulator")
+    else:
+      raise ValueError(f"Unrecognized OpKind: {k}")
+    return True
+
+  def apply_noise(self, cc:CompiledCircuit[Q], noise:NoiseEvents, i:int) -> None:
+    """ Apply the sampled noise acting after the `i`-th operation of `cc`. """
+    sl = noise.row(i)
+    for e, idx in zip(noise.effect[sl], noise.index[sl]):
+      if e == Effect.X:
+        self.tableau.px(self.index[cc.qubits[idx]])
+      elif e == Effect.Z:
+        self.tableau.pz(self.index[cc.qubits[idx]])
+      else:
+        label = cc.labels[idx]
+        self.msms[label] = 1 - self.msms[label]
+
+  def run(self, c:FTCircuit[Q]|CompiledCircuit[Q]) -> dict[MeasureLabel[Q],int]:
+    """ Apply all operations of the circuit `c`, return the measurement outcomes. Noise of the
+    compiled circuits annotated by a `NoiseModel` is sampled before the run. """
+    if isinstance(c, CompiledCircuit):
+      noise = sample_noise(c, 1, self.rng) if c.noise is not None else None
+      for i in range(len(c)):
+        self.apply_row(c, i)
+        if noise is not None:
+          self.apply_noise(c, noise, i)
+    else:
+      def _traverse_op(op:FTOp[Q], acc:None) -> None:
+        self.apply(op)
+      traverse_circuit(c, _traverse_op, None)
+    return self.msms
+
+  def expectation(self, paulis:list[FTPrim[Q]]) -> int:
+    """ Return the expectation value of a Pauli string given as a list of X and Z `FTPrim`s. The
+    result is +1 or -1 for determined observables and 0 for random ones. """
+    n = len(self.qubits)
+    px = np.zeros(n, dtype=np.uint8)
+    pz = np.zeros(n, dtype=np.uint8)
+    for p in paulis:
+      for q in p.qubits:
+        if p.name == OpName.X:
+          px[self.index[q]] ^= 1
+        elif p.name == OpName.Z:
+          pz[self.index[q]] ^= 1
+        else:
+          raise ValueError(f"Expected a Pauli operation, got {p}")
+    if (px & pz).any():
+      raise ValueError(f"Expected a Pauli string without overlapping X and Z, got {paulis}")
+    return self.tableau.expectation(px, pz)
+
+# }}}
+
+def run_stabilizer[Q](c:FTCircuit[Q]|CompiledCircuit[Q],
+                      seed:int|None=None) -> dict[MeasureLabel[Q],int]:
+  """ Simulate the circuit `c` with the stabilizer tableau. Return the mid-circuit measurement
+  samples as a dictionary, similarly to `to_pennylane_mcm`. """
+  qubits = c.qubits if isinstance(c, CompiledCircuit) else sorted(labels(c))
+  return StabilizerSim(qubits, seed).run(c)
+
+
+def run_expectations[Q](c:FTCircuit[Q]|CompiledCircuit[Q], qubits:list[Q],
+                        probes:list[list[FTPrim[Q]]],
+                        seed:int|None=None) -> tuple[dict[MeasureLabel[Q],int],list[int]]:
+  """ Simulate the circuit `c` on `qubits` with the stabilizer tableau. Return the measurement
+  samples and the expectation values of the Pauli strings `probes` in the final state. """
+  sim = StabilizerSim(qubits, seed)
+  sim.run(c)
+  return sim.msms, [sim.expectation(p) for p in probes]
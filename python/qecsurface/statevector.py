@@ -0,0 +1,112 @@
+""" Numeric state vector simulation of unitary FTCircuits (`FTPrim` and `FTCtrl` operations). The
+state of `n` qubits is kept as an `(2,)*n + (k,)` array holding `k` state vectors, qubit `i` being
+the axis `i`, so the first qubit is the most significant one as in `to_sympy`. Gates update the
+array in place through strided views, so a gate costs `O(k 2^n)` operations and no operator matrix
+is ever built. Unitaries are obtained by evolving the `2^n` basis states, equivalence of larger
+circuits is checked on random states.
+"""
+import numpy as np
+
+from .type import *
+
+SQRT1_2 = 1 / np.sqrt(2)
+
+
+def _default_qubits[Q](c:FTCircuit[Q]) -> list[Q]:
+  ls = labels(c)
+  if all(isinstance(q, int) for q in ls):
+    return list(range(max(ls) + 1)) if ls else []
+  return sorted(ls)
+
+
+def apply_gates[Q](c:FTCircuit[Q], psi:np.ndarray, qubits:list[Q],
+                   sqrt1_2=SQRT1_2) -> np.ndarray:
+  """ Apply the operations of the circuit `c` to the `(2,)*n + (k,)` array of state vectors `psi`
+  in place. Return `psi`. Exact amplitudes could be used with an object array and a symbolic
+  `sqrt1_2`. """
+  n = len(qubits)
+  index = {q:i for i,q in enumerate(qubits)}
+
+  def _sl(a:int, v:int, ctrl:int|None) -> tuple:
+    """ Strided view index of the amplitudes with the qubit `a` set to `v` and the control set. """
+    idx = [slice(None)] * (n + 1)
+    idx[a] = v
+    if ctrl is not None:
+      idx[ctrl] = 1
+    return tuple(idx)
+
+  def _gate(name:OpName, a:int, ctrl:int|None) -> None:
+    if a == ctrl:
+      raise ValueError(f"Control qubit {qubits[a]} is also a target")
+    s0, s1 = _sl(a, 0, ctrl), _sl(a, 1, ctrl)
+    if name == OpName.X:
+      tmp = psi[s0].copy()
+      psi[s0] = psi[s1]
+      psi[s1] = tmp
+    elif name == OpName.Z:
+      psi[s1] *= -1
+    elif name == OpName.H and ctrl is None:
+      psi[s0] += psi[s1]
+      psi[s1] *= -2
+      psi[s1] += psi[s0]
+      psi[...] *= sqrt1_2
+    elif name != OpName.I:
+      raise ValueError(f"Unsupported operation: {name} (control {ctrl})")
+
+  for op in iter_ops(c):
+    if isinstance(op, FTPrim):
+      for q in op.qubits:
+        _gate(op.name, index[q], None)
+    elif isinstance(op, FTCtrl):
+      if not isinstance(op.op, FTPrim):
+        raise ValueError(f"Unsupported nested op: {op.op}")
+      for q in op.op.qubits:
+        _gate(op.op.name, index[q], index[op.control])
+    else:
+      raise ValueError(f"Only unitary FTPrim and FTCtrl operations are supported, got {op}")
+  return psi
+
+
+def to_statevector[Q](c:FTCircuit[Q], psi0:np.ndarray|None=None,
+                      qubits:list[Q]|None=None) -> np.ndarray:
+  """ Return the state vector obtained by applying the circuit `c` to `psi0` (the all-zero state by
+  default). Qubits default to `0..max(labels)` for integer labels, as in `to_sympy`. """
+  qubits = _default_qubits(c) if qubits is None else list(qubits)
+  n = len(qubits)
+  if psi0 is None:
+    psi = np.zeros((2,)*n + (1,), dtype=np.complex128)
+    psi[(0,)*n] = 1
+  else:
+    psi = np.array(psi0, dtype=np.complex128).reshape((2,)*n + (1,))
+  return apply_gates(c, psi, qubits).reshape(2**n)
+
+
+def to_unitary[Q](c:FTCircuit[Q], qubits:list[Q]|None=None, symbolic:bool=False):
+  """ Return the `2^n x 2^n` unitary of the circuit `c` as a NumPy array. Operations are composed in
+  the order of their application. A SymPy matrix with exact entries in the same layout is returned
+  if `symbolic` is set. """
+  qubits = _default_qubits(c) if qubits is None else list(qubits)
+  n = len(qubits)
+  if symbolic:
+    from sympy import Integer, Matrix, sqrt
+    psi = np.vectorize(Integer, otypes=[object])(np.eye(2**n, dtype=np.int64))
+    u = apply_gates(c, psi.reshape((2,)*n + (2**n,)), qubits, 1/sqrt(2))
+    return Matrix(u.reshape(2**n, 2**n))
+  psi = np.eye(2**n, dtype=np.complex128).reshape((2,)*n + (2**n,))
+  return apply_gates(c, psi, qubits).reshape(2**n, 2**n)
+
+
+def equivalent[Q](c1:FTCircuit[Q], c2:FTCircuit[Q], qubits:list[Q]|None=None, trials:int=2,
+                  seed:int|None=0, atol:float=1e-9) -> bool:
+  """ Check that the circuits `c1` and `c2` implement the same unitary up to a global phase. The
+  circuits are applied to `trials` random states, which distinguishes different unitaries with
+  probability one. """
+  qubits = _default_qubits(FTComp(c1, c2)) if qubits is None else list(qubits)
+  n = len(qubits)
+  rng = np.random.default_rng(seed)
+  psi = rng.normal(size=(2**n, trials)) + 1j*rng.normal(size=(2**n, trials))
+  psi /= np.linalg.norm(psi, axis=0)
+  a = apply_gates(c1, psi.copy().reshape((2,)*n + (trials,)), qubits).reshape(2**n, trials)
+  b = apply_gates(c2, psi.reshape((2,)*n + (trials,)), qubits).reshape(2**n, trials)
+  phase = np.vdot(b[:, 0], a[:, 0])
+  return bool(abs(abs(phase) - 1) < atol and np.allclose(a, phase * b, atol=atol))
@@ -0,0 +1,110 @@
+""" On-disk storage of mid-circuit measurement samples. A file consists of a header followed by the
+bit-packed rows of `FrameSamples.packed`, one row per shot. The header is the magic string, the
+length of the JSON label index and the index itself, padded to a multiple of 64 bytes. The number
+of shots is not stored, it follows from the file size, so the rows could be appended by a streaming
+writer and memory-mapped by readers while the file grows.
+"""
+import os
+import json
+import struct
+import numpy as np
+from typing import Iterator
+
+from .type import *
+from .frame import FrameSamples, sample_frames
+
+MAGIC = b"QECSB8\x00\x01"
+
+
+def _encode_label(v):
+  if isinstance(v, OpName):
+    return {'op': v.name}
+  if isinstance(v, tuple):
+    return {'tuple': [_encode_label(x) for x in v]}
+  if isinstance(v, (int, str)):
+    return v
+  raise ValueError(f"Unsupported label component: {v}")
+
+
+def _decode_label(v):
+  if isinstance(v, dict):
+    if 'op' in v:
+      return OpName[v['op']]
+    return tuple(_decode_label(x) for x in v['tuple'])
+  return v
+
+
+class SamplesWriter[Q]:
+  """ Streaming writer of packed measurement samples. Rows are appended to the file `path` as they
+  are written, so the memory footprint does not depend on the total number of shots. """
+
+  def __init__(self, path:str, labels:list[MeasureLabel[Q]]):
+    self.labels = list(labels)
+    self.nbytes = (len(self.labels) + 7) // 8
+    self.shots = 0
+    index = json.dumps([_encode_label(l) for l in self.labels]).encode()
+    size = len(MAGIC) + 4 + len(index)
+    self._f = open(path, 'wb')
+    self._f.write(MAGIC + struct.pack('<I', len(index)) + index + b' ' * (-size % 64))
+    self._f.flush()
+
+  def write(self, samples:FrameSamples[Q]|np.ndarray) -> None:
+    """ Append the packed rows of `samples`. """
+    packed = samples.packed if isinstance(samples, FrameSamples) else samples
+    if isinstance(samples, FrameSamples) and samples.labels != self.labels:
+      raise ValueError("Samples labels do not match the labels of the file")
+    if packed.ndim != 2 or packed.shape[1] != self.nbytes or packed.dtype != np.uint8:
+      raise ValueError(f"Expected packed uint8 rows of {self.nbytes} bytes, got {packed.shape}")
+    self._f.write(np.ascontiguousarray(packed).tobytes())
+    self._f.flush()
+    self.shots += packed.shape[0]
+
+  def close(self) -> None:
+    self._f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def _header(path:str) -> tuple[list[MeasureLabel],int]:
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f"Not a samples file: {path}")
+    n, = struct.unpack('<I', f.read(4))
+    labels = [_decode_label(l) for l in json.loads(f.read(n))]
+  size = len(MAGIC) + 4 + n
+  return labels, size + (-size % 64)
+
+
+def load_samples(path:str) -> FrameSamples:
+  """ Memory-map the samples file `path`. Rows are read from disk on access. """
+  labels, offset = _header(path)
+  nbytes = (len(labels) + 7) // 8
+  shots = (os.path.getsize(path) - offset) // nbytes if nbytes > 0 else 0
+  if shots == 0:
+    return FrameSamples(0, labels, np.zeros((0, nbytes), dtype=np.uint8))
+  packed = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(shots, nbytes))
+  return FrameSamples(shots, labels, packed)
+
+
+def iter_samples(path:str, chunk:int=2**16) -> Iterator[FrameSamples]:
+  """ Iterate over the samples file `path` in chunks of `chunk` shots. """
+  s = load_samples(path)
+  for start in range(0, s.shots, chunk):
+    rows = s.packed[start:start+chunk]
+    yield FrameSamples(len(rows), s.labels, rows)
+
+
+def sample_to_file[Q](c:FTCircuit[Q]|CompiledCircuit[Q], shots:int, path:str,
+                      seed:int|None=None, batch:int=2**16) -> int:
+  """ Sample `shots` executions of the circuit `c` with the Pauli-frame sampler and stream the
+  outcomes into the file `path` batch by batch. Return the number of shots written. """
+  cc = c if isinstance(c, CompiledCircuit) else compile_circuit(c)
+  seeds = np.random.SeedSequence(seed).spawn((shots + batch - 1) // batch)
+  with SamplesWriter(path, cc.labels) as w:
+    for b, start in enumerate(range(0, shots, batch)):
+      w.write(sample_frames(cc, min(batch, shots - start), seed=seeds[b], batch=batch))
+    return w.shots
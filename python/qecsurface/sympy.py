@@ -4,14 +4,16 @@
 # function handles both FTOps and composite FTComp circuits, focusing specifically on FTPrim
 # operations.
 
-from sympy import Matrix, eye, zeros, tensorproduct
+from sympy import Matrix, eye, tensorproduct
 from sympy.physics.quantum import Dagger
 from functools import reduce
 
 from qecsurface.type import *
+from qecsurface.gf2 import check_matrix as gf2_check_matrix
 
 def to_sympy[Q](circuit: FTCircuit[Q]) -> Matrix:
-  """ Convert FTCircuit into a unitary matrix in Sympy. Only handles FTPrim operations. """
+  """ Convert FTCircuit into a unitary matrix in Sympy. Only handles FTPrim operations. Numeric
+  unitaries and equivalence checks of larger circuits are provided by `qecsurface.statevector`. """
 
   num_qubits = max(labels(circuit))+1
 
@@ -49,27 +51,14 @@ def to_sympy[Q](circuit: FTCircuit[Q]) -> Matrix:
 
 
 def build_check_matrix(stabilizers, zero_labels=None):
+  """ Build the check matrix of X- and Z-type stabilizers as a SymPy matrix. Columns of the
+  `zero_labels` qubits are added even if no stabilizer acts on them. The matrix is assembled by
+  `qecsurface.gf2.check_matrix`, which should be used directly for the numeric analysis. """
   zero_labels = zero_labels or set()
-  # Initialize a zero matrix with dimensions (num_stabilizers, 2 * num_unique_labels)
-  unique_labels = set(label for op in stabilizers for label in op.qubits) | set(zero_labels)
-  num_stabilizers = len(stabilizers)
-  num_unique_labels = len(unique_labels)
-
   # Map qubit labels to matrix column indices
-  label_to_index = {label: idx for idx, label in enumerate(sorted(unique_labels))}
-
-  check_matrix = zeros(num_stabilizers, 2 * num_unique_labels)
-
-  for i, op in enumerate(stabilizers):
-    if isinstance(op, FTPrim):
-      if op.name == OpName.X:
-        for q in op.qubits:
-          col_index = label_to_index[q]
-          check_matrix[i, col_index] = 1  # Set X part
-      elif op.name == OpName.Z:
-        for q in op.qubits:
-          col_index = label_to_index[q] + num_unique_labels
-          check_matrix[i, col_index] = 1  # Set Z part
-
-  return check_matrix
-
+  unique_labels = set(label for op in stabilizers for label in op.qubits) | set(zero_labels)
+  # Operations other than X and Z stabilizers result in zero rows
+  rows = [op if isinstance(op, FTPrim) and op.name in (OpName.X, OpName.Z) else FTPrim(OpName.X, [])
+          for op in stabilizers]
+  check_matrix, _ = gf2_check_matrix(rows, sorted(unique_labels))
+  return Matrix(check_matrix.to_dense().tolist())
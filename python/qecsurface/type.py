@@ -2,9 +2,13 @@
 The DSL is designed with the idea of enabling nested error correction codes. Most of the types
 accept `Q` which is a type of qubit label, typically `int`.
 """
-from typing import Generic, Union, Callable
-from dataclasses import dataclass
-from enum import Enum
+import numpy as np
+from typing import Generic, Union, Callable, Iterator, Hashable, Any
+from types import CodeType, FunctionType, BuiltinFunctionType, MethodType, ModuleType
+from dataclasses import dataclass, field
+from enum import Enum, IntEnum
+from collections import OrderedDict
+from functools import partial, reduce
 
 # Quantum operation definitions {{{
 
@@ -53,8 +57,9 @@ class FTMeasure[Q]:
 
 @dataclass
 class FTCond[Q]:
-  """ A quantum operation applied if a classical condition is met. """
-  cond:Callable[[dict[MeasureLabel[Q],int]],bool]
+  """ A quantum operation applied if a classical condition is met. The condition is either a
+  `CExpr` or, as a fallback, an arbitrary callable taking the measurement outcomes. """
+  cond:"CExpr[Q]|Callable[[dict[MeasureLabel[Q],int]],bool]"
   op:FTOp[Q]
 
 @dataclass
@@ -66,6 +71,128 @@ class FTErr[Q]:
 
 # }}}
 
+# Classical expressions {{{
+
+class CExpr[Q]:
+  """ Base class of classical expressions over mid-circuit measurement outcomes. Expressions are
+  immutable and hashable. Calling an expression on a dictionary of outcomes evaluates it, so it
+  could be used wherever a callable `FTCond` condition is expected. """
+
+  def __call__(self, msms):
+    return cexpr_eval(self, msms)
+
+  def __and__(self, other:"CExpr[Q]") -> "CExpr[Q]":
+    return CAnd((self, other))
+
+  def __or__(self, other:"CExpr[Q]") -> "CExpr[Q]":
+    return COr((self, other))
+
+  def __xor__(self, other:"CExpr[Q]") -> "CExpr[Q]":
+    return CXor((self, other))
+
+  def __invert__(self) -> "CExpr[Q]":
+    return CNot(self)
+
+@dataclass(frozen=True)
+class CBit[Q](CExpr[Q]):
+  """ The outcome of the measurement `label`. """
+  label:MeasureLabel[Q]
+
+@dataclass(frozen=True)
+class CConst[Q](CExpr[Q]):
+  """ A constant bit. """
+  value:int
+
+@dataclass(frozen=True)
+class CNot[Q](CExpr[Q]):
+  a:CExpr[Q]
+
+@dataclass(frozen=True)
+class CAnd[Q](CExpr[Q]):
+  args:tuple[CExpr[Q],...]
+
+@dataclass(frozen=True)
+class COr[Q](CExpr[Q]):
+  args:tuple[CExpr[Q],...]
+
+@dataclass(frozen=True)
+class CXor[Q](CExpr[Q]):
+  """ Parity of the arguments. """
+  args:tuple[CExpr[Q],...]
+
+@dataclass(frozen=True)
+class CEq[Q](CExpr[Q]):
+  a:CExpr[Q]
+  b:CExpr[Q]
+
+
+def parity[Q](ls:list[MeasureLabel[Q]]) -> CExpr[Q]:
+  """ Parity of the outcomes of measurements `ls`. """
+  return CXor(tuple(CBit(l) for l in ls))
+
+
+def cexpr_labels[Q](e:CExpr[Q]) -> set[MeasureLabel[Q]]:
+  """ Collect the measurement labels referenced by the expression `e`. """
+  acc, stack = set(), [e]
+  while stack:
+    e = stack.pop()
+    if isinstance(e, CBit):
+      acc.add(e.label)
+    elif isinstance(e, CNot):
+      stack.append(e.a)
+    elif isinstance(e, (CAnd, COr, CXor)):
+      stack.extend(e.args)
+    elif isinstance(e, CEq):
+      stack.extend([e.a, e.b])
+    elif not isinstance(e, CConst):
+      raise ValueError(f"Unrecognized CExpr: {e}")
+  return acc
+
+
+def cexpr_eval[Q](e:CExpr[Q], msms) -> Any:
+  """ Evaluate the expression `e` given the measurement outcomes `msms`. Outcomes could be numbers,
+  NumPy shot arrays or PennyLane measurement values, so only the operators supported by all of them
+  are used: XOR is computed as `!=` and NOT as `== 0`. """
+  if isinstance(e, CBit):
+    return msms[e.label]
+  elif isinstance(e, CConst):
+    return e.value
+  elif isinstance(e, CNot):
+    return cexpr_eval(e.a, msms) == 0
+  elif isinstance(e, CAnd):
+    return reduce(lambda a, b: a & b, [cexpr_eval(x, msms) for x in e.args])
+  elif isinstance(e, COr):
+    return reduce(lambda a, b: a | b, [cexpr_eval(x, msms) for x in e.args])
+  elif isinstance(e, CXor):
+    return reduce(lambda a, b: a != b, [cexpr_eval(x, msms) for x in e.args])
+  elif isinstance(e, CEq):
+    return cexpr_eval(e.a, msms) == cexpr_eval(e.b, msms)
+  else:
+    raise ValueError(f"Unrecognized CExpr: {e}")
+
+
+def cexpr_eval_packed[Q](e:CExpr[Q], words:dict[MeasureLabel[Q],np.ndarray]) -> np.ndarray:
+  """ Evaluate the expression `e` over bit-packed shot batches, 64 shots per `uint64` word. Bits
+  beyond the number of shots are unspecified. """
+  if isinstance(e, CBit):
+    return words[e.label]
+  elif isinstance(e, CConst):
+    return ~np.uint64(0) if e.value else np.uint64(0)
+  elif isinstance(e, CNot):
+    return ~cexpr_eval_packed(e.a, words)
+  elif isinstance(e, CAnd):
+    return reduce(np.bitwise_and, [cexpr_eval_packed(x, words) for x in e.args])
+  elif isinstance(e, COr):
+    return reduce(np.bitwise_or, [cexpr_eval_packed(x, words) for x in e.args])
+  elif isinstance(e, CXor):
+    return reduce(np.bitwise_xor, [cexpr_eval_packed(x, words) for x in e.args])
+  elif isinstance(e, CEq):
+    return ~(cexpr_eval_packed(e.a, words) ^ cexpr_eval_packed(e.b, words))
+  else:
+    raise ValueError(f"Unrecognized CExpr: {e}")
+
+# }}}
+
 # Quantum circuit definitions {{{
 
 # Common type alias for quantum circuits, where Q is type of qubit label.
@@ -84,28 +211,36 @@ class FTComp[Q]:
 
 # }}}
 
+def iter_ops[Q](circuit:FTCircuit[Q]) -> Iterator[FTOp[Q]]:
+  """ Iterate over the operations of a circuit in the order of execution. The FTComp tree is walked
+  using an explicit stack, so arbitrary deep circuits do not hit the recursion limit. """
+  stack = [circuit]
+  while stack:
+    c = stack.pop()
+    if isinstance(c, FTOps):
+      yield from c.ops
+    elif isinstance(c, FTComp):
+      stack.append(c.b)
+      stack.append(c.a)
+    else:
+      raise ValueError(f"Unrecognized FTCircuit: {c}")
+
+
+def flatten[Q](circuit:FTCircuit[Q]) -> FTOps[Q]:
+  """ Normalize a circuit into a single tape of operations. """
+  return FTOps(list(iter_ops(circuit)))
+
+
 def traverse_circuit[Q,A](
   circuit:FTCircuit[Q],
   op_handler:Callable[[FTOp[Q],A],A],
   acc:A
-) -> None:
+) -> A:
   """ Generalized function for traversing FTCircuit and performing an operation using a handler.
   """
-  def _traverse_op(op:FTOp[Q], acc:A) -> A:
-    return op_handler(op, acc)
-
-  def _traverse(circuit:FTCircuit[Q], acc) -> A:
-    if isinstance(circuit, FTOps):
-      for op in circuit.ops:
-        acc = _traverse_op(op, acc)
-    elif isinstance(circuit, FTComp):
-      acc = _traverse(circuit.a, acc)
-      acc = _traverse(circuit.b, acc)
-    else:
-      raise ValueError(f"Unrecognized FTCircuit: {circuit}")
-    return acc
-
-  return _traverse(circuit, acc)
+  for op in iter_ops(circuit):
+    acc = op_handler(op, acc)
+  return acc
 
 
 def labels[Q](c:FTCircuit[Q]) -> set[Q]:
@@ -133,6 +268,281 @@ def labels[Q](c:FTCircuit[Q]) -> set[Q]:
   return acc
 
 
+# Compiled circuits {{{
+
+class OpKind(IntEnum):
+  """ Kinds of operations of a compiled circuit. """
+  INIT = 0
+  PRIM = 1
+  CTRL = 2
+  MEASURE = 3
+  ERR = 4
+
+
+@dataclass
+class CompiledCircuit[Q]:
+  """ Struct-of-arrays representation of a flat tape of operations. Row `i` of the columns describes
+  the `i`-th operation:
+  * `kind` - the `OpKind` of the operation, the conditioning of `FTCond` is stored separately;
+  * `name` - the `OpName` value of `FTPrim`, of the nested `FTPrim` of `FTCtrl` or of `FTErr`;
+  * `control` - the control qubit index of `FTCtrl`, or -1;
+  * `targets[tptr[i]:tptr[i+1]]` - the target qubit indices;
+  * `label` - the index into the `labels` table for `FTMeasure`, or -1;
+  * `cond` - the index into the `conds` table for operations wrapped into `FTCond`, or -1;
+  * `param` - the row of `amps` for `FTInit`, the physical qubit of `FTErr`, or -1.
+  Qubit indices refer to the `qubits` table. The optional `noise` table is attached by
+  `NoiseModel.annotate` and is dropped by `decompile_circuit`. """
+  kind:np.ndarray
+  name:np.ndarray
+  control:np.ndarray
+  tptr:np.ndarray
+  targets:np.ndarray
+  label:np.ndarray
+  cond:np.ndarray
+  param:np.ndarray
+  qubits:list[Q]
+  labels:list[MeasureLabel[Q]]
+  conds:list[Callable[[dict[MeasureLabel[Q],int]],bool]]
+  amps:np.ndarray
+  noise:"NoiseTable|None" = None
+
+  def __len__(self) -> int:
+    return len(self.kind)
+
+  def row_targets(self, i:int) -> np.ndarray:
+    """ Return the target qubit indices of the `i`-th operation. """
+    return self.targets[self.tptr[i]:self.tptr[i+1]]
+
+
+def compile_circuit[Q](c:FTCircuit[Q], qubits:list[Q]|None=None) -> CompiledCircuit[Q]:
+  """ Compile the circuit `c` into the struct-of-arrays form. Qubits are indexed according to the
+  `qubits` list, which defaults to the sorted list of circuit labels. Measurement labels are
+  interned in the order of their first appearance. """
+  qubits = sorted(labels(c)) if qubits is None else list(qubits)
+  qindex = {q:i for i,q in enumerate(qubits)}
+  lindex = {}
+  kind, name, control, tptr, targets, label, cond, param = [], [], [], [0], [], [], [], []
+  conds, amps = [], []
+
+  def _row(k, n=0, ctrl=-1, tgts=(), lbl=-1, cnd=-1, prm=-1):
+    kind.append(k); name.append(n); control.append(ctrl)
+    targets.extend(qindex[q] for q in tgts)
+    tptr.append(len(targets))
+    label.append(lbl); cond.append(cnd); param.append(prm)
+
+  def _op(op:FTOp[Q], cnd:int) -> None:
+    if isinstance(op, FTPrim):
+      _row(OpKind.PRIM, op.name.value, tgts=op.qubits, cnd=cnd)
+    elif isinstance(op, FTCtrl):
+      if not isinstance(op.op, FTPrim):
+        raise ValueError(f"Unsupported nested op: {op.op}")
+      _row(OpKind.CTRL, op.op.name.value, ctrl=qindex[op.control], tgts=op.op.qubits, cnd=cnd)
+    elif isinstance(op, FTInit):
+      amps.append((op.alpha, op.beta))
+      _row(OpKind.INIT, tgts=[op.qubit], cnd=cnd, prm=len(amps)-1)
+    elif isinstance(op, FTMeasure):
+      _row(OpKind.MEASURE, tgts=[op.qubit], cnd=cnd,
+           lbl=lindex.setdefault(op.label, len(lindex)))
+    elif isinstance(op, FTErr):
+      _row(OpKind.ERR, op.name.value, tgts=[op.qubit], cnd=cnd, prm=op.phys)
+    elif isinstance(op, FTCond):
+      if cnd != -1:
+        raise ValueError(f"Nested conditions are not supported: {op}")
+      conds.append(op.cond)
+      _op(op.op, len(conds)-1)
+    else:
+      raise ValueError(f"Unrecognized FTOp: {op}")
+
+  for op in iter_ops(c):
+    _op(op, -1)
+
+  return CompiledCircuit(
+    kind=np.array(kind, dtype=np.uint8),
+    name=np.array(name, dtype=np.uint8),
+    control=np.array(control, dtype=np.int32),
+    tptr=np.array(tptr, dtype=np.int32),
+    targets=np.array(targets, dtype=np.int32),
+    label=np.array(label, dtype=np.int32),
+    cond=np.array(cond, dtype=np.int32),
+    param=np.array(param, dtype=np.int32),
+    qubits=qubits,
+    labels=list(lindex.keys()),
+    conds=conds,
+    amps=np.array(amps, dtype=np.complex128).reshape(-1, 2),
+  )
+
+
+def decompile_circuit[Q](cc:CompiledCircuit[Q]) -> FTOps[Q]:
+  """ Convert the compiled circuit back into a tape of operations. """
+  qubits = cc.qubits
+  ops = []
+  for i in range(len(cc)):
+    k = cc.kind[i]
+    tgts = [qubits[t] for t in cc.row_targets(i)]
+    if k == OpKind.PRIM:
+      op = FTPrim(OpName(cc.name[i]), tgts)
+    elif k == OpKind.CTRL:
+      op = FTCtrl(qubits[cc.control[i]], FTPrim(OpName(cc.name[i]), tgts))
+    elif k == OpKind.INIT:
+      alpha, beta = cc.amps[cc.param[i]]
+      op = FTInit(tgts[0], complex(alpha), complex(beta))
+    elif k == OpKind.MEASURE:
+      op = FTMeasure(tgts[0], cc.labels[cc.label[i]])
+    elif k == OpKind.ERR:
+      op = FTErr(tgts[0], int(cc.param[i]), OpName(cc.name[i]))
+    else:
+      raise ValueError(f"Unrecognized OpKind: {k}")
+    if cc.cond[i] != -1:
+      op = FTCond(cc.conds[cc.cond[i]], op)
+    ops.append(op)
+  return FTOps(ops)
+
+# }}}
+
+# Structural hashing and caching {{{
+
+class Unhashable(ValueError):
+  """ Raised when a circuit contains values without a structural key. """
+
+
+def _code_names(code:CodeType) -> set[str]:
+  """ Collect the global names referenced by the code object and by the nested code objects. """
+  names = set(code.co_names)
+  for c in code.co_consts:
+    if isinstance(c, CodeType):
+      names |= _code_names(c)
+  return names
+
+
+def _freeze_globals(fn) -> Hashable:
+  """ Key the module globals read by the function `fn`. Modules, classes and functions are keyed by
+  identity and immutable values by value. Raise `Unhashable` if the function reads a mutable global
+  value, which could change without changing the key. """
+  g = getattr(fn, '__globals__', {})
+  acc = []
+  for name in sorted(_code_names(fn.__code__)):
+    if name not in g:
+      continue
+    v = g[name]
+    if isinstance(v, (ModuleType, type, FunctionType, BuiltinFunctionType)):
+      acc.append((name, id(v)))
+    elif isinstance(v, (int, float, complex, str, bytes, bool, Enum)) or v is None:
+      acc.append((name, v))
+    else:
+      raise Unhashable(f"Function {fn} reads the mutable global {name}")
+  return tuple(acc)
+
+
+def _freeze(v, depth:int=0) -> Hashable:
+  """ Convert a value found in a circuit or in a closure of a condition into a hashable key. """
+  if depth > 32:
+    raise Unhashable(f"Value is too deep to be hashed structurally: {v}")
+  if isinstance(v, (list, tuple)):
+    return (type(v).__name__, tuple(_freeze(x, depth+1) for x in v))
+  if isinstance(v, dict):
+    return ('dict', tuple((_freeze(k, depth+1), _freeze(x, depth+1)) for k, x in v.items()))
+  if isinstance(v, (set, frozenset)):
+    return ('set', frozenset(_freeze(x, depth+1) for x in v))
+  if isinstance(v, np.ndarray):
+    return ('ndarray', v.shape, v.dtype.str, v.tobytes())
+  if isinstance(v, partial):
+    return ('partial', _freeze(v.func, depth+1), _freeze(v.args, depth+1),
+            _freeze(v.keywords, depth+1))
+  if isinstance(v, MethodType):
+    obj = v.__self__
+    if hasattr(obj, '__dict__'):
+      # Instances are keyed by their state, which the method could read
+      state = ('obj', id(type(obj)), _freeze(vars(obj), depth+1))
+    else:
+      state = _freeze(obj, depth+1)
+    return ('method', _freeze(v.__func__, depth+1), state)
+  if callable(v) and hasattr(v, '__code__'):
+    cells = []
+    for cell in v.__closure__ or ():
+      try:
+        contents = cell.cell_contents
+      except ValueError:
+        cells.append(('empty',))
+        continue
+      cells.append(_freeze(contents, depth+1))
+    return ('fn', v.__code__, _freeze(v.__defaults__, depth+1), tuple(cells),
+            _freeze_globals(v))
+  try:
+    hash(v)
+  except TypeError:
+    raise Unhashable(f"Value has no structural key: {v}")
+  return v
+
+
+def op_key[Q](op:FTOp[Q]) -> Hashable:
+  """ Return a hashable key of the operation `op`. Conditions are keyed by their code objects, the
+  contents of their closures, the global values they read and the instances of bound methods. Raise
+  `Unhashable` for conditions reading mutable globals. """
+  if isinstance(op, FTPrim):
+    return ('P', op.name, _freeze(op.qubits))
+  elif isinstance(op, FTCtrl):
+    return ('C', _freeze(op.control), op_key(op.op))
+  elif isinstance(op, FTInit):
+    return ('I', _freeze(op.qubit), op.alpha, op.beta)
+  elif isinstance(op, FTMeasure):
+    return ('M', _freeze(op.qubit), _freeze(op.label))
+  elif isinstance(op, FTCond):
+    return ('?', _freeze(op.cond), op_key(op.op))
+  elif isinstance(op, FTErr):
+    return ('E', _freeze(op.qubit), op.phys, op.name)
+  else:
+    raise ValueError(f"Unrecognized FTOp: {op}")
+
+
+def circuit_key[Q](c:FTCircuit[Q]) -> Hashable:
+  """ Return a structural key of the circuit `c`. Circuits having equal keys consist of the same
+  operations, regardless of the way they are composed. Raise `Unhashable` if the circuit contains
+  values which could not be hashed. """
+  return tuple(op_key(op) for op in iter_ops(c))
+
+
+@dataclass
+class CacheInfo:
+  """ Statistics of a `LRUCache`. """
+  hits:int
+  misses:int
+  maxsize:int
+  currsize:int
+
+
+@dataclass
+class LRUCache[K,V]:
+  """ Dictionary bounded by `maxsize` entries which evicts the least recently used entries. """
+  maxsize:int = 128
+  hits:int = 0
+  misses:int = 0
+  _data:OrderedDict = field(default_factory=OrderedDict)
+
+  def get(self, key:K, make:Callable[[],V]) -> V:
+    """ Return the value stored under `key`, creating it with `make` on a miss. """
+    v = self._data.get(key, _MISSING)
+    if v is not _MISSING:
+      self.hits += 1
+      self._data.move_to_end(key)
+      return v
+    self.misses += 1
+    v = make()
+    self._data[key] = v
+    while len(self._data) > self.maxsize:
+      self._data.popitem(last=False)
+    return v
+
+  def info(self) -> CacheInfo:
+    return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+  def clear(self) -> None:
+    self._data.clear()
+    self.hits = self.misses = 0
+
+_MISSING = object()
+
+# }}}
+
 # Circuit mapping {{{
 
 @dataclass
@@ -143,11 +553,20 @@ class Map[Q1,Q2]:
     raise NotImplementedError
 
 
+def map_circuit_iter[Q1,Q2](c:FTCircuit[Q1],
+                            m:Map[Q1,Q2]) -> Iterator[tuple[FTOps[Q2],list[MeasureLabel[Q2]]]]:
+  """ Map the circuit `c` lazily, one operation at a time. Yield the flat tape of every mapped
+  operation together with the labels of the measurements it introduces. The mapper `m` advances only
+  as the chunks are consumed, so a backend could run every chunk before the next one is built. """
+  for op in iter_ops(c):
+    chunk = flatten(m.map_op(op))
+    yield chunk, [op2.label for op2 in chunk.ops if isinstance(op2, FTMeasure)]
+
+
 def map_circuit[Q1,Q2](c:FTCircuit[Q1], m:Map[Q1,Q2]) -> FTCircuit[Q2]:
-  """ Maps the circuit `c` by mapping each its operation and taking a compostion """
-  def _traverse_op(op:FTOp[Q1], acc) -> None:
-    return FTComp(acc, m.map_op(op))
-  return traverse_circuit(c, _traverse_op, FTOps([]))
+  """ Maps the circuit `c` by mapping each its operation and taking a compostion. The composition
+  is returned as a flat tape of operations. """
+  return FTOps([op2 for chunk, _ in map_circuit_iter(c, m) for op2 in chunk.ops])
 
 # }}}
 
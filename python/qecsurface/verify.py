@@ -0,0 +1,212 @@
+""" Polynomial-time verification of mapped circuits. Pauli operators are pushed through a circuit in
+the Heisenberg picture to check that stabilizers are preserved and that logical operators are
+transformed as expected. Signs picked up at mid-circuit measurements and classically conditioned
+Paulis are kept symbolic and evaluated on the outcomes of a reference run. Weight-1 faults are
+checked by propagating one Pauli frame per fault through the reference execution, which the
+Pauli-frame sampler does for 64 faults per word.
+"""
+import numpy as np
+from dataclasses import dataclass, field
+
+from .type import *
+from .noise import Effect, NoiseEvents
+from .frame import reference_run, propagate_frames
+from .gf2 import GF2, check_matrix, in_rowspace
+
+# Heisenberg propagation {{{
+
+class PauliLost(ValueError):
+  """ Raised when a Pauli string does not survive a measurement or an initialization. """
+
+
+@dataclass
+class PauliString[Q]:
+  """ Pauli operator `(-1)^sign * P` on `qubits` in the Aaronson-Gottesman encoding: `x[i]` and
+  `z[i]` select X, Z or Y (both) on the qubit `qubits[i]`. The sign is additionally flipped by the
+  outcomes of the measurements `records` and by the values of the conditions `conds`. """
+  qubits:list[Q]
+  x:np.ndarray
+  z:np.ndarray
+  sign:int = 0
+  records:set[MeasureLabel[Q]] = field(default_factory=set)
+  conds:list = field(default_factory=list)
+
+  @staticmethod
+  def from_prims(prims:list[FTPrim[Q]], qubits:list[Q], sign:int=0) -> "PauliString[Q]":
+    """ Build the product of X and Z `prims` (X parts are taken first). """
+    index = {q:i for i,q in enumerate(qubits)}
+    x = np.zeros(len(qubits), dtype=np.uint8)
+    z = np.zeros(len(qubits), dtype=np.uint8)
+    for p in prims:
+      for q in p.qubits:
+        if p.name == OpName.X:
+          x[index[q]] ^= 1
+        elif p.name == OpName.Z:
+          z[index[q]] ^= 1
+        else:
+          raise ValueError(f"Expected a Pauli operation, got {p}")
+    return PauliString(list(qubits), x, z, sign)
+
+  def copy(self) -> "PauliString[Q]":
+    return PauliString(self.qubits, self.x.copy(), self.z.copy(), self.sign, set(self.records),
+                       list(self.conds))
+
+  def value(self, msms:dict[MeasureLabel[Q],int]) -> int:
+    """ Return the sign bit with the measurement-dependent flips evaluated on `msms`. """
+    s = self.sign + sum(int(msms[l]) for l in self.records)
+    return (s + sum(bool(c(msms)) for c in self.conds)) % 2
+
+  def same(self, other:"PauliString[Q]") -> bool:
+    """ Check that the two strings are equal up to the sign. """
+    return bool((self.x == other.x).all() and (self.z == other.z).all())
+
+
+def propagate[Q](c:FTCircuit[Q]|CompiledCircuit[Q], p:PauliString[Q]) -> PauliString[Q]:
+  """ Conjugate the Pauli string `p` by the circuit `c`: if a state is stabilized by `p` before the
+  circuit, it is stabilized by the result afterwards. Measured qubits must carry at most a Z
+  component, which turns into a dependency on the outcome. Raise `ValueError` if `p` does not
+  survive a measurement or an initialization (`PauliLost`) or if the circuit contains unsupported
+  operations. """
+  p = p.copy()
+  c = decompile_circuit(c) if isinstance(c, CompiledCircuit) else c
+  index = {q:i for i,q in enumerate(p.qubits)}
+  x, z = p.x, p.z
+
+  def _prim(name:OpName, a:int) -> None:
+    if name == OpName.X:
+      p.sign ^= int(z[a])
+    elif name == OpName.Z:
+      p.sign ^= int(x[a])
+    elif name == OpName.H:
+      p.sign ^= int(x[a] & z[a])
+      x[a], z[a] = z[a], x[a]
+    elif name != OpName.I:
+      raise ValueError(f"Unsupported primary operation: {name}")
+
+  def _cnot(a:int, b:int) -> None:
+    p.sign ^= int(x[a] & z[b] & (x[b] ^ z[a] ^ 1))
+    x[b] ^= x[a]
+    z[a] ^= z[b]
+
+  for op in iter_ops(c):
+    if isinstance(op, FTPrim):
+      for q in op.qubits:
+        _prim(op.name, index[q])
+    elif isinstance(op, FTCtrl):
+      if not isinstance(op.op, FTPrim):
+        raise ValueError(f"Unsupported nested op: {op.op}")
+      a = index[op.control]
+      for q in op.op.qubits:
+        b = index[q]
+        if op.op.name == OpName.X:
+          _cnot(a, b)
+        elif op.op.name == OpName.Z:
+          _prim(OpName.H, b); _cnot(a, b); _prim(OpName.H, b)
+        else:
+          raise ValueError(f"Unsupported nested op: {op.op}")
+    elif isinstance(op, FTMeasure):
+      a = index[op.qubit]
+      if x[a]:
+        raise PauliLost(f"Pauli string anticommutes with the measurement {op.label}")
+      if z[a]:
+        p.records ^= {op.label}
+        z[a] = 0
+    elif isinstance(op, FTInit):
+      if x[index[op.qubit]] or z[index[op.qubit]]:
+        raise PauliLost(f"Pauli string acts on the initialized qubit {op.qubit}")
+    elif isinstance(op, FTCond):
+      if not (isinstance(op.op, FTPrim) and op.op.name in (OpName.X, OpName.Z, OpName.I)):
+        raise ValueError(f"Only Pauli operations could be conditioned, got {op.op}")
+      bits = z if op.op.name == OpName.X else x
+      if op.op.name != OpName.I and sum(int(bits[index[q]]) for q in op.op.qubits) % 2:
+        p.conds.append(op.cond)
+    else:
+      raise ValueError(f"Unsupported operation: {op}")
+  return p
+
+
+def check_pauli[Q](c:FTCircuit[Q]|CompiledCircuit[Q], before:list[FTPrim[Q]],
+                   after:list[FTPrim[Q]], msms:dict[MeasureLabel[Q],int], qubits:list[Q],
+                   sign:int=0) -> bool:
+  """ Check that the circuit `c` maps the Pauli string `before` to `(-1)^sign * after`. Outcome
+  dependent signs are evaluated on the reference outcomes `msms`. Malformed circuits raise
+  `ValueError`. """
+  try:
+    p = propagate(c, PauliString.from_prims(before, qubits))
+  except PauliLost:
+    return False
+  return p.same(PauliString.from_prims(after, qubits)) and p.value(msms) == sign
+
+
+def check_stabilizers[Q](c:FTCircuit[Q]|CompiledCircuit[Q], stabilizers:list[FTPrim[Q]],
+                         msms:dict[MeasureLabel[Q],int], qubits:list[Q]) -> list[bool]:
+  """ Check that every stabilizer is mapped to itself (with its sign) by the circuit `c`. """
+  return [check_pauli(c, [s], [s], msms, qubits) for s in stabilizers]
+
+# }}}
+
+# Weight-1 faults {{{
+
+@dataclass(frozen=True)
+class Fault[Q]:
+  """ Pauli error `pauli` ('X', 'Y' or 'Z') acting on `qubit` right after the row `row` of a
+  compiled circuit. The fault 'M' flips the outcome recorded by the measurement row `row`. """
+  row:int
+  qubit:Q
+  pauli:str
+
+
+def weight1_faults[Q](cc:CompiledCircuit[Q], rows:list[int]|None=None,
+                      qubits:list[Q]|None=None, paulis:str='XYZ') -> list[Fault[Q]]:
+  """ Enumerate single-qubit Pauli faults after the `rows` (all by default) on the qubits the rows
+  act on, optionally restricted to `qubits`. Measurement rows get the 'M' faults if requested. """
+  keep = None if qubits is None else set(qubits)
+  faults = []
+  for i in (range(len(cc)) if rows is None else rows):
+    touched = list(cc.row_targets(i))
+    if cc.kind[i] == OpKind.CTRL:
+      touched = [cc.control[i]] + touched
+    for a in dict.fromkeys(touched):
+      q = cc.qubits[a]
+      if keep is None or q in keep:
+        faults.extend(Fault(int(i), q, s) for s in paulis
+                      if s != 'M' or cc.kind[i] == OpKind.MEASURE)
+  return faults
+
+
+def fault_frames[Q](cc:CompiledCircuit[Q], faults:list[Fault[Q]],
+                    seed:int|None=0) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+  """ Propagate every fault through the circuit `cc` separately. Return the `(len(faults), ...)`
+  matrices of flipped measurement outcomes and of the residual X and Z frames on `cc.qubits`. """
+  index = {q:i for i,q in enumerate(cc.qubits)}
+  def _effects(f):
+    if f.pauli == 'M':
+      return [(Effect.MEASURE, int(cc.label[f.row]))]
+    return [(e, index[f.qubit]) for e, on in ((Effect.X, f.pauli in 'XY'),
+                                              (Effect.Z, f.pauli in 'ZY')) if on]
+  events = sorted((f.row, e, i, s) for s, f in enumerate(faults) for e, i in _effects(f))
+  row = np.array([e[0] for e in events], dtype=np.int64)
+  noise = NoiseEvents(
+    ptr=np.searchsorted(row, np.arange(len(cc) + 1)),
+    effect=np.array([e[1] for e in events], dtype=np.uint8),
+    index=np.array([e[2] for e in events], dtype=np.int64),
+    shot=np.array([e[3] for e in events], dtype=np.int64),
+  )
+  rng = np.random.default_rng(seed)
+  rows, x, z = propagate_frames(reference_run(cc, rng), len(faults), rng, noise, gauge=False)
+  def _unpack(w):
+    return np.unpackbits(w.view(np.uint8), axis=1, count=len(faults), bitorder='little').T
+  return _unpack(rows), _unpack(x), _unpack(z)
+
+
+def uncorrected_faults[Q](cc:CompiledCircuit[Q], faults:list[Fault[Q]],
+                          stabilizers:list[FTPrim[Q]], data:list[Q]) -> list[Fault[Q]]:
+  """ Return the faults whose residual error on the `data` qubits at the end of the circuit `cc` is
+  not an element of the stabilizer group. """
+  _, x, z = fault_frames(cc, faults)
+  cols = [cc.qubits.index(q) for q in data]
+  h, _ = check_matrix(stabilizers, data)
+  ok = in_rowspace(h, GF2.from_dense(np.concatenate([x[:, cols], z[:, cols]], axis=1)))
+  return [f for f, good in zip(faults, ok) if not good]
+
+# }}}
@@ -0,0 +1,48 @@
+import json
+import pytest
+from qecsurface import *
+from qecsurface.bench import *
+
+
+def test_wilson_interval():
+  lo, hi = wilson_interval(0, 100)
+  assert lo == 0 and 0 < hi < 0.05
+  lo, hi = wilson_interval(50, 100)
+  assert lo < 0.5 < hi
+  assert abs((0.5 - lo) - (hi - 0.5)) < 1e-12
+
+
+@pytest.mark.parametrize("decoder", ["mwpm", "uf"])
+@pytest.mark.parametrize("simulator", ["frame", "stabilizer", "pennylane"])
+@pytest.mark.parametrize("basis", [OpName.Z, OpName.X])
+def test_memory_experiment_noiseless(decoder, simulator, basis):
+  r = memory_experiment(surface_code(3), 0.0, 2, 20, decoder, simulator, basis, seed=0)
+  assert r.failures == 0 and r.ler == 0
+  assert r.sim_s > 0 and r.decode_s > 0 and r.wall_s == r.sim_s + r.decode_s
+  assert r.shots_per_s > 0 and r.peak_rss_mb > 0
+
+
+def test_memory_circuit_noisy():
+  code = surface_code(3)
+  c, mls, final = memory_circuit(code, 2, OpName.Z)
+  assert len(mls) == 2 and len(final) == code.ndata
+  events, data, _ = sample_memory(code, 0.05, 2, 200, OpName.Z, seed=1)
+  assert events.shape == (200, 3, 4) and data.shape == (200, code.ndata)
+  assert events.any()
+  with pytest.raises(ValueError):
+    sample_memory(code, 0.05, 2, 10, OpName.Z, simulator='pennylane')
+
+
+def test_run_grid_output(tmp_path):
+  out = tmp_path / "bench.jsonl"
+  main(["--codes", "rotated", "unrotated", "--distances", "3", "--p", "0.02", "--rounds", "2",
+        "--shots", "200", "--simulators", "frame", "stabilizer", "--seed", "1",
+        "--output", str(out)])
+  rows = [json.loads(l) for l in out.read_text().splitlines()]
+  assert len(rows) == 8
+  assert {(r["code"], r["simulator"], r["decoder"]) for r in rows} == {
+    (c, s, b) for c in ["rotated", "unrotated"] for s in ["frame", "stabilizer"]
+    for b in ["mwpm", "uf"]}
+  for r in rows:
+    assert r["ci_low"] <= r["ler"] <= r["ci_high"]
+    assert r["sim_s"] > 0 and r["decode_s"] > 0
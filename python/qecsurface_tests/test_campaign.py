@@ -0,0 +1,74 @@
+import pytest
+import numpy as np
+
+from qecsurface import *
+from qecsurface.verify import Fault, uncorrected_faults
+from qecsurface.campaign import Outcome, run_campaign, cache_info, cache_clear
+
+
+def _surface25u():
+  """ Return the mapped circuit, its data qubits, stabilizers and the row of the logical X. """
+  data = list(range(13))
+  m = Surface25u({0: (data, 13)})
+  init = map_circuit(FTOps([FTInit(0, 1.0, 0.0)]), m)
+  c = FTComp(init, map_circuit(FTOps([FTPrim(OpName.X, [0])]), m))
+  return c, data, surface_code(3, rotated=False).stabilizers, len(compile_circuit(init))
+
+
+def test_campaign_surface25u():
+  c, data, stabs, row = _surface25u()
+  cc = compile_circuit(c)
+  t = run_campaign(c, stabs, data, workers=1)
+  nmeasure = int((cc.kind == OpKind.MEASURE).sum())
+  assert len(t.select(pauli='M')) == nmeasure
+  assert len(t.select(pauli='XYZ')) == len(t) - nmeasure
+  assert sum(t.counts().values()) == len(t)
+  # Syndrome qubits are covered as well
+  assert len(t.select(qubits=[13])) > 0
+  # Data faults right after the logical X are corrected
+  sel = t.select(rows=[row], qubits=data)
+  assert len(sel) == 3*3
+  assert (sel.outcome == Outcome.CORRECTED).all()
+  assert (sel.select(pauli='X').flips > 0).all()
+  # Faults after the last row are never corrected
+  assert (t.select(rows=[len(cc)-1], pauli='XYZ').outcome == Outcome.DETECTED).all()
+  # The table agrees with the direct check
+  bad = uncorrected_faults(cc, t.faults(), stabs, data)
+  assert bad == [f for f, o in zip(t.faults(), t.outcome) if o != Outcome.CORRECTED]
+
+
+def test_campaign_cache_and_parallel():
+  cache_clear()
+  c, data, stabs, row = _surface25u()
+  t1 = run_campaign(c, stabs, data, workers=1, chunk=256)
+  t2 = run_campaign(FTOps(list(iter_ops(c))), stabs, data, workers=1, chunk=256)
+  assert t2 is t1
+  assert cache_info().hits == 1 and cache_info().misses == 1
+  cache_clear()
+  t3 = run_campaign(c, stabs, data, workers=2, chunk=256)
+  assert (t3.outcome == t1.outcome).all() and (t3.flips == t1.flips).all()
+
+
+def test_campaign_sampled():
+  c, data, stabs, row = _surface25u()
+  full = run_campaign(c, stabs, data, workers=1)
+  t = run_campaign(c, stabs, data, samples=100, seed=1, workers=1)
+  assert len(t) == 100
+  lookup = {f:o for f, o in zip(full.faults(), full.outcome)}
+  assert all(lookup[f] == o for f, o in zip(t.faults(), t.outcome))
+  # Unseeded samples are drawn anew on every call
+  cache_clear()
+  u1 = run_campaign(c, stabs, data, samples=100, seed=None, workers=1)
+  u2 = run_campaign(c, stabs, data, samples=100, seed=None, workers=1)
+  assert u1 is not u2 and u1.faults() != u2.faults()
+  assert cache_info().hits == 0 and cache_info().misses == 2
+
+
+def test_campaign_bitflip_logical():
+  data, syndromes = [0, 1, 2], [3, 4]
+  c = map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTPrim(OpName.X, [0])]),
+                  Bitflip({0: (data, syndromes)}))
+  t = run_campaign(c, [FTPrim(OpName.Z, [0, 1]), FTPrim(OpName.Z, [1, 2])], data, paulis='XZ',
+                   workers=1)
+  # Phase flips on data qubits are undetectable logical errors of the bit-flip code
+  assert (t.select(pauli='Z', qubits=data).outcome == Outcome.LOGICAL).all()
@@ -0,0 +1,125 @@
+import pytest
+import numpy as np
+from qecsurface import *
+from qecsurface.decode import *
+
+# Logical operators of surface25 as in `Surface25u.map_op`, Z errors are detected by X stabilizers
+# and flip the logical X, X errors are detected by Z stabilizers and flip the logical Z.
+LOGICAL = {OpName.X: [5, 6, 7], OpName.Z: [1, 6, 11]}
+
+
+def _check(name):
+  stabs = [op.qubits for op in surface25_stabilizers() if op.name == name]
+  h = np.zeros((len(stabs), 13), dtype=np.uint8)
+  for i, qubits in enumerate(stabs):
+    h[i, qubits] = 1
+  return h
+
+
+def _syndromes(name, errors, merrors):
+  """ Build layered syndromes from per-round data errors `(shots, rounds, 13)` and measurement
+  errors `(shots, rounds, nstab)`. The first layer is the error-free reference. """
+  h = _check(name)
+  data = np.cumsum(errors, axis=1) % 2
+  synd = (data @ h.T) % 2 ^ merrors
+  ref = np.zeros_like(synd[:, :1])
+  return np.concatenate([ref, synd], axis=1).astype(np.uint8), data[:, -1]
+
+
+def _logical_failures(name, h, residual):
+  assert ((residual @ h.T) % 2 == 0).all(), "Correction does not clear the syndrome"
+  return residual[:, LOGICAL[name]].sum(axis=1) % 2
+
+
+@pytest.mark.parametrize("name", [OpName.X, OpName.Z])
+def test_mwpm_single_faults(name):
+  rounds = 3
+  h = _check(name)
+  nstab = h.shape[0]
+  errors, merrors = [], []
+  for t in range(rounds):
+    for q in range(13):
+      e = np.zeros((rounds, 13), dtype=np.uint8)
+      e[t, q] = 1
+      errors.append(e)
+      merrors.append(np.zeros((rounds, nstab), dtype=np.uint8))
+    # Measurement errors of the last round are indistinguishable from data errors
+    for s in range(nstab if t < rounds - 1 else 0):
+      m = np.zeros((rounds, nstab), dtype=np.uint8)
+      m[t, s] = 1
+      errors.append(np.zeros((rounds, 13), dtype=np.uint8))
+      merrors.append(m)
+  synd, final = _syndromes(name, np.array(errors), np.array(merrors))
+  g = detector_graph(surface25_stabilizers(), name, rounds)
+  corr = decode_mwpm(g, detection_events(synd))
+  assert not _logical_failures(name, h, final ^ corr).any()
+
+
+def test_detector_graph_cached():
+  g1 = detector_graph(surface25_stabilizers(), OpName.X, 4)
+  g2 = detector_graph(surface25_stabilizers(), OpName.X, 4)
+  assert g1 is g2
+  assert g1.nnodes == 4*6 + 1
+
+
+def test_mwpm_blossom_matches_dp():
+  from qecsurface.decode import _match_small, _match_blossom
+  rng = np.random.default_rng(0)
+  g = detector_graph(surface25_stabilizers(), OpName.Z, 3)
+  def _weight(pairs, d, bd):
+    return sum(bd[i] if j < 0 else d[i, j] for i, j in pairs)
+  for _ in range(20):
+    defects = np.flatnonzero(rng.random(3*6) < 0.4)
+    d = g.dist[np.ix_(defects, defects)]
+    bd = g.dist[defects, g.boundary]
+    assert _weight(_match_small(d, bd), d, bd) == _weight(_match_blossom(d, bd), d, bd)
+
+
+def test_syndrome_array():
+  data = list(range(13))
+  mls = [[(l, op.name, tuple(op.qubits)) for op in surface25_stabilizers()] for l in range(3)]
+  msms = {l: np.full(5, l[0] % 2) for ls in mls for l in ls}
+  s = syndrome_array(msms, mls, OpName.X)
+  assert s.shape == (5, 3, 6)
+  assert (detection_events(s) == 1).all()
+
+
+@pytest.mark.parametrize("name", [OpName.X, OpName.Z])
+def test_uf_single_faults(name):
+  rounds = 3
+  h = _check(name)
+  g = detector_graph(surface25_stabilizers(), name, rounds)
+  errors = np.zeros((13*rounds, rounds, 13), dtype=np.uint8)
+  for t in range(rounds):
+    for q in range(13):
+      errors[t*13+q, t, q] = 1
+  merrors = np.zeros((13*rounds, rounds, h.shape[0]), dtype=np.uint8)
+  synd, final = _syndromes(name, errors, merrors)
+  corr = decode_uf(g, detection_events(synd))
+  assert not _logical_failures(name, h, final ^ corr).any()
+
+
+@pytest.mark.parametrize("name", [OpName.X, OpName.Z])
+def test_uf_streaming(name):
+  rng = np.random.default_rng(1)
+  rounds, shots = 8, 200
+  h = _check(name)
+  nstab = h.shape[0]
+  # A single data error in a random round of every shot
+  errors = np.zeros((shots, rounds, 13), dtype=np.uint8)
+  errors[np.arange(shots), rng.integers(rounds, size=shots), rng.integers(13, size=shots)] = 1
+  merrors = np.zeros((shots, rounds, nstab), dtype=np.uint8)
+  synd, final = _syndromes(name, errors, merrors)
+  mls = [[(l, op.name, tuple(op.qubits)) for op in surface25_stabilizers()]
+         for l in range(rounds+1)]
+  dec = StreamingDecoder(surface25_stabilizers(), name, window=3)
+  for l, ls in enumerate(mls):
+    other = [x for x in ls if x[1] != name]
+    msms = {x: synd[:, l, i] for i, x in enumerate(x for x in ls if x[1] == name)}
+    msms.update({x: np.zeros(shots, dtype=np.uint8) for x in other})
+    dec.push(msms, ls)
+    assert len(dec._buffer) < 3
+  corr = dec.flush()
+  assert not _logical_failures(name, h, final ^ corr).any()
+  with pytest.raises(TypeError):
+    StreamingDecoder(surface25_stabilizers(), name, _buffer=[])
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from qecsurface import *
+from qecsurface.frame import *
+from qecsurface.qeccs import surface25u_detect, surface25u_correct, surface25u_print2
+
+
+def test_frame_bell():
+  c = FTOps([
+    FTPrim(OpName.H, [0]),
+    FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTMeasure(0, "m0"),
+    FTMeasure(1, "m1"),
+  ])
+  s = sample_frames(c, 1000, seed=0)
+  assert s.packed.shape == (1000, 1)
+  assert (s.column("m0") == s.column("m1")).all()
+  assert 400 < s.column("m0").sum() < 600
+
+
+def test_frame_cond():
+  c = FTOps([
+    FTPrim(OpName.H, [0]),
+    FTMeasure(0, "m0"),
+    FTCond(lambda m: m["m0"] == 1, FTPrim(OpName.X, [1])),
+    FTMeasure(1, "m1"),
+    FTMeasure(1, "m2"),
+  ])
+  s = sample_frames(c, 333, seed=1, batch=100)
+  bits = s.unpack()
+  assert bits.shape == (333, 3)
+  assert (bits[:,0] == bits[:,1]).all()
+  assert (bits[:,2] == 0).all()
+  assert s.shot(0) == {l:int(b) for l,b in zip(s.labels, bits[0])}
+
+
+@pytest.mark.parametrize("error_qubit", [0, 6, 12])
+@pytest.mark.parametrize("error_op", [OpName.H, OpName.X, OpName.Z])
+def test_frame_surface25u_correct(error_qubit, error_op):
+  data, syndrome = list(range(13)), [13]
+  c1,ml1 = surface25u_detect(data, syndrome, 0)
+  err = FTOps([FTPrim(error_op,[error_qubit])])
+  c2,ml2 = surface25u_detect(data, syndrome, 1)
+  corr = surface25u_correct(data, 0, 1)
+  c3,ml3 = surface25u_detect(data, syndrome, 2)
+  s = sample_frames(reduce(FTComp,[c1,err,c2,corr,c3]), 200, seed=error_qubit)
+  # X syndromes of the initial layer are random
+  assert 0 < s.column(ml1[0]).sum() < 200
+  for shot in [0, 100, 199]:
+    msms = s.shot(shot)
+    expected = surface25u_print2(msms, ml1)
+    assert all(e not in expected for e in "XZ")
+    assert surface25u_print2(msms, ml3) == expected
+
+
+def test_frame_cond_reference():
+  # The condition holds in every shot, non-Pauli rows still run
+  c = FTOps([FTMeasure(1, "m0"), FTCond(~CBit("m0"), FTPrim(OpName.H, [0])), FTMeasure(0, "m1")])
+  s = sample_frames(c, 1000, seed=0)
+  assert 400 < s.column("m1").sum() < 600
+  # Outcomes of a label measured twice are referenced per measurement
+  c = FTOps([FTPrim(OpName.H, [0]), FTCtrl(0, FTPrim(OpName.X, [2])), FTMeasure(0, "m"),
+             FTCond(CBit("m"), FTPrim(OpName.X, [1])), FTMeasure(1, "a"), FTMeasure(2, "b"),
+             FTInit(0, 1.0, 0.0), FTMeasure(0, "m")])
+  for seed in range(4):
+    s = sample_frames(c, 1000, seed=seed)
+    assert (s.column("m") == 0).all()
+    assert (s.column("a") == s.column("b")).all()
+    assert 400 < s.column("a").sum() < 600
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+from sympy import Matrix
+from qecsurface import *
+from qecsurface.gf2 import *
+from qecsurface.gf2 import _packed_dot
+
+
+def test_gf2_rank_nullspace():
+  rng = np.random.default_rng(0)
+  for m, n in [(5, 7), (20, 70), (70, 20), (64, 130)]:
+    d = (rng.random((m, n)) < 0.3).astype(np.uint8)
+    d[m // 2] = d[0] ^ d[1]
+    a = GF2.from_dense(d)
+    assert (a.to_dense() == d).all()
+    r, pivots = a.rref()
+    assert a.rank() == len(pivots) == len(r)
+    assert (r.to_dense()[:, pivots] == np.eye(len(pivots), dtype=np.uint8)).all()
+    ns = a.nullspace()
+    assert len(ns) == n - a.rank()
+    assert not a.dot(ns).any()
+    assert (a.dot(a) == (d.astype(int) @ d.T.astype(int)) % 2).all()
+    # Rows are processed in chunks
+    assert (_packed_dot(a, a, chunk=1) == a.dot(a)).all()
+
+
+@pytest.mark.parametrize("d", [3, 5, 9])
+@pytest.mark.parametrize("rotated", [True, False])
+def test_gf2_surface_code(d, rotated):
+  code = surface_code(d, rotated)
+  qubits = list(range(code.ndata))
+  h, _ = check_matrix(code.stabilizers, qubits)
+  assert h.rank() == len(code.stabilizers) == code.ndata - 1
+  assert commutes(h, h)
+  lx, lz = logical_operators(h)
+  assert len(lx) == len(lz) == 1
+  assert commutes(h, lx.vstack(lz))
+  assert commutation(lx, lz).tolist() == [[1]]
+  assert not in_rowspace(h, lx.vstack(lz)).any()
+  ref, _ = check_matrix([FTPrim(OpName.X, code.logical_x), FTPrim(OpName.Z, code.logical_z)],
+                        qubits)
+  assert commutes(h, ref) and not in_rowspace(h, ref).any()
+  # Logical operators found are equivalent to the reference ones up to stabilizers
+  assert in_rowspace(h.vstack(ref), lx.vstack(lz)).all()
+  prod = GF2(h.words[:1] ^ h.words[-1:], h.ncols)
+  assert in_rowspace(h, prod).all()
+
+
+def test_gf2_check_matrix_layout():
+  stabs = [FTPrim(OpName.X, ['q1', 'q2', 'q4']), FTPrim(OpName.Z, ['q1', 'q3'])]
+  h, qubits = check_matrix(stabs)
+  assert qubits == ['q1', 'q2', 'q3', 'q4']
+  assert Matrix(h.to_dense().tolist()) == build_check_matrix(stabs)
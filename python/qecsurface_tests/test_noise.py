@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+from qecsurface import *
+from qecsurface.noise import *
+from qecsurface.frame import sample_frames
+from qecsurface.stabilizer import run_stabilizer
+
+
+def _circuit():
+  return FTOps([
+    FTMeasure(0, "a"),
+    FTInit(1, 1, 0),
+    FTCtrl(1, FTPrim(OpName.X, [2])),
+    FTMeasure(1, "b"),
+    FTMeasure(2, "c"),
+    FTPrim(OpName.I, [3]),
+    FTMeasure(3, "d"),
+  ])
+
+
+def test_noise_annotate():
+  m = NoiseModel({OpKind.MEASURE: Channel(measure=0.1)}, {(OpKind.MEASURE, 3): NOISELESS})
+  cc = m.annotate(_circuit())
+  assert list(cc.noise.measure[cc.label >= 0]) == [0.1, 0.1, 0.1, 0.0]
+  assert not cc.noise.depolarize.any()
+  assert compile_circuit(_circuit()).noise is None
+
+
+def test_sample_noise_rates():
+  cc = NoiseModel({OpKind.CTRL: Channel(depolarize=0.3)}).annotate(_circuit())
+  ev = sample_noise(cc, 100000, np.random.default_rng(0))
+  assert (np.diff(ev.ptr) > 0).sum() == 1
+  sl = ev.row(2)
+  # Each of the four Pauli components of the two-qubit depolarizing channel fires 8/15 of the time
+  for e, q in [(Effect.X, 1), (Effect.Z, 1), (Effect.X, 2), (Effect.Z, 2)]:
+    n = ((ev.effect[sl] == e) & (ev.index[sl] == q)).sum()
+    assert abs(n / 100000 - 0.3*8/15) < 0.01
+
+
+def test_noise_frame_vs_stabilizer():
+  m = NoiseModel({OpKind.MEASURE: Channel(measure=0.1), OpKind.CTRL: Channel(depolarize=0.3),
+                  OpKind.PRIM: Channel(bitflip=0.2)})
+  cc = m.annotate(_circuit())
+  expected = [0.1, 0.16*0.9 + 0.84*0.1, 0.16*0.9 + 0.84*0.1, 0.2*0.9 + 0.8*0.1]
+  s = sample_frames(cc, 100000, seed=0)
+  assert np.allclose(s.unpack().mean(axis=0), expected, atol=0.01)
+  r = np.array([[run_stabilizer(cc, seed=i)[l] for l in "abcd"] for i in range(2000)])
+  assert np.allclose(r.mean(axis=0), expected, atol=0.04)
+
+
+def test_noise_surface_code_detection_rate():
+  code = surface_code(3)
+  data, syndromes = code.qubits()
+  c0, ml0 = surface_code_detect(code, data, syndromes, 0)
+  c1, ml1 = surface_code_detect(code, data, syndromes, 1)
+  cc = uniform_noise(0.0).annotate(FTComp(c0, c1))
+  s = sample_frames(cc, 1000, seed=0)
+  assert all((s.column(a) == s.column(b)).all() for a, b in zip(ml0, ml1))
+  cc = uniform_noise(0.01).annotate(FTComp(c0, c1))
+  s = sample_frames(cc, 1000, seed=0)
+  assert any((s.column(a) != s.column(b)).any() for a, b in zip(ml0, ml1))
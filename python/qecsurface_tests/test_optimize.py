@@ -0,0 +1,91 @@
+import pytest
+import numpy as np
+
+from qecsurface import *
+from qecsurface.optimize import (drop_identities, cancel_pairs, fuse_resets, pauli_frame,
+                                 count_nodes, optimize)
+from qecsurface.stabilizer import run_expectations
+from qecsurface.statevector import equivalent
+
+
+def test_cancel_pairs():
+  ops = [
+    FTPrim(OpName.H, [0]), FTPrim(OpName.X, [0]), FTPrim(OpName.X, [0]), FTPrim(OpName.H, [0]),
+    FTCtrl(0, FTPrim(OpName.X, [1])), FTPrim(OpName.Z, [1]), FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTPrim(OpName.H, [2]), FTCtrl(2, FTPrim(OpName.Z, [1])), FTPrim(OpName.H, [2]),
+  ]
+  out = cancel_pairs(ops, {})
+  assert out == ops[4:]
+  assert cancel_pairs(ops[4:5] + ops[4:5], {}) == []
+  assert equivalent(FTOps(ops), FTOps(out))
+
+
+def test_drop_identities_and_resets():
+  m = (0, OpName.Z, (1,))
+  c = FTComp(FTOps([]), FTOps([
+    FTInit(0, 1.0, 0.0),           # Fresh qubit, dropped
+    FTPrim(OpName.I, [0]),
+    FTPrim(OpName.X, []),
+    FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTMeasure(1, m),
+    FTInit(1, 1.0, 0.0),           # Just measured, dropped
+    FTInit(0, 1.0, 0.0),           # Kept
+  ]))
+  ops = list(iter_ops(c))
+  assert fuse_resets(drop_identities(ops, {}), {}) == [ops[3], ops[4], ops[6]]
+  res = optimize(c, passes=['drop_identities', 'fuse_resets'])
+  assert [s.name for s in res.stats] == ['drop_identities', 'fuse_resets']
+  assert res.stats[0].ops == (7, 5) and res.stats[0].nodes == (count_nodes(c), 6)
+  assert res.stats[1].ops == (5, 3)
+
+
+def test_pauli_frame_flips():
+  m = (0, OpName.Z, (1,))
+  ops = [
+    FTPrim(OpName.X, [0]),
+    FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTMeasure(1, m),
+    FTCond(CBit(m), FTPrim(OpName.Z, [0])),
+  ]
+  flips = {}
+  out = pauli_frame(ops, flips)
+  # X0 reaches the measurement of qubit 1 through the CNOT and flips its outcome
+  assert flips == {m: CConst(1)}
+  assert out[:2] == ops[1:3]
+  # The Z correction reads the true outcome and is applied at the end together with X0
+  assert FTPrim(OpName.X, [0]) in out[2:]
+  assert FTCond(CXor((CBit(m), CConst(1))), FTPrim(OpName.Z, [0])) in out[2:]
+
+
+@pytest.mark.parametrize("phys", [0, 1, 2])
+def test_optimize_bitflip(phys):
+  data, syndromes = [0, 1, 2], [3, 4]
+  c = map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTErr(0, phys, OpName.X), FTPrim(OpName.X, [0]),
+                         FTErr(0, (phys+1) % 3, OpName.X)]),
+                  Bitflip({0: (data, syndromes)}))
+  res = optimize(c, timing=True)
+  assert res.stats[-1].ops[1] < res.stats[0].ops[0]
+  assert all(s.seconds[1] >= 0 for s in res.stats)
+  probes = [[FTPrim(OpName.Z, [q])] for q in data]
+  m0, e0 = run_expectations(c, data + syndromes, probes, 1)
+  m1, e1 = run_expectations(res.circuit, data + syndromes, probes, 1)
+  assert e0 == e1 == [-1, -1, -1]
+  assert res.correct(m1) == m0
+
+
+def test_optimize_surface25u():
+  data = list(range(13))
+  c = map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTErr(0, 4, OpName.X), FTPrim(OpName.X, [0]),
+                         FTErr(0, 7, OpName.Z)]), Surface25u({0: (data, 13)}))
+  res = optimize(c)
+  assert res.stats[-1].name == 'pauli_frame' and res.stats[-1].ops[1] < res.stats[-1].ops[0]
+  code = surface_code(3, rotated=False)
+  probes = [[FTPrim(OpName.Z, code.logical_z)]] + [[s] for s in code.stabilizers]
+  for seed in range(3):
+    m0, e0 = run_expectations(c, data + [13], probes, seed)
+    m1, e1 = run_expectations(res.circuit, data + [13], probes, seed)
+    assert e0[0] == e1[0] == -1
+    # Stabilizers keep the signs of the first syndrome round
+    m1 = res.correct(m1)
+    for e, s in zip(e1[1:], code.stabilizers):
+      assert e == 1 - 2*int(m1[(0, s.name, tuple(s.qubits))])
@@ -0,0 +1,31 @@
+import pytest
+import numpy as np
+from qecsurface import *
+from qecsurface.parallel import run_shots
+from qecsurface.noise import uniform_noise
+
+
+def _circuit():
+  code = surface_code(3)
+  data, syndromes = code.qubits()
+  c = reduce(FTComp, [surface_code_detect(code, data, syndromes, l)[0] for l in range(2)])
+  return uniform_noise(0.01).annotate(c)
+
+
+@pytest.mark.parametrize("backend", ["frame", "stabilizer"])
+def test_run_shots_deterministic(backend):
+  cc = _circuit()
+  s1 = run_shots(cc, 300, backend, workers=1, seed=3, batch=64)
+  s2 = run_shots(cc, 300, backend, workers=3, seed=3, batch=64)
+  assert s1.packed.shape == (300, (len(cc.labels) + 7) // 8)
+  assert (s1.packed == s2.packed).all()
+  assert (s1.unpack() != run_shots(cc, 300, backend, workers=1, seed=4, batch=64).unpack()).any()
+
+
+def test_run_shots_backends_agree():
+  cc = _circuit()
+  f = run_shots(cc, 4000, "frame", workers=2, seed=0, batch=1000).unpack()
+  s = run_shots(cc, 400, "stabilizer", workers=2, seed=0, batch=100).unpack()
+  # Detection events between the two rounds are rare under weak noise for both backends
+  n = len(cc.labels) // 2
+  assert abs((f[:, :n] != f[:, n:]).mean() - (s[:, :n] != s[:, n:]).mean()) < 0.02
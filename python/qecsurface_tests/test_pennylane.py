@@ -242,16 +242,104 @@ def test_map_surface25u(e):
     FTPrim(OpName.I, [0])
   ])
   mapper = Surface25u(qmap={0: (data, 13)})
-  c2 = map_circuit(c1, mapper)
+  chunks = list(map_circuit_iter(c1, mapper))
+  c2 = FTOps([op for chunk, _ in chunks for op in chunk.ops])
+  mls = [ls for _, ls in chunks]
   cPL = to_pennylane_mcm(c2)
   print(qml.draw(cPL)())
   msms = cPL()
-  expected = surface25u_print2(msms, mapper._mls[0][0], mapper._layers0[0])
+  expected = surface25u_print2(msms, mls[0], mapper._layers0[0])
   print(expected)
-  detected = surface25u_print2(msms, mapper._mls[0][1], mapper._layers0[0])
+  detected = surface25u_print2(msms, mls[1], mapper._layers0[0])
   print(detected)
-  corrected = surface25u_print2(msms, mapper._mls[0][2], mapper._layers0[0])
+  corrected = surface25u_print2(msms, mls[2], mapper._layers0[0])
   print(corrected)
   assert expected != detected
   assert expected == corrected
 
+
+def test_qnode_cache():
+  cache_clear()
+  def _build():
+    data = SURFACE25U_DATA_QUBITS
+    c1,_ = surface25u_detect(data, [13], 0)
+    c2,_ = surface25u_detect(data, [13], 1)
+    return reduce(FTComp, [c1, c2, surface25u_correct(data, 0, 1)])
+  q1 = to_pennylane_mcm(_build())
+  q2 = to_pennylane_mcm(_build())
+  assert q1 is q2
+  assert to_pennylane_probs(_build()) is not q1
+  info = cache_info()
+  assert (info['circuits'].hits, info['circuits'].misses) == (1, 2)
+  assert info['devices'].currsize == 2
+  msms = q2()
+  assert all(int(v) in (0, 1) for v in msms.values())
+  cache_clear()
+  assert cache_info()['circuits'].currsize == 0
+
+
+class _Flip:
+  def __init__(self, value):
+    self.value = value
+
+  def cond(self, m):
+    return m["m0"] == self.value
+
+
+def test_qnode_cache_bound_methods():
+  def _c(cond):
+    return FTOps([FTMeasure(0, "m0"), FTCond(cond, FTPrim(OpName.X, [1])), FTMeasure(1, "m1")])
+  q0, q1 = to_pennylane_mcm(_c(_Flip(0).cond)), to_pennylane_mcm(_c(_Flip(1).cond))
+  assert q0 is not q1
+  assert int(q0()["m1"]) == 1 and int(q1()["m1"]) == 0
+  # Mutating the instance changes the key
+  f = _Flip(0)
+  q = to_pennylane_mcm(_c(f.cond))
+  f.value = 1
+  assert to_pennylane_mcm(_c(f.cond)) is not q
+
+
+@pytest.mark.parametrize("mcm_method", list(MCM_DEVICES))
+def test_to_pennylane_mcm_shots(mcm_method):
+  c = FTOps([
+    FTPrim(OpName.H, [0]),
+    FTMeasure(0, "m0"),
+    FTCond(lambda m: m["m0"] == 1, FTPrim(OpName.X, [1])),
+    FTMeasure(1, "m1"),
+    FTMeasure(1, "m2"),
+  ])
+  msms = to_pennylane_mcm(c, shots=200, mcm_method=mcm_method)()
+  assert all(v.shape == (200,) for v in msms.values())
+  assert (msms["m0"] == msms["m1"]).all()
+  assert (msms["m2"] == 0).all()
+  assert 50 < msms["m0"].sum() < 150
+
+
+def test_allocate_wires():
+  c = FTOps([
+    FTPrim(OpName.H, [10]),
+    FTMeasure(10, "a"),
+    FTCond(CBit("a"), FTPrim(OpName.X, [20])),
+    FTMeasure(20, "b"),
+  ])
+  wm = allocate_wires(c)
+  assert wm.peak == 1 and wm.wires == {10: 0, 20: 0}
+  msms = to_pennylane_mcm(c, shots=50)()
+  assert (msms["a"] == msms["b"]).all()
+  mapper = Surface25u(qmap={0: (list(range(13)), 13), 1: (list(range(20, 33)), 40)})
+  c2 = map_circuit(FTOps([FTInit(0, 1.0, 0), FTInit(1, 1.0, 0)]), mapper)
+  assert allocate_wires(c2).peak == 27 and len(labels(c2)) == 28
+
+
+def test_map_bitflip_two_qubits():
+  mapper = Bitflip(qmap={0: ([0, 1, 2], [3, 4]), 1: ([10, 11, 12], [13, 14])})
+  c = map_circuit(FTOps([
+    FTInit(0, 1.0, 0),
+    FTInit(1, 0, 1.0),
+    FTErr(0, 1, name=OpName.X),
+    FTErr(1, 2, name=OpName.X),
+  ]), mapper)
+  data = [0, 1, 2, 10, 11, 12]
+  assert allocate_wires(c, keep=data).peak == 7
+  probs = to_pennylane_probs(c, data)()
+  assert_allclose(probs[0b000111], 1.0, atol=1e-9)
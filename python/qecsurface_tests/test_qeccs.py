@@ -0,0 +1,165 @@
+import pytest
+import numpy as np
+from qecsurface import *
+from qecsurface.qeccs import surface25_lut, surface25u_lut_correct
+from qecsurface.stabilizer import run_expectations
+
+
+@pytest.mark.parametrize("name", [OpName.X, OpName.Z])
+def test_surface25_lut(name):
+  lut = surface25_lut(name)
+  stabs = [op for op in surface25_stabilizers() if op.name == name]
+  assert lut.shape == (64, 13)
+  assert (lut[0] == 0).all()
+  for q in range(13):
+    key = sum(1 << i for i, op in enumerate(stabs) if q in op.qubits)
+    assert list(np.flatnonzero(lut[key])) == [q]
+
+
+def test_surface25u_lut_correct():
+  data = list(range(13))
+  rng = np.random.default_rng(0)
+  shots = 1000
+  errors = rng.integers(13, size=shots)
+  msms = {}
+  for op in surface25_stabilizers():
+    ref = rng.integers(2, size=shots)
+    flip = np.isin(errors, op.qubits).astype(np.int64)
+    msms[(0, op.name, tuple(op.qubits))] = ref
+    msms[(1, op.name, tuple(op.qubits))] = ref ^ flip
+  xcorr, zcorr = surface25u_lut_correct(msms, data, 0, 1)
+  assert xcorr.shape == (shots, 13)
+  assert (xcorr == np.eye(13, dtype=np.uint8)[errors]).all()
+  assert (zcorr == np.eye(13, dtype=np.uint8)[errors]).all()
+
+
+def _checks(code, name):
+  ops = [op for op in code.stabilizers if op.name == name]
+  h = np.zeros((len(ops), code.ndata), dtype=np.uint8)
+  for i, op in enumerate(ops):
+    h[i, op.qubits] = 1
+  return h
+
+
+@pytest.mark.parametrize("d", [3, 5, 7])
+@pytest.mark.parametrize("rotated", [True, False])
+def test_surface_code(d, rotated):
+  code = surface_code(d, rotated)
+  assert code is surface_code(d, rotated)
+  assert code.ndata == (d*d if rotated else d*d + (d-1)*(d-1))
+  assert len(code.stabilizers) == code.ndata - 1
+  data, syndromes = code.qubits()
+  assert data + syndromes == list(range(2*code.ndata - 1))
+  hx, hz = _checks(code, OpName.X), _checks(code, OpName.Z)
+  assert ((hx @ hz.T) % 2 == 0).all()
+  lx = np.zeros(code.ndata, dtype=np.uint8)
+  lz = np.zeros(code.ndata, dtype=np.uint8)
+  lx[list(code.logical_x)] = 1
+  lz[list(code.logical_z)] = 1
+  assert len(code.logical_x) == len(code.logical_z) == d
+  assert ((hz @ lx) % 2 == 0).all() and ((hx @ lz) % 2 == 0).all()
+  assert (lx @ lz) % 2 == 1
+
+
+def test_surface_code_d3_wrappers():
+  code = surface_code(3, rotated=False)
+  assert [(s.name, tuple(s.qubits)) for s in surface25_stabilizers()] == \
+         [(s.name, s.qubits) for s in code.stabilizers]
+  # The cached layout is immutable
+  with pytest.raises(AttributeError):
+    code.logical_x = (0, 1, 2)
+  assert isinstance(code.stabilizers, tuple) and isinstance(code.stabilizers[0].qubits, tuple)
+  assert [code.logical_x, code.logical_z] == [(1, 6, 11), (5, 6, 7)]
+  c, ml = surface25u_detect(list(range(13)), [13], 1)
+  assert ml[3] == (1, OpName.Z, (1, 3, 4, 6))
+  _, ml = surface17u_detect(list(range(9)), [9], 0)
+  assert len(ml) == 8
+
+
+@pytest.mark.parametrize("x", [False, True])
+def test_surface25u_cnot(x):
+  p0, p1 = list(range(13)), list(range(20, 33))
+  m = Surface25u({0: (p0, 13), 1: (p1, 33)})
+  chunks = list(map_circuit_iter(FTOps([FTInit(0, 1.0, 0.0), FTInit(1, 1.0, 0.0),
+                                         *([FTPrim(OpName.X, [0])] if x else []),
+                                         FTCtrl(0, FTPrim(OpName.X, [1])),
+                                         FTErr(1, 4, OpName.X), FTErr(0, 7, OpName.Z)]), m))
+  c = FTOps([op for chunk, _ in chunks for op in chunk.ops])
+  # Both patches run their syndrome extraction in the layer of the CNOT
+  ls = chunks[2 + int(x)][1]
+  assert len(ls) == 24 and len({l[0] for l in ls}) == 1
+  assert {q for l in ls for q in l[2]} == set(p0) | set(p1)
+  code = surface_code(3, rotated=False)
+  stabs = {q:[FTPrim(s.name, [ps[i] for i in s.qubits]) for s in code.stabilizers]
+           for q, ps in ((0, p0), (1, p1))}
+  probes = [[FTPrim(OpName.Z, [ps[i] for i in code.logical_z])] for ps in (p0, p1)]
+  probes += [[s] for q in (0, 1) for s in stabs[q]]
+  for seed in range(3):
+    msms, es = run_expectations(c, p0 + [13] + p1 + [33], probes, seed)
+    assert es[:2] == ([-1, -1] if x else [1, 1])
+    # The CNOT multiplies X stabilizers of the target into the control and Z stabilizers of the
+    # control into the target
+    def _ref(q, i):
+      s = stabs[q][i]
+      return int(msms[(m._layers0[q], s.name, tuple(s.qubits))])
+    for i, s in enumerate(code.stabilizers):
+      ref0 = _ref(0, i) ^ (_ref(1, i) if s.name == OpName.X else 0)
+      ref1 = _ref(1, i) ^ (_ref(0, i) if s.name == OpName.Z else 0)
+      assert es[2 + i] == 1 - 2*ref0
+      assert es[2 + len(stabs[0]) + i] == 1 - 2*ref1
+
+
+def test_surface25u_cnot_chain():
+  p0, p1 = list(range(13)), list(range(20, 33))
+  m = Surface25u({0: (p0, 13), 1: (p1, 33)})
+  cnots = [FTCtrl(i % 2, FTPrim(OpName.X, [1 - i % 2])) for i in range(20)]
+  c = map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTInit(1, 1.0, 0.0), FTPrim(OpName.X, [0]),
+                         *cnots]), m)
+  # Reference syndromes stay flat parities of the two initial rounds
+  def _depth(e):
+    args = e.args if isinstance(e, (CAnd, COr, CXor)) else (e.a,) if isinstance(e, CNot) else ()
+    return 1 + max(map(_depth, args), default=0)
+  assert max(_depth(op.cond) for op in flatten(c).ops if isinstance(op, FTCond)) <= 6
+  assert all(len(r) <= 2 for refs in m._refs.values() for r in refs.values())
+  code = surface_code(3, rotated=False)
+  probes = [[FTPrim(OpName.Z, [ps[i] for i in code.logical_z])] for ps in (p0, p1)]
+  _, es = run_expectations(c, p0 + [13] + p1 + [33], probes, 0)
+  # The alternating CNOTs cycle |10> through |11>, |01>, |01>, |11>, |10>, |10>
+  assert es == [1, -1]
+
+
+def test_surface25u_cnot_errors():
+  m = Surface25u({0: (list(range(13)), 13)})
+  with pytest.raises(ValueError):
+    map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTCtrl(0, FTPrim(OpName.X, [1]))]), m)
+  with pytest.raises(ValueError):
+    map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTCtrl(0, FTPrim(OpName.Z, [0]))]), m)
+
+
+def test_bitflip_cnot():
+  m = Bitflip({0: ([0, 1, 2], [3, 4]), 1: ([5, 6, 7], [8, 9])})
+  c = map_circuit(FTOps([FTInit(0, 0.0, 1.0), FTInit(1, 1.0, 0.0),
+                         FTCtrl(0, FTPrim(OpName.X, [1])), FTErr(1, 2, OpName.X)]), m)
+  _, es = run_expectations(c, list(range(10)), [[FTPrim(OpName.Z, [q])] for q in range(8)], 0)
+  assert es == [-1, -1, -1, 1, 1, -1, -1, -1]
+
+
+def test_detect_template():
+  template_cache_clear()
+  code = surface_code(3, rotated=False)
+  data = list(range(13))
+  t = detect_template(code, data, [13])
+  c1, l1 = surface_code_detect(code, data, [13], 1)
+  c2, l2 = surface_code_detect(code, data, [13], 2)
+  assert template_cache_info().hits == 2 and template_cache_info().misses == 1
+  assert l1 == [(1, *l) for l in t.labels] and l2 == [(2, *l) for l in t.labels]
+  # Only the measurements are allocated per round
+  shared = [a is b for a, b in zip(c1.ops, c2.ops)]
+  assert shared == [not isinstance(op, FTMeasure) for op in c1.ops]
+  assert [op.label for op in c2.ops if isinstance(op, FTMeasure)] == l2
+  cc, ref = t.compile(2), compile_circuit(c2)
+  assert cc.labels == ref.labels and cc.kind is t.compiled.kind
+  assert all((getattr(cc, f) == getattr(ref, f)).all() for f in ["kind", "targets", "label"])
+  m = Surface25u({0: (data, 13)})
+  map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTPrim(OpName.X, [0]), FTPrim(OpName.Z, [0])]), m)
+  assert template_cache_info().misses == 1
@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+
+from qecsurface import *
+from qecsurface.qeccs import surface_code_detect
+from qecsurface.schedule import schedule, depth, split_ancilla
+from qecsurface.statevector import equivalent
+from qecsurface.stabilizer import run_stabilizer
+from qecsurface.verify import weight1_faults, fault_frames
+from qecsurface.gf2 import GF2, check_matrix, commutation, in_rowspace
+
+
+def test_schedule_commuting():
+  c = FTOps([
+    FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTCtrl(0, FTPrim(OpName.X, [2])),  # Commutes with the first CNOT
+    FTPrim(OpName.Z, [0]),             # Commutes with both controls
+    FTPrim(OpName.H, [3]),
+    FTCtrl(1, FTPrim(OpName.X, [0])),  # Does not commute with the CNOTs controlled by 0
+  ])
+  s = schedule(c)
+  assert s.preds == [[], [], [], [], [0, 1, 2]]
+  assert list(s.asap) == [0, 0, 0, 0, 1]
+  assert list(s.alap) == [0, 0, 0, 1, 1]
+  assert list(s.slack()) == [0, 0, 0, 1, 0]
+  # Operations sharing the qubit 0 are placed into different moments
+  assert list(s.moment) == [0, 1, 2, 0, 3]
+  assert s.depth == 4 and s.critical_path() == [0, 4]
+  for layer in s.layers():
+    qs = [q for op in layer.ops for q in labels(FTOps([op]))]
+    assert len(qs) == len(set(qs))
+  assert equivalent(c, s.to_circuit())
+
+
+def test_schedule_cond():
+  l = (0, OpName.Z, (0,))
+  c = FTOps([FTMeasure(0, l), FTPrim(OpName.H, [1]), FTCond(CBit(l), FTPrim(OpName.X, [2]))])
+  assert schedule(c).preds == [[], [], [0]]
+
+
+@pytest.mark.parametrize("rotated", [True, False])
+def test_schedule_surface_detect(rotated):
+  code = surface_code(3, rotated)
+  data, ancillas = code.qubits()
+  c0 = FTComp(surface_code_detect(code, data, ancillas[:1], 0)[0],
+              surface_code_detect(code, data, ancillas[:1], 1)[0])
+  c1 = split_ancilla(c0, ancillas[0], ancillas)
+  assert depth(c1) < depth(c0) // 4
+  c2 = FTComp(surface_code_detect(code, data, ancillas, 0, hook_safe=True)[0],
+              surface_code_detect(code, data, ancillas, 1, hook_safe=True)[0])
+  for c in [c1, c2]:
+    msms = run_stabilizer(schedule(c).to_circuit(), seed=1)
+    # Repeated noiseless syndrome measurements agree
+    assert all(msms[(0, *l[1:])] == msms[l] for l in msms if l[0] == 1)
+
+
+@pytest.mark.parametrize("hook_safe", [False, True])
+def test_hook_order(hook_safe):
+  code = surface_code(3, rotated=True)
+  n = code.ndata
+  ancillas = list(range(n, n + len(code.stabilizers)))
+  c, _ = surface_code_detect(code, list(range(n)), ancillas, hook_safe=hook_safe)
+  cc = compile_circuit(c)
+  faults = weight1_faults(cc, qubits=ancillas)
+  _, x, z = fault_frames(cc, faults)
+  h, _ = check_matrix(code.stabilizers, list(range(n)))
+  # Residual errors which become logical operators after one more data error
+  e = np.concatenate([x[:, :n], z[:, :n]], axis=1)
+  v = GF2.from_dense((e[:, None, :] ^ np.eye(2*n, dtype=np.uint8)[None]).reshape(-1, 2*n))
+  logical = ~commutation(v, h).any(axis=1) & ~in_rowspace(h, v)
+  assert logical.any() != hook_safe
@@ -0,0 +1,65 @@
+import pytest
+from qecsurface import *
+from qecsurface.stabilizer import *
+from qecsurface.qeccs import (
+  surface25u_detect, surface25u_print2, surface25u_correct, surface25_stabilizers
+)
+
+
+def test_stabilizer_bell():
+  c = FTOps([
+    FTPrim(OpName.H, [0]),
+    FTCtrl(0, FTPrim(OpName.X, [1])),
+    FTMeasure(0, "m0"),
+    FTMeasure(1, "m1"),
+  ])
+  for seed in range(10):
+    msms = run_stabilizer(c, seed)
+    assert msms["m0"] == msms["m1"]
+
+
+def test_stabilizer_cond():
+  c = FTOps([
+    FTPrim(OpName.X, [0]),
+    FTMeasure(0, "m0"),
+    FTCond(lambda m: m["m0"] == 1, FTPrim(OpName.X, [1])),
+    FTMeasure(0, "m1"),
+    FTMeasure(1, "m2"),
+  ])
+  assert run_stabilizer(c) == {"m0": 1, "m1": 0, "m2": 1}
+
+
+def test_stabilizer_init():
+  sim = StabilizerSim([0, 1])
+  sim.run(FTOps([FTInit(0, 1/2, 1/2), FTInit(1, 0, 1)]))
+  assert sim.expectation([FTPrim(OpName.X, [0])]) == 1
+  assert sim.expectation([FTPrim(OpName.Z, [0])]) == 0
+  assert sim.expectation([FTPrim(OpName.Z, [1])]) == -1
+
+
+@pytest.mark.parametrize("error_qubit", list(range(13)))
+@pytest.mark.parametrize("error_op", [OpName.H, OpName.X, OpName.Z])
+def test_stabilizer_surface25u_correct(error_qubit, error_op):
+  data, syndrome = list(range(13)), [13]
+  c1,ml1 = surface25u_detect(data, syndrome, 0)
+  err = FTOps([FTPrim(error_op,[error_qubit])])
+  c2,ml2 = surface25u_detect(data, syndrome, 1)
+  corr = surface25u_correct(data, 0, 1)
+  c3,ml3 = surface25u_detect(data, syndrome, 2)
+  msms = run_stabilizer(reduce(FTComp,[c1,err,c2,corr,c3]), seed=error_qubit)
+  expected = surface25u_print2(msms, ml1)
+  assert all(e not in expected for e in "XZ")
+  assert any(e in surface25u_print2(msms, ml2) for e in "XZ")
+  assert surface25u_print2(msms, ml3) == expected
+
+
+def test_stabilizer_large():
+  # Two hundred qubits in a GHZ state
+  n = 200
+  c = FTOps([
+    FTPrim(OpName.H, [0]),
+    *[FTCtrl(i, FTPrim(OpName.X, [i+1])) for i in range(n-1)],
+    *[FTMeasure(i, i) for i in range(n)],
+  ])
+  msms = run_stabilizer(c, seed=1)
+  assert len(set(msms.values())) == 1
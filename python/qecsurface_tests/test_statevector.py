@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_allclose
+from sympy import Rational
+
+from qecsurface import *
+from qecsurface.statevector import to_statevector, to_unitary, equivalent
+
+
+def _ghz(n:int, cz:bool) -> FTCircuit[int]:
+  """ GHZ encoder built from CNOTs or from CZs conjugated by Hadamards. """
+  ops = [FTPrim(OpName.H, [0])]
+  for i in range(1, n):
+    if cz:
+      ops += [FTPrim(OpName.H, [i]), FTCtrl(0, FTPrim(OpName.Z, [i])), FTPrim(OpName.H, [i])]
+    else:
+      ops += [FTCtrl(0, FTPrim(OpName.X, [i]))]
+  return FTOps(ops)
+
+
+@pytest.mark.parametrize("c", [
+  FTOps([FTPrim(OpName.X, [1,2])]),
+  FTOps([FTPrim(OpName.H, [0,2])]),
+  FTOps([FTPrim(OpName.Z, [0,1,3])]),
+  FTOps([FTPrim(OpName.H, [0]), FTPrim(OpName.Z, [0]), FTCtrl(0, FTPrim(OpName.X, [1])),
+         FTPrim(OpName.H, [1])]),
+])
+def test_to_unitary_sympy(c):
+  u = to_unitary(c, symbolic=True)
+  assert_allclose(np.array(u.evalf().tolist(), dtype=np.complex128), to_unitary(c), atol=1e-12)
+  if len(c.ops) > 1:
+    # H then Z prepare |->, the CNOT and the final H give (|00> + |01> - |10> + |11>) / 2
+    assert list(u[:, 0]) == [Rational(1, 2), Rational(1, 2), -Rational(1, 2), Rational(1, 2)]
+  qs = [3, 2, 1, 0]
+  u = to_unitary(c, qubits=qs, symbolic=True)
+  assert_allclose(np.array(u.evalf().tolist(), dtype=np.complex128), to_unitary(c, qs), atol=1e-12)
+
+
+def test_to_unitary_ctrl():
+  u = to_unitary(FTOps([FTCtrl(0, FTPrim(OpName.X, [1]))]))
+  assert_allclose(u, [[1,0,0,0],[0,1,0,0],[0,0,0,1],[0,0,1,0]])
+  u = to_unitary(FTOps([FTCtrl(1, FTPrim(OpName.Z, [0]))]))
+  assert_allclose(u, np.diag([1,1,1,-1]))
+  # Operations are composed in the order of application
+  u = to_unitary(FTOps([FTPrim(OpName.H, [0]), FTCtrl(0, FTPrim(OpName.X, [1]))]))
+  assert_allclose(u @ [1,0,0,0], np.array([1,0,0,1]) / np.sqrt(2), atol=1e-12)
+
+
+def test_to_statevector():
+  psi = to_statevector(bitflip_encode(0, [0,1,2]), psi0=np.kron([0.6, 0.8], [1,0,0,0]))
+  assert_allclose(psi, 0.6*np.eye(8)[0] + 0.8*np.eye(8)[7], atol=1e-12)
+  with pytest.raises(ValueError):
+    to_statevector(FTOps([FTInit(0, 1.0, 0.0)]))
+
+
+@pytest.mark.parametrize("n", [3, 14, 20])
+def test_equivalent(n):
+  assert equivalent(_ghz(n, cz=True), _ghz(n, cz=False))
+  assert equivalent(FTComp(FTOps([FTPrim(OpName.H, [0])]), bitflip_encode(0, [0,1,2])),
+                    _ghz(3, cz=True))
+  broken = FTComp(_ghz(n, cz=False), FTOps([FTPrim(OpName.Z, [n-1])]))
+  assert not equivalent(_ghz(n, cz=True), broken)
+  # Global phases are ignored
+  assert equivalent(FTOps([FTPrim(OpName.X, [0]), FTPrim(OpName.Z, [0])]),
+                    FTOps([FTPrim(OpName.Z, [0]), FTPrim(OpName.X, [0])]))
@@ -0,0 +1,38 @@
+import numpy as np
+from qecsurface import *
+from qecsurface.frame import sample_frames
+from qecsurface.decode import syndrome_array
+from qecsurface.noise import uniform_noise
+from qecsurface.store import *
+
+
+def test_store_roundtrip(tmp_path):
+  code = surface_code(3)
+  data, syndromes = code.qubits()
+  c0, ml0 = surface_code_detect(code, data, syndromes, 0)
+  c1, ml1 = surface_code_detect(code, data, syndromes, 1)
+  cc = uniform_noise(0.01).annotate(FTComp(c0, c1))
+  path = tmp_path / "samples.b8"
+  with SamplesWriter(path, cc.labels) as w:
+    assert load_samples(path).shots == 0
+    s1 = sample_frames(cc, 100, seed=0)
+    s2 = sample_frames(cc, 50, seed=1)
+    w.write(s1)
+    w.write(s2.packed)
+    # Readers could map the file while it grows
+    assert load_samples(path).shots == 150
+  s = load_samples(path)
+  assert s.labels == list(cc.labels) and isinstance(s.labels[0][1], OpName)
+  assert (s.packed == np.concatenate([s1.packed, s2.packed])).all()
+  chunks = list(iter_samples(path, chunk=64))
+  assert [c.shots for c in chunks] == [64, 64, 22]
+  synd = np.concatenate([syndrome_array(c.msms(), [ml0, ml1], OpName.Z) for c in chunks])
+  assert (synd == syndrome_array(s.msms(), [ml0, ml1], OpName.Z)).all()
+
+
+def test_sample_to_file(tmp_path):
+  c = FTOps([FTPrim(OpName.H, [0]), FTMeasure(0, "a"), FTMeasure(0, "b")])
+  assert sample_to_file(c, 1000, tmp_path / "s.b8", seed=0, batch=300) == 1000
+  s = load_samples(tmp_path / "s.b8")
+  assert 400 < s.column("a").sum() < 600
+  assert s.column("b").sum() == 0
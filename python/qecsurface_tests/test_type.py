@@ -0,0 +1,154 @@
+import pytest
+import numpy as np
+from qecsurface import *
+
+
+def _deep_circuit(n):
+  c = FTOps([])
+  for i in range(n):
+    c = FTComp(c, FTOps([FTPrim(OpName.X, [i % 7])]))
+  return c
+
+
+def test_flatten():
+  c = FTComp(
+    FTOps([FTPrim(OpName.X, [0])]),
+    FTComp(FTOps([]), FTOps([FTPrim(OpName.Z, [1]), FTMeasure(1, "m")]))
+  )
+  assert flatten(c) == FTOps([FTPrim(OpName.X, [0]), FTPrim(OpName.Z, [1]), FTMeasure(1, "m")])
+
+
+def test_deep_circuit():
+  n = 200000
+  c = _deep_circuit(n)
+  assert len(flatten(c).ops) == n
+  assert labels(c) == set(range(7))
+
+
+def test_map_deep_circuit():
+  n = 20000
+  c = map_circuit(_deep_circuit(n), Bitflip(qmap={q: ([3*q, 3*q+1, 3*q+2], [21, 22])
+                                                  for q in range(7)}))
+  assert labels(c) == set(range(23))
+  assert sum(isinstance(op, FTMeasure) for op in iter_ops(c)) == 2*n
+
+
+def test_compile_circuit():
+  cond = lambda m: m["m"] == 1
+  c = FTComp(
+    FTOps([
+      FTInit(0, 1/2, 1/2),
+      FTPrim(OpName.H, [0, 2]),
+      FTCtrl(0, FTPrim(OpName.X, [1, 2])),
+      FTMeasure(1, "m"),
+      FTErr(0, 3, OpName.Z),
+    ]),
+    FTOps([FTCond(cond, FTPrim(OpName.X, [2])), FTMeasure(2, (1, OpName.Z, (2,)))])
+  )
+  cc = compile_circuit(c)
+  assert len(cc) == 7
+  assert cc.qubits == [0, 1, 2]
+  assert cc.labels == ["m", (1, OpName.Z, (2,))]
+  assert list(cc.kind) == [OpKind.INIT, OpKind.PRIM, OpKind.CTRL, OpKind.MEASURE, OpKind.ERR,
+                           OpKind.PRIM, OpKind.MEASURE]
+  assert list(cc.row_targets(2)) == [1, 2]
+  assert list(cc.cond) == [-1, -1, -1, -1, -1, 0, -1]
+  assert decompile_circuit(cc) == flatten(c)
+
+
+def test_circuit_key():
+  def _cond(k):
+    return lambda m: m["a"] == k
+  c1 = FTComp(FTOps([FTMeasure(0, "a")]), FTOps([FTCond(_cond(1), FTPrim(OpName.X, [1]))]))
+  c2 = FTOps([FTMeasure(0, "a"), FTCond(_cond(1), FTPrim(OpName.X, [1]))])
+  c3 = FTOps([FTMeasure(0, "a"), FTCond(_cond(0), FTPrim(OpName.X, [1]))])
+  assert circuit_key(c1) == circuit_key(c2)
+  assert circuit_key(c1) != circuit_key(c3)
+  sub = FTOps([])
+  c4 = FTOps([FTCond(lambda m: sub is None, FTPrim(OpName.X, [1]))])
+  with pytest.raises(Unhashable):
+    circuit_key(c4)
+
+
+class _Threshold:
+  def __init__(self, k):
+    self.k = k
+
+  def cond(self, m):
+    return m["a"] == self.k
+
+
+_MUTABLE = [1]
+_CONST = 1
+
+
+def _reads_const(m):
+  return m["a"] == _CONST
+
+
+def test_circuit_key_methods_and_globals():
+  def _c(cond):
+    return FTOps([FTMeasure(0, "a"), FTCond(cond, FTPrim(OpName.X, [1]))])
+  # Bound methods are keyed by their instances
+  a, b = _Threshold(0), _Threshold(1)
+  assert circuit_key(_c(a.cond)) == circuit_key(_c(a.cond))
+  assert circuit_key(_c(a.cond)) != circuit_key(_c(b.cond))
+  assert circuit_key(_c(a.cond)) == circuit_key(_c(_Threshold(0).cond))
+  # Mutating the instance changes the key
+  k = circuit_key(_c(a.cond))
+  a.k = 1
+  assert circuit_key(_c(a.cond)) != k
+  # Immutable globals are keyed by value, mutable ones make the circuit unhashable
+  global _CONST
+  k1 = circuit_key(_c(_reads_const))
+  assert circuit_key(_c(_reads_const)) == k1
+  _CONST = 0
+  try:
+    assert circuit_key(_c(_reads_const)) != k1
+  finally:
+    _CONST = 1
+  with pytest.raises(Unhashable):
+    circuit_key(_c(lambda m: m["a"] in _MUTABLE))
+
+
+def test_lru_cache():
+  c = LRUCache(maxsize=2)
+  assert c.get(1, lambda: "a") == "a"
+  assert c.get(2, lambda: "b") == "b"
+  assert c.get(1, lambda: "x") == "a"
+  c.get(3, lambda: "c")
+  assert c.get(2, lambda: "y") == "y"
+  assert c.info() == CacheInfo(hits=1, misses=4, maxsize=2, currsize=2)
+
+
+def test_cexpr_eval():
+  a, b, c = CBit("a"), CBit("b"), CBit("c")
+  e = (a & ~b) | CEq(parity(["a", "b", "c"]), CConst(1))
+  assert cexpr_labels(e) == {"a", "b", "c"}
+  assert hash(e) == hash((a & ~b) | CEq(parity(["a", "b", "c"]), CConst(1)))
+  bits = np.array([[(i >> j) & 1 for j in range(3)] for i in range(8)], dtype=np.uint8)
+  msms = dict(zip("abc", bits.T))
+  expected = [(x & (1-y)) | ((x ^ y ^ z) == 1) for x, y, z in bits]
+  assert [bool(e({"a": x, "b": y, "c": z})) for x, y, z in bits] == expected
+  assert list(np.asarray(e(msms), dtype=bool)) == expected
+  words = {l: np.packbits(v, bitorder='little').astype(np.uint64) for l, v in msms.items()}
+  packed = cexpr_eval_packed(e, words)
+  assert list(np.unpackbits(packed.astype(np.uint8), count=8, bitorder='little')) == expected
+
+
+def test_map_circuit_iter():
+  from qecsurface.stabilizer import StabilizerSim
+  data = list(range(13))
+  src = FTOps([FTInit(0, 1.0, 0.0), FTErr(0, 4, OpName.X), FTPrim(OpName.X, [0])])
+  m = Surface25u({0: (data, 13)})
+  it = map_circuit_iter(src, m)
+  chunk, ls = next(it)
+  assert m._layer == 1 and ls == surface25u_detect(data, [13], 0)[1]
+  sim = StabilizerSim(data + [13], seed=0)
+  sim.run(chunk)
+  for layer, (chunk, ls) in enumerate(it, start=1):
+    assert ls == surface25u_detect(data, [13], layer)[1]
+    sim.run(chunk)
+  ref = StabilizerSim(data + [13], seed=0)
+  ref.run(map_circuit(src, Surface25u({0: (data, 13)})))
+  assert sim.msms == ref.msms and m._layer == 3
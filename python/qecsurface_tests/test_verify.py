@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+
+from qecsurface import *
+from qecsurface.stabilizer import run_stabilizer
+from qecsurface.verify import (PauliString, PauliLost, Fault, propagate, check_pauli,
+                               check_stabilizers, weight1_faults, fault_frames,
+                               uncorrected_faults)
+
+
+def _surface25u():
+  data, syndrome = list(range(13)), 13
+  m = Surface25u({0: (data, syndrome)})
+  init = map_circuit(FTOps([FTInit(0, 1.0, 0.0)]), m)
+  block = map_circuit(FTOps([FTPrim(OpName.X, [0])]), m)
+  return data, init, block
+
+
+def test_propagate_clifford():
+  qubits = [0, 1]
+  c = FTOps([FTPrim(OpName.H, [0]), FTCtrl(0, FTPrim(OpName.X, [1]))])
+  # Z0 -> X0 X1 and Z1 -> Z0 Z1 under the Bell circuit
+  p = propagate(c, PauliString.from_prims([FTPrim(OpName.Z, [0])], qubits))
+  assert list(p.x) == [1, 1] and list(p.z) == [0, 0] and p.sign == 0
+  p = propagate(c, PauliString.from_prims([FTPrim(OpName.Z, [1])], qubits))
+  assert list(p.x) == [0, 0] and list(p.z) == [1, 1] and p.sign == 0
+  # X conjugates Z into -Z
+  p = propagate(FTOps([FTPrim(OpName.X, [0])]), PauliString.from_prims([FTPrim(OpName.Z, [0])],
+                                                                        qubits))
+  assert p.sign == 1
+  with pytest.raises(PauliLost):
+    propagate(FTOps([FTMeasure(0, (0, OpName.Z, (0,)))]),
+              PauliString.from_prims([FTPrim(OpName.X, [0])], qubits))
+  # Malformed circuits are errors rather than failed checks
+  z = [FTPrim(OpName.Z, [0])]
+  assert not check_pauli(FTOps([FTInit(0, 1.0, 0.0)]), z, z, {}, qubits)
+  with pytest.raises(ValueError):
+    check_pauli(FTOps([FTErr(0, 0, OpName.X)]), z, z, {}, qubits)
+  with pytest.raises(KeyError):
+    check_pauli(FTOps([FTPrim(OpName.X, [2])]), z, z, {}, qubits)
+
+
+def test_surface25u_logical_x():
+  data, init, block = _surface25u()
+  qubits = sorted(labels(FTComp(init, block)))
+  msms = run_stabilizer(FTComp(init, block), seed=3)
+  code = surface_code(3, rotated=False)
+  assert all(check_stabilizers(block, code.stabilizers, msms, qubits))
+  lx, lz = FTPrim(OpName.X, code.logical_x), FTPrim(OpName.Z, code.logical_z)
+  assert check_pauli(block, [lx], [lx], msms, qubits)
+  assert check_pauli(block, [lz], [lz], msms, qubits, sign=1)
+  assert not check_pauli(block, [lz], [lz], msms, qubits)
+
+
+def test_surface25u_weight1_faults():
+  data, init, block = _surface25u()
+  cc = compile_circuit(FTComp(init, block))
+  stabs = surface_code(3, rotated=False).stabilizers
+  # Every data fault right after the logical X is corrected by the following cycle
+  row = len(compile_circuit(init))
+  faults = weight1_faults(cc, rows=[row], qubits=data)
+  assert len(faults) == 3*3
+  faults = [Fault(row, q, s) for q in data for s in 'XYZ']
+  assert uncorrected_faults(cc, faults, stabs, data) == []
+  # Faults after the last correction stay uncorrected
+  last = [Fault(len(cc)-1, f.qubit, f.pauli) for f in faults]
+  assert len(uncorrected_faults(cc, last, stabs, data)) == len(last)
+
+
+def test_bitflip_weight1_faults():
+  data, syndromes = [0, 1, 2], [3, 4]
+  m = Bitflip({0: (data, syndromes)})
+  c = map_circuit(FTOps([FTInit(0, 1.0, 0.0), FTPrim(OpName.X, [0])]), m)
+  cc = compile_circuit(c)
+  row = next(i for i in range(len(cc)) if cc.kind[i] == OpKind.PRIM)
+  faults = [f for f in weight1_faults(cc) if f.row == row]
+  bad = uncorrected_faults(cc, faults, [FTPrim(OpName.Z, [0, 1]), FTPrim(OpName.Z, [1, 2])], data)
+  # Bit flips are corrected, phase flips are not
+  assert {f.pauli for f in bad} == {'Y', 'Z'}
+  flips, x, z = fault_frames(cc, faults)
+  assert flips.shape == (len(faults), len(cc.labels))
+  assert flips[[f.pauli == 'X' for f in faults]].any(axis=1).all()